@@ -0,0 +1,66 @@
+"""
+LangChain callback handlers of the agent, kept apart from the Telegram side so it can start without LangChain.
+"""
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+from context_window import count_tokens
+from rate_limiter import RATE_LIMIT_COMPLETION_TOKENS, get_rate_limiter
+
+class FinalAnswerQueueCallbackHandler(AsyncCallbackHandler):
+    """Push the tokens of the agent's final answer into an asyncio queue."""
+
+    def __init__(self, queue, answer_prefix="AI:"):
+        self.queue = queue
+        self.answer_prefix = answer_prefix
+        self.buffer = ""
+        self.answer_reached = False
+
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        # Every agent step is a new llm call, only the last one carries the answer
+        self.buffer = ""
+        self.answer_reached = False
+
+    async def on_llm_new_token(self, token, **kwargs):
+        if self.answer_reached:
+            await self.queue.put(token)
+            return
+
+        # Wait for the answer prefix, then forward whatever follows it
+        self.buffer += token
+        index = self.buffer.find(self.answer_prefix)
+        if index >= 0:
+            self.answer_reached = True
+            rest = self.buffer[index + len(self.answer_prefix):].lstrip()
+            if rest:
+                await self.queue.put(rest)
+
+
+class ToolUsageCallbackHandler(AsyncCallbackHandler):
+    """Record the names of the tools the agent called while producing an answer."""
+
+    def __init__(self):
+        self.tools = set()
+
+    async def on_tool_start(self, serialized, input_str, **kwargs):
+        self.tools.add(serialized.get("name"))
+
+
+class RateLimitCallbackHandler(AsyncCallbackHandler):
+    """
+    Hold every call of an LLM until the shared limiter grants the model's request and token quota
+    and an in-flight slot, which the run holds until it ends.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        tokens = sum(count_tokens(prompt) for prompt in prompts) + RATE_LIMIT_COMPLETION_TOKENS
+        await get_rate_limiter().acquire(self.model, tokens, lease=run_id)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        get_rate_limiter().release(self.model, run_id)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        get_rate_limiter().release(self.model, run_id)
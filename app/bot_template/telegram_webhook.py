@@ -1,17 +1,19 @@
 from app.core.webhook_handler import BaseWebhookHandler
-from telegram import Update, Bot
-from telegram.ext import Dispatcher
+from telegram import Update
+from telegram.ext import Application
 
 
 class TelegramWebhookHandler(BaseWebhookHandler):
 
-    def __init__(self, token: str):
-        self.bot = Bot(token)
-        self.dispatcher = Dispatcher(self.bot, None, workers=0)
+    def __init__(self, application: Application, secret_token: str = None):
+        self.application = application
+        self.bot = application.bot
+        self.secret_token = secret_token
 
     async def set_webhook(self, webhook_url: str) -> None:
-        await self.bot.set_webhook(url=webhook_url)
+        await self.bot.set_webhook(url=webhook_url, secret_token=self.secret_token)
 
     async def handle_update(self, update: dict) -> None:
+        # The application's update processor picks it up, so the request returns right away
         tg_update = Update.de_json(update, self.bot)
-        self.dispatcher.process_update(tg_update)
+        await self.application.update_queue.put(tg_update)
@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+import logging
+from typing import List
+
+import httpx
+
+from whatsapp_wrapper import (WhatsAppWrapper, WhatsAppAPIError, text_payload, menu_payload, buttons_payload,
+                              image_payload, audio_payload, video_payload, document_payload)
+
+# Cloud API throughput per business phone number, and connection pool settings
+WHATSAPP_MESSAGES_PER_SECOND = float(os.environ.get("WHATSAPP_MESSAGES_PER_SECOND", 80))
+WHATSAPP_MAX_CONNECTIONS = int(os.environ.get("WHATSAPP_MAX_CONNECTIONS", 20))
+WHATSAPP_SEND_WORKERS = int(os.environ.get("WHATSAPP_SEND_WORKERS", 10))
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket allowing rate requests per second with bursts up to capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncWhatsAppWrapper:
+    """An async wrapper for the WhatsApp Cloud API sharing one keep-alive connection pool."""
+
+    API_URL = WhatsAppWrapper.API_URL
+    API_TOKEN = WhatsAppWrapper.API_TOKEN
+    NUMBER_ID = WhatsAppWrapper.NUMBER_ID
+
+    def __init__(self, api_token: str = None, number_id: str = None,
+                 max_connections: int = WHATSAPP_MAX_CONNECTIONS,
+                 messages_per_second: float = WHATSAPP_MESSAGES_PER_SECOND):
+        if api_token:
+            self.API_TOKEN = api_token
+        if number_id:
+            self.NUMBER_ID = number_id
+        self.API_URL = f"{self.API_URL}{self.NUMBER_ID}/messages"
+        self.headers = {
+            "Authorization": f"Bearer {self.API_TOKEN}",
+            "Content-Type": "application/json"
+        }
+
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(30.0))
+
+        # Stay under the API's throughput for this phone number
+        self.bucket = TokenBucket(messages_per_second)
+
+    def __repr__(self):
+        return f"<AsyncWhatsAppWrapper NUMBER_ID={self.NUMBER_ID}>"
+
+    async def _post(self, data: dict, what: str) -> int:
+        """Sends a request body to the messages endpoint."""
+        await self.bucket.acquire()
+        try:
+            response = await self.client.post(self.API_URL, json=data)
+            response.raise_for_status()
+        except httpx.HTTPError as err:
+            raise WhatsAppAPIError(f"Error sending {what}: {err}") from err
+        return response.status_code
+
+    async def send_message(self, message: str, phone_number: str) -> int:
+        """Sends a text message to a WhatsApp number."""
+        return await self._post(text_payload(phone_number, message), "message")
+
+    async def send_menu(self, phone_number: str, title: str, options: List[str]) -> int:
+        """Sends a menu with options to a WhatsApp number."""
+        return await self._post(menu_payload(phone_number, title, options), "menu")
+
+    async def send_buttons(self, phone_number: str, button_text: str, button_titles: List[str]) -> int:
+        """Sends buttons with reply actions to a WhatsApp number."""
+        return await self._post(buttons_payload(phone_number, button_text, button_titles), "buttons")
+
+    async def send_image(self, phone_number: str, image_url: str, caption: str = None) -> int:
+        """Sends an image to a WhatsApp number."""
+        return await self._post(image_payload(phone_number, image_url, caption), "image")
+
+    async def send_audio(self, phone_number: str, audio_url: str) -> int:
+        """Sends an audio message to a WhatsApp number."""
+        return await self._post(audio_payload(phone_number, audio_url), "audio")
+
+    async def send_video(self, phone_number: str, video_url: str, caption: str = None) -> int:
+        """Sends a video to a WhatsApp number."""
+        return await self._post(video_payload(phone_number, video_url, caption), "video")
+
+    async def send_document(self, phone_number: str, document_url: str, file_name: str) -> int:
+        """Sends a document to a WhatsApp number."""
+        return await self._post(document_payload(phone_number, document_url, file_name), "document")
+
+    async def aclose(self) -> None:
+        """Closes the connection pool."""
+        await self.client.aclose()
+
+
+class OutboundQueue:
+    """Queue of outbound sends drained by a fixed number of workers through one client."""
+
+    def __init__(self, client: AsyncWhatsAppWrapper, workers: int = WHATSAPP_SEND_WORKERS):
+        self.client = client
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self._tasks = []
+
+    def enqueue(self, method: str, *args, **kwargs) -> asyncio.Future:
+        """Queues a call of one of the client's send methods and returns a future of its result."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        future = asyncio.get_running_loop().create_future()
+        # Errors are logged by the worker, callers that do not await the future are not warned again
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.queue.put_nowait((getattr(self.client, method), args, kwargs, future))
+        return future
+
+    async def _worker(self) -> None:
+        while True:
+            send, args, kwargs, future = await self.queue.get()
+            try:
+                result = await send(*args, **kwargs)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error sending WhatsApp message: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def close(self) -> None:
+        """Waits for the queued sends, then stops the workers and closes the client."""
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.client.aclose()
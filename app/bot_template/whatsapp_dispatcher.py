@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Union
+
+from cachetools import TTLCache
+
+from whatsapp_messages import WhatsAppMessage, parse_webhook
+
+# Dispatcher defaults
+WHATSAPP_WEBHOOK_WORKERS = int(os.environ.get("WHATSAPP_WEBHOOK_WORKERS", 8))
+WHATSAPP_WEBHOOK_QUEUE_SIZE = int(os.environ.get("WHATSAPP_WEBHOOK_QUEUE_SIZE", 10000))
+WHATSAPP_DEDUP_TTL = int(os.environ.get("WHATSAPP_DEDUP_TTL", 24 * 3600))
+WHATSAPP_DEDUP_SIZE = int(os.environ.get("WHATSAPP_DEDUP_SIZE", 100000))
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDispatcher:
+    """
+    Processes raw webhook payloads on a pool of async workers.
+
+    Messages from the same sender always go to the same worker, so they are handled in order,
+    and messages whose id was already seen are dropped.
+    """
+
+    def __init__(self, handler: Callable[[WhatsAppMessage], Awaitable[None]],
+                 workers: int = WHATSAPP_WEBHOOK_WORKERS,
+                 queue_size: int = WHATSAPP_WEBHOOK_QUEUE_SIZE,
+                 dedup_ttl: int = WHATSAPP_DEDUP_TTL,
+                 dedup_size: int = WHATSAPP_DEDUP_SIZE):
+        self.handler = handler
+        self.workers = workers
+        self.payloads = asyncio.Queue(maxsize=queue_size)
+        self.queues = [asyncio.Queue() for _ in range(workers)]
+        self.seen = TTLCache(maxsize=dedup_size, ttl=dedup_ttl)
+        self._tasks = []
+
+        self.received = 0
+        self.processed = 0
+        self.duplicates = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Starts the workers on the running event loop."""
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._split()))
+        self._tasks.extend(asyncio.create_task(self._work(queue)) for queue in self.queues)
+
+    def submit(self, payload: Union[bytes, dict]) -> None:
+        """Queues a raw payload, raises asyncio.QueueFull when the dispatcher is overloaded."""
+        self.payloads.put_nowait((payload, time.monotonic()))
+        self.received += 1
+
+    async def _split(self) -> None:
+        """Parses the payloads and routes each new message to its sender's worker."""
+        while True:
+            payload, received_at = await self.payloads.get()
+            try:
+                if isinstance(payload, (bytes, str)):
+                    payload = json.loads(payload)
+                logger.debug(f"Received webhook data: {payload}")
+
+                for message in parse_webhook(payload):
+                    # Delivery statuses need no processing
+                    if not isinstance(message, WhatsAppMessage):
+                        continue
+                    if message.message_id in self.seen:
+                        self.duplicates += 1
+                        continue
+                    # Marked before it is handled, so a redelivery arriving meanwhile is dropped too
+                    self.seen[message.message_id] = True
+                    queue = self.queues[hash(message.sender_phone) % self.workers]
+                    queue.put_nowait((message, received_at))
+            except Exception as e:
+                logger.error(f"Error parsing webhook payload: {e}")
+            finally:
+                self.payloads.task_done()
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            message, received_at = await queue.get()
+            try:
+                await self.handler(message)
+                self.processed += 1
+                logger.debug(f"Processed message {message.message_id} in {time.monotonic() - received_at:.3f}s")
+            except Exception as e:
+                self.failed += 1
+                # Let WhatsApp's redelivery of the message be processed again
+                self.seen.pop(message.message_id, None)
+                logger.error(f"Error processing message {message.message_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def stop(self) -> None:
+        """Processes what is already queued, then stops the workers."""
+        await self.payloads.join()
+        for queue in self.queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        """Returns the dispatcher counters."""
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "pending": self.payloads.qsize() + sum(queue.qsize() for queue in self.queues),
+        }
@@ -0,0 +1,148 @@
+from typing import Iterator, Optional
+
+MEDIA_TYPES = frozenset(("image", "audio", "video", "document", "sticker", "file"))
+
+
+class WhatsAppMessage:
+    """Fields common to every incoming message."""
+
+    __slots__ = ("type", "message_id", "timestamp", "sender_phone", "phone_number", "name", "context_id")
+
+    def __init__(self, type: str, message_id: str, timestamp: str, sender_phone: str,
+                 phone_number: str, name: Optional[str], context_id: Optional[str]):
+        self.type = type
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.sender_phone = sender_phone
+        self.phone_number = phone_number
+        self.name = name
+        self.context_id = context_id
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.message_id} from {self.sender_phone}>"
+
+
+class TextMessage(WhatsAppMessage):
+    __slots__ = ("text",)
+
+    def __init__(self, message_id, timestamp, sender_phone, name, context_id, text):
+        self.type = "text"
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.sender_phone = self.phone_number = sender_phone
+        self.name = name
+        self.context_id = context_id
+        self.text = text
+
+
+class MediaMessage(WhatsAppMessage):
+    __slots__ = ("media_id", "mime_type", "caption")
+
+    def __init__(self, type, message_id, timestamp, sender_phone, name, context_id, media):
+        self.type = type
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.sender_phone = self.phone_number = sender_phone
+        self.name = name
+        self.context_id = context_id
+        self.media_id = media.get("id")
+        self.mime_type = media.get("mime_type")
+        self.caption = media.get("caption")
+
+
+class ButtonMessage(WhatsAppMessage):
+    __slots__ = ("button_text", "button_payload")
+
+    def __init__(self, message_id, timestamp, sender_phone, name, context_id, button):
+        self.type = "button"
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.sender_phone = self.phone_number = sender_phone
+        self.name = name
+        self.context_id = context_id
+        self.button_text = button.get("text")
+        self.button_payload = button.get("payload")
+
+
+class InteractiveReply(WhatsAppMessage):
+    """A reply to a button or list message, interactive_type is button_reply or list_reply."""
+
+    __slots__ = ("interactive_type", "reply_id", "reply_title")
+
+    def __init__(self, message_id, timestamp, sender_phone, name, context_id, interactive):
+        self.type = "interactive"
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.sender_phone = self.phone_number = sender_phone
+        self.name = name
+        self.context_id = context_id
+        self.interactive_type = interactive_type = interactive.get("type")
+        reply = interactive.get(interactive_type) or {}
+        self.reply_id = reply.get("id")
+        self.reply_title = reply.get("title")
+
+
+class StatusUpdate:
+    """Delivery status callback of a message sent by the bot."""
+
+    __slots__ = ("message_id", "status", "timestamp", "recipient_id")
+
+    def __init__(self, message_id: str, status: str, timestamp: str, recipient_id: str):
+        self.message_id = message_id
+        self.status = status
+        self.timestamp = timestamp
+        self.recipient_id = recipient_id
+
+    def __repr__(self):
+        return f"<StatusUpdate {self.message_id} {self.status}>"
+
+
+def parse_webhook(payload: dict) -> Iterator[object]:
+    """
+    Yields a typed message or status update for everything in a webhook payload, in a single pass.
+
+    Batched payloads with several entries and changes are supported. Messages of other types
+    are yielded as plain WhatsAppMessage instances.
+    """
+    for entry in payload.get("entry", ()):
+        for change in entry.get("changes", ()):
+            value = change.get("value")
+            if not value:
+                continue
+
+            # Resolve the contacts once per change instead of once per message
+            contacts = value.get("contacts")
+            if not contacts:
+                single_name, names = None, None
+            elif len(contacts) == 1:
+                single_name, names = contacts[0].get("profile", {}).get("name"), None
+            else:
+                single_name, names = None, {contact.get("wa_id"): contact.get("profile", {}).get("name")
+                                            for contact in contacts}
+
+            for message in value.get("messages", ()):
+                message_type = message["type"]
+                sender = message["from"]
+                name = names.get(sender) if names else single_name
+                context = message.get("context")
+                context_id = context.get("id") if context else None
+
+                if message_type == "text":
+                    yield TextMessage(message["id"], message["timestamp"], sender, name, context_id,
+                                      message["text"]["body"])
+                elif message_type in MEDIA_TYPES:
+                    yield MediaMessage(message_type, message["id"], message["timestamp"], sender, name, context_id,
+                                       message[message_type])
+                elif message_type == "button":
+                    yield ButtonMessage(message["id"], message["timestamp"], sender, name, context_id,
+                                        message["button"])
+                elif message_type == "interactive":
+                    yield InteractiveReply(message["id"], message["timestamp"], sender, name, context_id,
+                                           message["interactive"])
+                else:
+                    yield WhatsAppMessage(message_type, message["id"], message["timestamp"], sender,
+                                          sender, name, context_id)
+
+            for status in value.get("statuses", ()):
+                yield StatusUpdate(status.get("id"), status.get("status"), status.get("timestamp"),
+                                   status.get("recipient_id"))
@@ -10,175 +10,163 @@ INDIVIDUAL_RECIPIENT = "individual"
 class WhatsAppAPIError(Exception):
     """Exception raised for WhatsApp API errors."""
 
+def text_payload(phone_number: str, message: str) -> dict:
+    """Builds the request body of a text message."""
+    return {
+        "messaging_product": WHATSAPP_PRODUCT,
+        "recipient_type": INDIVIDUAL_RECIPIENT,
+        "to": phone_number,
+        "type": "text",
+        "text": {"body": message}
+    }
+
+def menu_payload(phone_number: str, title: str, options: List[str]) -> dict:
+    """Builds the request body of a menu with options."""
+    buttons = [
+        {
+            "type": "postback", 
+            "title": option, 
+            "payload": option
+        } for option in options
+    ] 
+    
+    return { 
+        "messaging_product": WHATSAPP_PRODUCT, 
+        "recipient_type": INDIVIDUAL_RECIPIENT, 
+        "to": phone_number, 
+        "type": "template", 
+        "template": 
+            { 
+            "type": "button", 
+            "text": {"body": title},
+            "buttons": buttons }
+        } 
+
+def buttons_payload(phone_number: str, button_text: str, button_titles: List[str]) -> dict:
+    """Builds the request body of buttons with reply actions."""
+    buttons = [
+        {
+            "type": "reply",
+            "reply": {
+                "id": f"UNIQUE_BUTTON_ID_{i}",
+                "title": title
+            }
+        } for i, title in enumerate(button_titles, start=1)
+    ]
+
+    return {
+        "messaging_product": WHATSAPP_PRODUCT,
+        "recipient_type": INDIVIDUAL_RECIPIENT,
+        "to": phone_number,
+        "type": "interactive",
+        "interactive": {
+            "type": "button",
+            "body": {
+                "text": button_text
+            },
+            "action": {
+                "buttons": buttons
+            }
+        }
+    }
+
+def media_payload(phone_number: str, media_type: str, media: dict) -> dict:
+    """Builds the request body of an image, audio, video or document message."""
+    return {
+        "messaging_product": WHATSAPP_PRODUCT,
+        "recipient_type": INDIVIDUAL_RECIPIENT,
+        "to": phone_number,
+        "type": media_type,
+        media_type: media
+    }
+
+def image_payload(phone_number: str, image_url: str, caption: str = None) -> dict:
+    """Builds the request body of an image message."""
+    image = {"url": image_url}
+    if caption:
+        image["caption"] = caption
+    return media_payload(phone_number, "image", image)
+
+def audio_payload(phone_number: str, audio_url: str) -> dict:
+    """Builds the request body of an audio message."""
+    return media_payload(phone_number, "audio", {"url": audio_url})
+
+def video_payload(phone_number: str, video_url: str, caption: str = None) -> dict:
+    """Builds the request body of a video message."""
+    video = {"url": video_url}
+    if caption:
+        video["caption"] = caption
+    return media_payload(phone_number, "video", video)
+
+def document_payload(phone_number: str, document_url: str, file_name: str) -> dict:
+    """Builds the request body of a document message."""
+    return media_payload(phone_number, "document", {"url": document_url, "filename": file_name})
+
+
 class WhatsAppWrapper:
-    """A wrapper for the WhatsApp Cloud API."""
+    """A blocking wrapper for the WhatsApp Cloud API, see AsyncWhatsAppWrapper for async code."""
 
     API_URL = "https://graph.facebook.com/v17.0/"
     API_TOKEN = os.environ.get("WHATSAPP_API_TOKEN")
     NUMBER_ID = os.environ.get("WHATSAPP_NUMBER_ID")
     
-    def __init__(self):
+    def __init__(self, api_token: str = None, number_id: str = None):
+        if api_token:
+            self.API_TOKEN = api_token
+        if number_id:
+            self.NUMBER_ID = number_id
         self.API_URL = f"{self.API_URL}{self.NUMBER_ID}/messages"
         self.headers = {
             "Authorization": f"Bearer {self.API_TOKEN}",
             "Content-Type": "application/json"
         }
+
+        # Keep the connection to the API alive between calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
     
     def __repr__(self):
         return f"<WhatsAppWrapper NUMBER_ID={self.NUMBER_ID}>"
-    
-    def send_message(self, message: str, phone_number: str) -> int:
-        """Sends a text message to a WhatsApp number."""
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "text",
-            "text": {"body": message}
-        }
-        try: 
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
+
+    def _post(self, data: dict, what: str) -> int:
+        """Sends a request body to the messages endpoint."""
+        try:
+            response = self.session.post(self.API_URL, data=json.dumps(data))
             response.raise_for_status()
         except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending message: {err}")
+            raise WhatsAppAPIError(f"Error sending {what}: {err}")
         return response.status_code
     
+    def send_message(self, message: str, phone_number: str) -> int:
+        """Sends a text message to a WhatsApp number."""
+        return self._post(text_payload(phone_number, message), "message")
+    
     def send_menu(self, phone_number: str, title: str, options: List[str]) -> int: 
         """Sends a menu with options to a WhatsApp number.""" 
-        buttons = [
-            {
-                "type": "postback", 
-                "title": option, 
-                "payload": option
-            } for option in options
-        ] 
-        
-        data = { 
-            "messaging_product": WHATSAPP_PRODUCT, 
-            "recipient_type": INDIVIDUAL_RECIPIENT, 
-            "to": phone_number, 
-            "type": "template", 
-            "template": 
-                { 
-                "type": "button", 
-                "text": {"body": title},
-                "buttons": buttons }
-            } 
-        try: 
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data)) 
-            response.raise_for_status() 
-        except requests.HTTPError as err: 
-            raise WhatsAppAPIError(f"Error sending menu: {err}") 
-        return response.status_code
+        return self._post(menu_payload(phone_number, title, options), "menu")
     
     def send_buttons(self, phone_number: str, button_text: str, button_titles: List[str]) -> int:
         """Sends buttons with reply actions to a WhatsApp number."""
-        buttons = [
-            {
-                "type": "reply",
-                "reply": {
-                    "id": f"UNIQUE_BUTTON_ID_{i}",
-                    "title": title
-                }
-            } for i, title in enumerate(button_titles, start=1)
-        ]
-
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "interactive",
-            "interactive": {
-                "type": "button",
-                "body": {
-                    "text": button_text
-                },
-                "action": {
-                    "buttons": buttons
-                }
-            }
-        }
-        try:
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
-            response.raise_for_status()
-        except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending buttons: {err}")
-        return response.status_code
+        return self._post(buttons_payload(phone_number, button_text, button_titles), "buttons")
 
     def send_image(self, phone_number: str, image_url: str, caption: str = None) -> int:
         """Sends an image to a WhatsApp number."""
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "image",
-            "image": {"url": image_url}
-        }
-        if caption:
-            data["image"]["caption"] = caption
-
-        try:
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
-            response.raise_for_status()
-        except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending image: {err}")
-        return response.status_code
+        return self._post(image_payload(phone_number, image_url, caption), "image")
 
     def send_audio(self, phone_number: str, audio_url: str) -> int:
         """Sends an audio message to a WhatsApp number."""
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "audio",
-            "audio": {"url": audio_url}
-        }
-        try:
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
-            response.raise_for_status()
-        except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending audio: {err}")
-        return response.status_code
+        return self._post(audio_payload(phone_number, audio_url), "audio")
 
     def send_video(self, phone_number: str, video_url: str, caption: str = None) -> int:
         """Sends a video to a WhatsApp number."""
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "video",
-            "video": {"url": video_url}
-        }
-        if caption:
-            data["video"]["caption"] = caption
-
-        try:
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
-            response.raise_for_status()
-        except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending video: {err}")
-        return response.status_code
+        return self._post(video_payload(phone_number, video_url, caption), "video")
 
     def send_document(self, phone_number: str, document_url: str, file_name: str) -> int:
         """Sends a document to a WhatsApp number."""
-        data = {
-            "messaging_product": WHATSAPP_PRODUCT,
-            "recipient_type": INDIVIDUAL_RECIPIENT,
-            "to": phone_number,
-            "type": "document",
-            "document": {
-                "url": document_url,
-                "filename": file_name
-            }
-        }
-        try:
-            response = requests.post(self.API_URL, headers=self.headers, data=json.dumps(data))
-            response.raise_for_status()
-        except requests.HTTPError as err:
-            raise WhatsAppAPIError(f"Error sending document: {err}")
-        return response.status_code
+        return self._post(document_payload(phone_number, document_url, file_name), "document")
     
     def process_webhook_data(self, data):
+        """Parses a webhook payload into dicts, see whatsapp_messages.parse_webhook for typed messages."""
         response = []
         for entry in data["entry"]:
             for change in entry["changes"]:
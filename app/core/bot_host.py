@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import logging
+import resource
+import secrets
+from typing import Callable, Dict, Optional
+
+from telegram.ext import Application
+
+from app.bot_template.telegram_webhook import TelegramWebhookHandler
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss() -> int:
+    """Returns the resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Fall back to the peak RSS where /proc is not available, reported in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class HostedBot:
+    """A bot application running inside the host, with its startup measurements."""
+
+    def __init__(self, bot_id: str, application: Application, webhook_handler: Optional[TelegramWebhookHandler],
+                 startup_seconds: float, rss_delta: int):
+        self.bot_id = bot_id
+        self.application = application
+        self.webhook_handler = webhook_handler
+        self.started_at = time.time()
+        self.startup_seconds = startup_seconds
+        self.rss_delta = rss_delta
+
+    def status(self) -> dict:
+        return {
+            "bot_id": self.bot_id,
+            "status": "running" if self.application.running else "stopped",
+            "mode": "webhook" if self.webhook_handler else "polling",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "startup_seconds": round(self.startup_seconds, 3),
+            "startup_rss_bytes": self.rss_delta,
+        }
+
+
+class BotHost:
+    """
+    Runs many bots as tasks in the shared event loop instead of one interpreter per bot.
+
+    The libraries are imported once, each bot only adds its application and handlers.
+    Bots receive updates through the webhook endpoint when a webhook URL is set, otherwise by polling.
+    """
+
+    def __init__(self, application_factory: Callable[..., Application], webhook_url: Optional[str] = None):
+        self.application_factory = application_factory
+        self.webhook_url = webhook_url
+        self.bots: Dict[str, HostedBot] = {}
+        self._lock = asyncio.Lock()
+
+    async def start(self, bot_id: str, token: str) -> dict:
+        """Starts a bot, or returns its status if it is already running."""
+        async with self._lock:
+            if bot_id in self.bots:
+                return self.bots[bot_id].status()
+
+            started = time.perf_counter()
+            rss_before = current_rss()
+
+            application = self.application_factory(token=token, webhook=bool(self.webhook_url))
+            await application.initialize()
+            try:
+                await application.start()
+
+                webhook_handler = None
+                if self.webhook_url:
+                    webhook_handler = TelegramWebhookHandler(application, secret_token=secrets.token_urlsafe(32))
+                    await webhook_handler.set_webhook(f"{self.webhook_url}/telegram/{bot_id}")
+                else:
+                    await application.updater.start_polling()
+            except Exception:
+                # Do not leave a half-started application running in the host
+                if application.running:
+                    await application.stop()
+                await application.shutdown()
+                raise
+
+            bot = HostedBot(bot_id, application, webhook_handler,
+                            startup_seconds=time.perf_counter() - started,
+                            rss_delta=current_rss() - rss_before)
+            self.bots[bot_id] = bot
+            logger.info(f"Started bot {bot_id} in {bot.startup_seconds:.2f}s, RSS +{bot.rss_delta / 1e6:.1f} MB")
+            return bot.status()
+
+    async def stop(self, bot_id: str) -> bool:
+        """Stops a bot, returns False if it was not running."""
+        async with self._lock:
+            bot = self.bots.pop(bot_id, None)
+            if bot is None:
+                return False
+
+            application = bot.application
+            if bot.webhook_handler:
+                await application.bot.delete_webhook()
+            elif application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            logger.info(f"Stopped bot {bot_id}")
+            return True
+
+    async def stop_all(self) -> None:
+        for bot_id in list(self.bots):
+            await self.stop(bot_id)
+
+    def webhook_handler(self, bot_id: str) -> Optional[TelegramWebhookHandler]:
+        bot = self.bots.get(bot_id)
+        return bot.webhook_handler if bot else None
+
+    def status(self, bot_id: Optional[str] = None):
+        """Returns the status of one bot, or of the host and all its bots."""
+        if bot_id is not None:
+            bot = self.bots.get(bot_id)
+            return bot.status() if bot else None
+        return {
+            "rss_bytes": current_rss(),
+            "bots": [bot.status() for bot in self.bots.values()],
+        }
@@ -1,15 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm, HTTPBasicCredentials
 from app.admin import models, auth, crud, schemas
 from app.core.base_bot import BaseBot
-from app.bot_template.telegram_webhook import TelegramWebhookHandler
-from app.bot_template.telegram_bot import TelegramBot
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import timedelta
 from app.database import SessionLocal, engine
+from app.core.bot_host import BotHost
+from app.telegram_bot import build_application
+from rate_limiter import get_rate_limiter
+from prompter import close_vector_store
+import os
+import logging
 import redis
-import subprocess
+
+logger = logging.getLogger(__name__)
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -19,14 +24,47 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 r = redis.Redis(host='localhost', port=6379, db=0)
 
+# Public base URL Telegram sends the updates to, e.g. https://example.com
+TELEGRAM_WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL")
+
+# All bots run as tasks of this process, polling unless a webhook URL is set
+bot_host = BotHost(build_application, webhook_url=TELEGRAM_WEBHOOK_URL)
+
+
+def set_bot_status(bot_id, status: str) -> None:
+    # Keep the status read by /bot/{bot_id} in sync
+    try:
+        r.set(bot_id, status)
+    except redis.RedisError as e:
+        logger.warning(f"Could not store the status of bot {bot_id}: {e}")
+
 
 @app.on_event("startup")
 async def startup_event():
     # Initialize your bots here
-    telegram_bot = TelegramBot("your-telegram-bot-token")
-    telegram_webhook_handler = TelegramWebhookHandler(
-        "your-telegram-bot-token")
-    await telegram_webhook_handler.set_webhook("your-webhook-url")
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    if token:
+        await bot_host.start("default", token)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await bot_host.stop_all()
+    # The bots share one vector store, persist it once they are all stopped
+    await close_vector_store()
+
+
+@app.post("/telegram/{bot_id}", include_in_schema=False)
+async def telegram_webhook(bot_id: str, request: Request):
+    handler = bot_host.webhook_handler(bot_id)
+    if handler is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != handler.secret_token:
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    # Queue the update and answer Telegram immediately
+    await handler.handle_update(await request.json())
+    return {"ok": True}
 
 
 @app.get("/")
@@ -76,7 +114,36 @@ def read_bot(bot_id: int, status: Optional[str] = None, credentials: HTTPBasicCr
 
 
 @app.get("/start_bot/{bot_id}")
-def start_bot(bot_id: int, credentials: HTTPBasicCredentials = Depends(auth.authenticate)):
-    # Start the Telegram bot
-    subprocess.Popen(["python", f"bot_{bot_id}.py"])
-    return {"bot_id": bot_id, "status": "starting"}
+async def start_bot(bot_id: int, credentials: HTTPBasicCredentials = Depends(auth.authenticate)):
+    # Start the Telegram bot inside this process, its token comes from TELEGRAM_BOT_TOKEN_<bot_id>
+    token = os.environ.get(f"TELEGRAM_BOT_TOKEN_{bot_id}")
+    if not token:
+        raise HTTPException(status_code=404, detail="Bot token not configured")
+    try:
+        bot_status = await bot_host.start(str(bot_id), token)
+    except Exception as e:
+        logger.error(f"Error starting bot {bot_id}: {e}")
+        set_bot_status(bot_id, "failed")
+        raise HTTPException(status_code=500, detail="Could not start the bot")
+    set_bot_status(bot_id, "running")
+    return bot_status
+
+
+@app.get("/stop_bot/{bot_id}")
+async def stop_bot(bot_id: int, credentials: HTTPBasicCredentials = Depends(auth.authenticate)):
+    if not await bot_host.stop(str(bot_id)):
+        raise HTTPException(status_code=404, detail="Bot not running")
+    set_bot_status(bot_id, "stopped")
+    return {"bot_id": bot_id, "status": "stopped"}
+
+
+@app.get("/bots")
+def bots_status(credentials: HTTPBasicCredentials = Depends(auth.authenticate)):
+    # Status, startup time and memory of every hosted bot
+    return bot_host.status()
+
+
+@app.get("/rate_limits")
+def rate_limits(credentials: HTTPBasicCredentials = Depends(auth.authenticate)):
+    # Granted calls and limiter wait times per model, for sizing the OpenAI quota
+    return get_rate_limiter().stats()
@@ -2,15 +2,18 @@ import os
 import logging
 import re
 import asyncio
-import aiofiles
 
-from pydub import AudioSegment
 from telegram import Update, InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardMarkup, Bot, LabeledPrice, Poll, KeyboardButtonPollType
 from telegram.ext import Updater, CommandHandler, MessageHandler, filters, CallbackContext, PollAnswerHandler, CallbackQueryHandler, PreCheckoutQueryHandler, Application, PollHandler, ContextTypes
 from telegram.constants import ChatAction, ParseMode
-from cachetools import cached, TTLCache
+from cachetools import LRUCache
 
-from prompter import Prompter
+from prompter import Prompter, close_vector_store
+from streaming import stream_reply
+from conversation_store import create_conversation_store
+from audio import transcribe
+from update_processor import ChatSerializedUpdateProcessor
+from crawler import CRAWL_MAX_DEPTH, find_urls, remove_urls
 
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
@@ -19,8 +22,33 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Chat history and buffer size
-chat_context = TTLCache(maxsize=10, ttl=14400)
+# Generated images are returned as links to this host
+IMAGE_URL_PATTERN = r"(https://oaidalleapiprodscus\.blob\..*)"
+
+# Chat history, bounded per chat and optionally shared across workers
+conversation_store = create_conversation_store()
+
+# Prompters reused across updates of the same chat, per bot
+prompters = LRUCache(maxsize=1024)
+
+# Key of a chat's conversation with one bot, several bots may serve the same user in this process
+def conversation_key(context, chat_id):
+    return f"{context.bot.id}:{chat_id}"
+
+# Get the prompter for a chat of this bot, creating it on the first update
+def get_prompter(context, chat_id):
+    key = (context.bot.id, chat_id)
+    prompter = prompters.get(key)
+    if prompter is None:
+        prompter = Prompter(chat_id=chat_id,
+                            openai_api_key = OPENAI_API_KEY,
+                            google_api_key = GOOGLE_API_KEY,
+                            google_cse_id = GOOGLE_CSE_ID,
+                            wolfram_alpha_appid = WOLFRAM_ALPHA_APPID,
+                            eleven_api_key = ELEVEN_API_KEY,
+                            conversation_id = conversation_key(context, chat_id))
+        prompters[key] = prompter
+    return prompter
 
 # Start command
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -33,30 +61,64 @@ async def send_typing_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING)
         await asyncio.sleep(5)  # Send typing status every 5 seconds
 
+# Reply to saving web pages, given the summary of the new and changed pages
+def crawl_reply(summary, prefix):
+    if summary is None:
+        return "Sorry, I couldn't fetch or summarize the pages. Please try again."
+    if not summary:
+        return "No new or changed pages, nothing was saved."
+    return prefix + summary
+
 # Process text message
-async def process_message(prompter, update, user_message, chat_id):
-    url_pattern = r"(https?://\S+)"
-    url_match = re.match(url_pattern, user_message)
-    if url_match:
-        url = url_match.group(1)
-        summary = await prompter.save_url(url=url)
-        response = "Summary of the web page: " + summary
+async def process_message(prompter, update, user_message, chat_id, typing_task=None):
+    # Save the pages linked anywhere in the message, fetched together
+    urls = find_urls(user_message)
+    if urls:
+        summary = await prompter.save_urls(urls)
+        response = crawl_reply(summary, "Summary of the web page: " if len(urls) == 1 else "Summary of the web pages: ")
         await update.message.reply_text(text=response, quote=True)
-        user_message = f"{url} saved to my documents database."
-    else:
-        response = await prompter.generate_response(message=user_message, chat_context=chat_context[chat_id])
-        image_url_pattern = r"(https://oaidalleapiprodscus\.blob\..*)"
-        image_match = re.match(image_url_pattern, response)
+        question = remove_urls(user_message)
+        if not question:
+            return f"{' '.join(urls)} saved to my documents database.", response
+        # Answer the rest of the message once the pages are searchable
+        user_message = question
+
+    if update.message.voice or update.message.audio:
+        response = await prompter.generate_response(message=user_message, chat_context=await conversation_store.get(prompter.conversation_id))
+        image_match = re.match(IMAGE_URL_PATTERN, response)
         if image_match:
-            image_url = image_match.group(1)
-            await update.message.reply_photo(image_url)
+            await update.message.reply_photo(image_match.group(1))
         else:
-            if update.message.voice or update.message.audio:
-                audio = await prompter.generate_audio(text=response)
-                if audio:
-                    await update.message.reply_voice(voice=audio)
-                else:
-                    await update.message.reply_text(text=response)
+            audio = await prompter.generate_audio(text=response)
+            if audio:
+                await update.message.reply_voice(voice=audio)
+            else:
+                await update.message.reply_text(text=response)
+    else:
+        chat_context = await conversation_store.get(prompter.conversation_id)
+
+        # Stream the answer into the chat while the agent is generating it
+        queue = asyncio.Queue()
+        stream_task = asyncio.create_task(stream_reply(
+            queue,
+            send=lambda text: update.message.reply_text(text=text),
+            edit=lambda message, text: message.edit_text(text=text),
+            started=asyncio.get_running_loop().time(),
+            on_first_token=typing_task.cancel if typing_task else None))
+
+        try:
+            response = await prompter.generate_response(message=user_message, chat_context=chat_context, stream_queue=queue)
+        except BaseException:
+            # No end marker may come, do not leave the stream waiting for one
+            stream_task.cancel()
+            raise
+        streamed = await stream_task
+
+        # Tools that return directly (e.g. images) and errors produce no streamed tokens
+        if not streamed.strip():
+            image_match = re.match(IMAGE_URL_PATTERN, response)
+            if image_match:
+                await update.message.reply_photo(image_match.group(1))
             else:
                 await update.message.reply_text(text=response)
 
@@ -69,65 +131,18 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Get the chat id
     chat_id = update.message.chat_id
 
-    # If the chat context is empty, initialize it
-    if chat_id not in chat_context:
-        chat_context[chat_id] = []
-    
-    prompter = Prompter(chat_id=chat_id, 
-                        openai_api_key = OPENAI_API_KEY,
-                        google_api_key = GOOGLE_API_KEY,
-                        google_cse_id = GOOGLE_CSE_ID,
-                        wolfram_alpha_appid = WOLFRAM_ALPHA_APPID,
-                        eleven_api_key = ELEVEN_API_KEY)
+    prompter = get_prompter(context, chat_id)
     
     try:
         user_message = None
         # Get the user message
         # Check if the message is a voice message or text message
-        if update.message.voice:
+        if update.message.voice or update.message.audio:
+            # Download into memory so concurrent voice messages never share a file
             file = await update.message.effective_attachment.get_file()
-            await file.download_to_drive("voice_message.ogg")
-
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, lambda: AudioSegment.from_ogg("voice_message.ogg").export("voice_message.mp3", format="mp3"))
-
-            with open("voice_message.mp3", "rb") as f:
-                transcript = await prompter.transcribe_voice(file=f)
-            
-            """
-            # This async version of this code is not working. Need to fix it.
-            async with aiofiles.tempfile.NamedTemporaryFile(prefix="voice_message_", suffix=".ogg") as voice_file:
-                file = await update.message.effective_attachment.get_file()
-                await file.download_to_drive(voice_file.name)
-                await voice_file.flush()
-
-                async with aiofiles.tempfile.NamedTemporaryFile(prefix="voice_message_", suffix=".mp3") as mp3_file:
-                    loop = asyncio.get_event_loop()
-                    await loop.run_in_executor(None, lambda: AudioSegment.from_ogg(voice_file.name).export(mp3_file.name, format="mp3"))
-                    await mp3_file.flush()
-
-                    async with aiofiles.open(mp3_file.name, "rb") as f:
-                        transcript = await prompter.transcribe_voice(file=f)
-            """
-            user_message = transcript
-
-        elif update.message.audio:
-            file = await update.message.effective_attachment.get_file()
-            await file.download_to_drive("audio_message.mp3")
-
-            with open("audio_message.mp3", "rb") as f:
-                transcript = await prompter.transcribe_voice(file=f)
-            """
-            # This async version of this code is not working. Need to fix it.
-            async with aiofiles.tempfile.NamedTemporaryFile(prefix="audio_message_", suffix=".mp3") as audio_file:
-                file = await update.message.effective_attachment.get_file()
-                await file.download_to_drive(audio_file.name)
-                await audio_file.flush()
-
-            async with aiofiles.open(file_name, "rb") as f:
-                transcript = await prompter.transcribe_voice(file=f)
-            """
-            user_message = transcript
+            data = await file.download_as_bytearray()
+            file_name = getattr(update.message.effective_attachment, "file_name", None) or file.file_path
+            user_message = await transcribe(prompter, data, file_name)
 
         else:
             user_message = update.message.text
@@ -139,9 +154,9 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             typing_task = asyncio.create_task(send_typing_status(update, context))
 
             # Get a response for the user message
-            user_message, response = await process_message(prompter, update, user_message, chat_id)
+            user_message, response = await process_message(prompter, update, user_message, chat_id, typing_task)
 
-            chat_context[chat_id].extend([{ "Human": user_message, "AI": response }])
+            await conversation_store.append(prompter.conversation_id, user_message, response)
 
             # Stop the typing status task
             typing_task.cancel()
@@ -164,16 +179,7 @@ async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     logger.info("Document received")
 
-    # If the chat context is empty, initialize it
-    if chat_id not in chat_context:
-        chat_context[chat_id] = []
-    
-    prompter = Prompter(chat_id=chat_id, 
-                        openai_api_key = OPENAI_API_KEY,
-                        google_api_key = GOOGLE_API_KEY,
-                        google_cse_id = GOOGLE_CSE_ID,
-                        wolfram_alpha_appid = WOLFRAM_ALPHA_APPID,
-                        eleven_api_key = ELEVEN_API_KEY)
+    prompter = get_prompter(context, chat_id)
     
     try:
         # Get the document
@@ -184,14 +190,17 @@ async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         # Create the typing status task
         typing_task = asyncio.create_task(send_typing_status(update, context))
 
-        # Save the document to the vector database and get the summary
-        summary = await prompter.save_document(document=file_name)
-
-        response = "Summary of the document: " + summary
-
-        await update.message.reply_text(text=response, quote=True)
+        # Deliver the summary as a follow-up message once it is ready
+        async def send_summary(summary):
+            if summary is None:
+                await update.message.reply_text(text="Sorry, I couldn't summarize your document.", quote=True)
+                return
+            response = "Summary of the document: " + summary
+            await update.message.reply_text(text=response, quote=True)
+            await conversation_store.append(prompter.conversation_id, f"{file_name} saved to my documents database.", response)
 
-        chat_context[chat_id].extend([{ "Human": f"{file_name} saved to my documents database.", "AI": response }])
+        # Save the document to the vector database, the summary is produced in the background
+        chunks = await prompter.save_document(document=file_name, on_summary=send_summary)
 
         # Stop the typing status task
         typing_task.cancel()
@@ -200,6 +209,13 @@ async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         except asyncio.CancelledError:
             pass
 
+        if chunks == 0:
+            await update.message.reply_text(text=f"{file_name} is already in my documents database, unchanged.", quote=True)
+        elif isinstance(chunks, int):
+            await update.message.reply_text(text=f"{file_name} saved to my documents database. I will send you a summary shortly.", quote=True)
+        else:
+            await update.message.reply_text(text="Sorry, I couldn't save your document. Please try again.", quote=True)
+
         os.remove(file_name)
     
     except Exception as e:
@@ -212,12 +228,7 @@ async def clear_database(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Get the chat id
     chat_id = update.message.chat_id
 
-    prompter = Prompter(chat_id=chat_id, 
-                        openai_api_key = OPENAI_API_KEY,
-                        google_api_key = GOOGLE_API_KEY,
-                        google_cse_id = GOOGLE_CSE_ID,
-                        wolfram_alpha_appid = WOLFRAM_ALPHA_APPID,
-                        eleven_api_key = ELEVEN_API_KEY)
+    prompter = get_prompter(context, chat_id)
 
     # if the database is cleared, send a message to the user
     if await prompter.clear_database():
@@ -226,6 +237,63 @@ async def clear_database(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text(text="Database not cleared.")
 
 
+# List the documents of the database
+async def list_documents(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    prompter = get_prompter(context, update.message.chat_id)
+    documents = await prompter.list_documents()
+    if documents is None:
+        await update.message.reply_text(text="Sorry, I couldn't list your documents.")
+    elif not documents:
+        await update.message.reply_text(text="Your documents database is empty.")
+    else:
+        lines = [f"{number}. {document['source']} (version {document['version']}, {document['chunks']} chunks)"
+                 for number, document in enumerate(documents, start=1)]
+        await update.message.reply_text(text="\n".join(lines + ["", "Delete one with /delete_document <number>"]))
+
+
+# Delete one document from the database: /delete_document <number or name>
+async def delete_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    prompter = get_prompter(context, update.message.chat_id)
+    if not context.args:
+        await update.message.reply_text(text="Usage: /delete_document <number from /documents or name>")
+        return
+
+    source = " ".join(context.args)
+    if source.isdigit():
+        # Numbers refer to the list shown by /documents
+        documents = await prompter.list_documents() or []
+        index = int(source) - 1
+        if not 0 <= index < len(documents):
+            await update.message.reply_text(text=f"There is no document number {source}.")
+            return
+        source = documents[index]["source"]
+
+    deleted = await prompter.delete_document(source)
+    if deleted is None:
+        await update.message.reply_text(text=f"{source} is not in your documents database.")
+    else:
+        await update.message.reply_text(text=f"{source} deleted from your documents database ({deleted} chunks).")
+
+
+# Crawl a site into the documents database: /crawl <url> [depth]
+async def crawl(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.message.chat_id
+    urls = find_urls(" ".join(context.args))
+    if not urls:
+        await update.message.reply_text(text="Usage: /crawl <url or sitemap> [depth]")
+        return
+    depth = next((int(arg) for arg in context.args if arg.isdigit()), CRAWL_MAX_DEPTH)
+
+    prompter = get_prompter(context, chat_id)
+    try:
+        await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        summary = await prompter.save_urls(urls, max_depth=depth)
+        await update.message.reply_text(text=crawl_reply(summary, "Summary of the crawled pages: "), quote=True)
+    except Exception as e:
+        logger.error(f"Error during crawling: {e}")
+        await update.message.reply_text("Sorry, I couldn't crawl these pages. Please try again.")
+
+
 # Donation
 async def donate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     out = context.bot.send_invoice(
@@ -284,11 +352,13 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         'An error occurred while processing your message. Please try again.')
 
 
-def main() -> None:
-    # Set up the updater and dispatcher
-    #updater = Updater(TELEGRAM_BOT_TOKEN)
-    #dispatcher = updater.dispatcher
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+# Build the bot application, without an updater when updates arrive through a webhook
+def build_application(token: str = None, webhook: bool = False) -> Application:
+    # Process updates concurrently, one at a time per chat
+    builder = Application.builder().token(token or TELEGRAM_BOT_TOKEN).concurrent_updates(ChatSerializedUpdateProcessor())
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Set API keys
     global OPENAI_API_KEY
@@ -313,12 +383,27 @@ def main() -> None:
     application.add_handler(MessageHandler(
         filters.SUCCESSFUL_PAYMENT, successful_payment_callback))
     application.add_handler(CommandHandler("clear_database", clear_database))
+    application.add_handler(CommandHandler("crawl", crawl))
+    application.add_handler(CommandHandler("documents", list_documents))
+    application.add_handler(CommandHandler("delete_document", delete_document))
     application.add_handler(MessageHandler(
         filters.TEXT | filters.VOICE | filters.AUDIO & ~filters.COMMAND, message_handler))
     application.add_handler(MessageHandler(
         filters.Document.MimeType("application/pdf") | filters.Document.MimeType("text/plain") | filters.Document.MimeType("application/msword") | filters.Document.MimeType("application/vnd.openxmlformats-officedocument.wordprocessingml.document") | filters.Document.MimeType("text/html") | filters.Document.MimeType("text/csv") | filters.Document.MimeType("text/tab-separated-values") | filters.Document.MimeType("text/richtext"),
         document_handler))
     application.add_error_handler(error_handler)
+
+    return application
+
+
+async def on_shutdown(application: Application) -> None:
+    # Write the vector store changes made since the last checkpoint
+    await close_vector_store()
+
+
+def main() -> None:
+    application = build_application()
+    application.post_shutdown = on_shutdown
     # Start the bot
     application.run_polling()
 
@@ -1,18 +1,21 @@
 """
 A simple FastAPI app that receives messages from the WhatsApp API and sends a response.
 """
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+import asyncio
 import uvicorn
 import logging
 import os
 
-from bot_template.whatsapp_bot import WhatsAppBot
+from bot_template.whatsapp_async import AsyncWhatsAppWrapper, OutboundQueue
+from bot_template.whatsapp_dispatcher import WebhookDispatcher
+from bot_template.whatsapp_messages import WhatsAppMessage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
-bot = WhatsAppBot()
+outbound = OutboundQueue(AsyncWhatsAppWrapper())
 VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN')
 
 @app.get("/webhook", include_in_schema=False)
@@ -23,21 +26,36 @@ async def verify(request: Request):
         return int(request.query_params.get('hub.challenge'))
     return "Hello world", 200
 
+async def handle_message(message: WhatsAppMessage) -> None:
+    if message.type == "text":
+        # send a response, waiting for it keeps the replies to a sender in order
+        await outbound.enqueue("send_message", "Hello world!", message.phone_number)
+    elif message.type == "image":
+        # send a response
+        await outbound.enqueue("send_message", "Thanks for the image!", message.phone_number)
+
+dispatcher = WebhookDispatcher(handle_message)
+
+@app.on_event("startup")
+async def startup():
+    dispatcher.start()
+
 @app.post("/webhook", include_in_schema=False)
 async def webhook(request: Request):
-    data = await request.json()
-    logger.info(f"Received webhook data: {data}")
-
-    # process the webhook data
-    data = bot.process_webhook(data)
-    if data["type"] == "text":
-        # send a response
-        bot.send_message("Hello world!", data["phone_number"])
-    elif data["type"] == "image":
-        # send a response
-        bot.send_message("Thanks for the image!", data["phone_number"])
+    # Acknowledge right away, the workers parse and process the payload
+    try:
+        dispatcher.submit(await request.body())
+    except asyncio.QueueFull:
+        logger.warning("Webhook queue is full, asking Meta to retry later")
+        return Response(status_code=503)
 
     return "ok"
 
+@app.on_event("shutdown")
+async def shutdown():
+    await dispatcher.stop()
+    await outbound.close()
+    logger.info(f"Webhook dispatcher stats: {dispatcher.stats()}")
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,68 @@
+"""
+In-memory audio ingest for transcription, transcoding only formats Whisper does not accept.
+"""
+
+import io
+import os
+import logging
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+# Formats accepted by the Whisper API as they are
+WHISPER_FORMATS = {"flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "wav", "webm"}
+
+# Processes used to transcode the other formats
+AUDIO_TRANSCODE_WORKERS = int(os.environ.get("AUDIO_TRANSCODE_WORKERS", 2))
+
+logger = logging.getLogger(__name__)
+
+def _transcode(data, source_format, target_format):
+    """Transcode audio bytes, runs in a worker process."""
+    from pydub import AudioSegment
+
+    output = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(data), format=source_format).export(output, format=target_format)
+    return output.getvalue()
+
+
+_executor = None
+
+def get_transcode_executor():
+    """Return the bounded process pool used for transcoding."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=AUDIO_TRANSCODE_WORKERS)
+    return _executor
+
+
+def audio_format(file_name, default="ogg"):
+    """Return the lowercase extension of a file name."""
+    extension = os.path.splitext(file_name or "")[1].lstrip(".").lower()
+    return extension or default
+
+
+async def prepare_audio(data, file_name, target_format="mp3"):
+    """
+    Return an in-memory file with the audio that can be sent to Whisper.
+
+    The buffer is named after the format so the API can detect it, the caller should close it.
+    """
+    source_format = audio_format(file_name)
+    if source_format not in WHISPER_FORMATS:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(get_transcode_executor(), _transcode, bytes(data), source_format, target_format)
+        logger.info(f"Transcoded {source_format} audio to {target_format}")
+        source_format = target_format
+
+    audio = io.BytesIO(data)
+    audio.name = f"audio.{source_format}"
+    return audio
+
+
+async def transcribe(prompter, data, file_name):
+    """Transcribe audio bytes without touching the disk."""
+    audio = await prepare_audio(data, file_name)
+    try:
+        return await prompter.transcribe_voice(file=audio)
+    finally:
+        audio.close()
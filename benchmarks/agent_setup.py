@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the per-message agent setup cost.
+
+Compares building the LLM client, tools and agent on every message (the old
+behaviour of Prompter.generate_response) with the cached AgentFactory.
+No API calls are made, only object construction is timed.
+
+    python benchmarks/agent_setup.py --messages 50
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain.chat_models import ChatOpenAI
+from langchain.agents import load_tools, initialize_agent, Tool, AgentType
+from langchain.callbacks.streaming_stdout_final_only import FinalStreamingStdOutCallbackHandler
+
+import prompter
+
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "sk-benchmark")
+
+
+async def _noop(query):
+    return query
+
+
+def build_per_message():
+    """Reproduce the setup previously done for every incoming message."""
+    llm = ChatOpenAI(temperature=0,
+                     streaming=True,
+                     callbacks=[FinalStreamingStdOutCallbackHandler()],
+                     max_retries=3,
+                     openai_api_key=OPENAI_API_KEY)
+    tools = load_tools(['llm-math'], llm=llm)
+    tools.extend([
+        Tool(name=name, func=_noop, coroutine=_noop, description=name)
+        for name in ["Image Model", "Wikipedia", "Google Search", "Wolfram Alpha", "Search User Documents", "Generate Test"]
+    ])
+    return initialize_agent(tools=tools,
+                            llm=llm,
+                            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+                            verbose=True,
+                            handle_parsing_errors="Check your output and make sure it conforms!")
+
+
+def build_cached():
+    """Fetch the agent the way generate_response does now."""
+    return prompter.get_agent_factory(OPENAI_API_KEY).agent
+
+
+def measure(func, messages):
+    timings = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<12} first={timings[0]:8.3f} ms  "
+          f"median={statistics.median(timings):8.3f} ms  "
+          f"total={sum(timings):9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50, help="number of simulated messages")
+    args = parser.parse_args()
+
+    report("per-message", measure(build_per_message, args.messages))
+    report("cached", measure(build_cached, args.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Cold-start benchmark of the bot entry points based on python -X importtime.
+
+Imports each target in a fresh interpreter, sums the import time of the modules
+the target adds on top of an empty interpreter and lists the heaviest packages.
+The median of the runs is compared with the recorded baseline and the script
+exits with status 1 when a target got slower than the baseline plus the tolerance.
+Targets without a recorded baseline are held to the absolute limits of
+DEFAULT_MAX_MS, so the check also fails on a fresh checkout.
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --update        # record the current times as the baseline
+    python benchmarks/cold_start.py --max-ms app.main=1500
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cold_start_baseline.json")
+TARGETS = ["app.telegram_bot", "app.main"]
+# Limits of the targets that have no baseline yet. The heavy clients are imported on first use,
+# so the entry points only pay for the web and Telegram frameworks.
+DEFAULT_MAX_MS = {"app.telegram_bot": 1500.0, "app.main": 2500.0}
+
+
+def import_times(statement):
+    """Run statement in a fresh interpreter, return {module: (self us, cumulative us, depth)} in import order."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def measure(target, startup):
+    """Return the milliseconds spent importing target and its heaviest top-level packages."""
+    times = import_times(f"import {target}")
+    added = {name: entry for name, entry in times.items() if name not in startup}
+    total_ms = sum(cumulative for _, cumulative, depth in added.values() if depth == 0) / 1000
+
+    packages = sorted(((cumulative / 1000, name) for name, (_, cumulative, _) in added.items()
+                       if "." not in name and name != target.split(".")[0]), reverse=True)
+    return total_ms, packages
+
+
+def parse_limits(values):
+    limits = {}
+    for value in values or ():
+        target, _, ms = value.partition("=")
+        limits[target] = float(ms)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=TARGETS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages to list per target")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument("--max-ms", action="append", metavar="TARGET=MS",
+                        help="absolute limit, overrides the baseline and DEFAULT_MAX_MS")
+    parser.add_argument("--update", action="store_true", help="write the measured times as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    limits = parse_limits(args.max_ms)
+
+    # Modules an empty interpreter already imports are not the target's cost
+    startup = set(import_times("pass"))
+
+    measured = {}
+    failed = False
+    for target in args.targets:
+        try:
+            runs = [measure(target, startup) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{target:<18} FAILED to import: {e}")
+            failed = True
+            continue
+
+        median_ms = statistics.median(total for total, _ in runs)
+        measured[target] = round(median_ms, 1)
+
+        limit = limits.get(target)
+        if limit is None and target in baseline:
+            limit = baseline[target] * (1 + args.tolerance)
+        if limit is None:
+            limit = DEFAULT_MAX_MS.get(target)
+
+        verdict = ""
+        if limit is not None:
+            verdict = "ok" if median_ms <= limit else "REGRESSION"
+            failed = failed or median_ms > limit
+        print(f"{target:<18} median={median_ms:8.1f} ms min={min(t for t, _ in runs):8.1f} ms "
+              f"limit={'-' if limit is None else f'{limit:.1f}'} ms {verdict}")
+        for package_ms, name in runs[-1][1][:args.top]:
+            print(f"    {package_ms:8.1f} ms  {name}")
+
+    if args.update:
+        baseline.update(measured)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("No baseline recorded yet, checked against DEFAULT_MAX_MS, run with --update to record one")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Local HTTP fixture site for the crawler, and a check of the crawler against it.
+
+Serves a small site on 127.0.0.1 with a sitemap, linked pages, a near-duplicate
+page, ETag and Last-Modified validators and a delay per request. The check
+crawls it with a throwaway crawl state:
+
+  1. the home page two levels deep, the linked pages of the site are fetched
+  2. the sitemap, pages from the first crawl answer 304 and the near
+     duplicate is dropped
+  3. the sitemap again after one page changed, only that page is fetched
+  4. several URLs at once into another collection, timed against the delay
+     of fetching them one after another
+
+Exits with 1 when an expectation fails.
+
+    python benchmarks/crawl_fixture.py            # run the check
+    python benchmarks/crawl_fixture.py --serve    # only serve the site, e.g. for /crawl
+"""
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PARAGRAPH = ("Chunks are embedded in batches and stored with their source. Retrieval merges keyword and vector "
+             "scores before the answer is written. ")
+
+
+def page(title, body, links=()):
+    anchors = "".join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+    return (f"<html><head><title>{title}</title><style>p {{color: red}}</style></head>"
+            f"<body><h1>{title}</h1><p>{body}</p><ul>{anchors}</ul>"
+            f"<script>console.log('ignored')</script></body></html>")
+
+
+def build_site():
+    """Return {path: [body, last modified time]} of the fixture site."""
+    now = time.time()
+    site = {
+        "/": page("Home", "Welcome to the fixture site.",
+                  ["/docs/alpha", "/docs/gamma#section", "https://example.invalid/elsewhere"]),
+        "/docs/alpha": page("Alpha", "Alpha covers ingestion. " + PARAGRAPH * 20, ["/docs/beta"]),
+        "/docs/beta": page("Beta", "Beta covers the token budget of the context window. " * 30),
+        # Beta with one word changed, a near duplicate
+        "/docs/beta-print": page("Beta", "Beta covers the token budget of the context window. " * 29 +
+                                 "Beta covers the token budget of the context windows. "),
+        "/docs/gamma": page("Gamma", "Gamma covers rate limits and retries. " * 25),
+        "/notes.txt": "Plain text notes about the fixture site.\n\nSecond paragraph.",
+    }
+    sitemap = "".join(f"<url><loc>{{base}}{path}</loc></url>" for path in site if path != "/")
+    site["/sitemap.xml"] = ('<?xml version="1.0" encoding="UTF-8"?>'
+                            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemap}</urlset>')
+    return {path: [body, now - 3600] for path, body in site.items()}
+
+
+def make_handler(site, delay, requests):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            path = self.path.split("?")[0]
+            requests.append(path)
+            if path not in site:
+                self.send_error(404)
+                return
+            body, modified = site[path]
+            body = body.replace("{base}", f"http://{self.headers['Host']}").encode()
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            last_modified = formatdate(modified, usegmt=True)
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            content_type = ("application/xml" if path.endswith(".xml") else
+                            "text/plain; charset=utf-8" if path.endswith(".txt") else "text/html; charset=utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(site, delay, requests, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(site, delay, requests))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def check(base, site, delay, requests):
+    from crawler import Crawler, CrawlState
+
+    failures = []
+
+    def expect(name, condition):
+        print(f"{'ok  ' if condition else 'FAIL'} {name}")
+        if not condition:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as directory:
+        state = CrawlState(os.path.join(directory, "crawl_state.sqlite"))
+
+        async def crawl(urls, max_depth=0, collection="fixture"):
+            crawler = Crawler(collection, state=state)
+            started = time.perf_counter()
+            documents = await crawler.crawl(urls, max_depth=max_depth)
+            elapsed = time.perf_counter() - started
+            await crawler.commit()
+            return {doc.metadata["source"].replace(base, "") for doc in documents}, crawler.stats, elapsed
+
+        pages, stats, _ = await crawl([base + "/"], max_depth=2)
+        expect("depth crawl fetches the linked pages on the site",
+               pages == {"/", "/docs/alpha", "/docs/beta", "/docs/gamma"})
+        expect("links to other hosts are not followed", not any("elsewhere" in path for path in requests))
+
+        pages, stats, _ = await crawl([base + "/sitemap.xml"])
+        expect("sitemap pages fetched before are unchanged", stats["unchanged"] == 3)
+        expect("near duplicate page is dropped", stats["duplicate"] == 1 and "/docs/beta-print" not in pages)
+        expect("new sitemap pages are fetched", pages == {"/notes.txt"})
+
+        site["/docs/gamma"][0] = page("Gamma", "Gamma now covers backoff with jitter. " * 25)
+        pages, stats, _ = await crawl([base + "/sitemap.xml"])
+        expect("only the changed page is fetched again", pages == {"/docs/gamma"})
+
+        urls = [base + path for path in site if path != "/sitemap.xml"]
+        pages, stats, elapsed = await crawl(urls, collection="concurrency")
+        sequential = len(urls) * delay
+        print(f"     {len(urls)} URLs in {elapsed:.2f}s, {sequential:.2f}s of server delay one after another")
+        expect("URLs are fetched concurrently", elapsed < sequential / 2)
+
+    from crawler import close_http_client
+    await close_http_client()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve", action="store_true", help="serve the site until interrupted")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds before each response")
+    args = parser.parse_args()
+
+    site = build_site()
+    requests = []
+    server = serve(site, args.delay, requests, port=args.port)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    if args.serve:
+        print(f"Serving the fixture site on {base}, sitemap at {base}/sitemap.xml")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    failures = asyncio.run(check(base, site, args.delay, requests))
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
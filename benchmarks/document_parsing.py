@@ -0,0 +1,220 @@
+"""
+Peak memory and throughput of document parsing and chunking on a fixture PDF set.
+
+Compares the previous path, the whole document loaded in the bot process and
+cut by CharacterTextSplitter(chunk_size=1000), with the streaming path of
+chunking.TokenChunker, pages parsed in batches on a process pool and split on
+token counts along headings and paragraphs. Each path runs in a fresh process
+and reports pages/sec, the chunks produced, and the peak RSS of the process and
+of its largest parser process.
+
+The previous path loads with unstructured when it is installed, and with pypdf
+otherwise. The fixture PDFs are generated into --workdir unless --pdfs points
+to a directory of real ones.
+
+    python benchmarks/document_parsing.py
+    python benchmarks/document_parsing.py --pdfs ~/papers --processes 8
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import statistics
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORDS = """
+retrieval index vector token chunk embedding latency memory throughput page document parser heading
+paragraph sentence overlap budget model query answer source collection cache process pool batch stream
+""".split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one text page per list of lines."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def generate_fixtures(directory, documents, pages, seed=0):
+    """Write documents PDFs of pages pages of numbered sections and paragraphs, unless they exist."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for number in range(documents):
+        path = os.path.join(directory, f"fixture-{number}-{pages}.pdf")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        content = []
+        section = 0
+        for _ in range(pages):
+            lines = []
+            while len(lines) < 60:
+                if rng.random() < 0.15:
+                    section += 1
+                    lines += ["", f"{section}.{rng.randint(1, 9)} {' '.join(rng.sample(WORDS, 3)).capitalize()}"]
+                sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                             for _ in range(rng.randint(2, 6))]
+                words = " ".join(sentences).split()
+                line = []
+                for word in words:
+                    if sum(len(w) + 1 for w in line) + len(word) > 95:
+                        lines.append(" ".join(line))
+                        line = []
+                    line.append(word)
+                lines += [" ".join(line), ""]
+            content.append(lines[:60])
+        write_pdf(path, content)
+    return paths
+
+
+def memory():
+    """Return the peak RSS in MB of this process and of its largest child process."""
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return int(status["VmHWM"].split()[0]) / 1024, children
+
+
+def run_previous(paths):
+    from langchain.text_splitter import CharacterTextSplitter
+    if importlib.util.find_spec("unstructured") is not None:
+        from langchain.document_loaders import UnstructuredFileLoader
+
+        def load(path):
+            return UnstructuredFileLoader(path).load()
+        loader = "unstructured"
+    else:
+        from pypdf import PdfReader
+        from langchain.schema import Document
+
+        def load(path):
+            return [Document(page_content="\n".join(page.extract_text() for page in PdfReader(path).pages),
+                             metadata={"source": path})]
+        loader = "pypdf"
+
+    splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+    chunks = []
+    for path in paths:
+        chunks += splitter.split_documents(load(path))
+    return chunks, f"whole ({loader})"
+
+
+def run_streaming(paths, processes, batch):
+    import chunking
+    chunking.PARSER_PROCESSES = processes
+    chunker = chunking.TokenChunker()
+
+    async def load_all():
+        chunks = []
+        for path in paths:
+            chunks += await chunker.split_pages(chunking.iter_pages(path, batch=batch, processes=processes))
+        return chunks
+
+    chunks = asyncio.run(load_all())
+    # Reap the parser processes so their peak memory is counted
+    chunking.get_parser_pool().shutdown()
+    return chunks, f"streaming ({processes} processes)"
+
+
+def worker(args):
+    from pypdf import PdfReader
+    # CharacterTextSplitter warns about every oversized chunk
+    logging.getLogger("langchain.text_splitter").setLevel(logging.ERROR)
+    from context_window import count_tokens
+
+    paths = sorted(glob.glob(os.path.join(args.pdfs, "*.pdf")))
+    pages = sum(len(PdfReader(path).pages) for path in paths)
+    started = time.perf_counter()
+    if args.worker == "previous":
+        chunks, name = run_previous(paths)
+    else:
+        chunks, name = run_streaming(paths, args.processes, args.batch)
+    elapsed = time.perf_counter() - started
+
+    peak, children = memory()
+    tokens = [count_tokens(chunk.page_content) for chunk in chunks]
+    # Chunks whose end is not a sentence end cut through a sentence
+    whole = sum(bool(re.search(r"[.!?]\s*$", chunk.page_content)) for chunk in chunks)
+    return {
+        "path": name,
+        "pages": pages,
+        "pages_per_sec": pages / elapsed,
+        "chunks": len(chunks),
+        "tokens_mean": statistics.mean(tokens) if tokens else 0,
+        "tokens_max": max(tokens, default=0),
+        "sentence_ends": whole / len(chunks) if chunks else 0,
+        "peak_mb": peak,
+        "parser_peak_mb": children,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="directory of PDFs to parse instead of the generated fixtures")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=250)
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--batch", type=int, default=8, help="pages per parsing task")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "document_parsing_benchmark"))
+    parser.add_argument("--worker", choices=("previous", "streaming"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+
+    if args.pdfs is None:
+        args.pdfs = args.workdir
+        generate_fixtures(args.workdir, args.documents, args.pages)
+
+    print(f"{'path':<26} {'pages':>6} {'pages/s':>8} {'chunks':>7} {'tokens':>7} {'max':>5} "
+          f"{'sentence ends':>13} {'peak MB':>8} {'parser MB':>9}")
+    for path in ("previous", "streaming"):
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", path, "--pdfs", args.pdfs,
+                                    "--processes", str(args.processes), "--batch", str(args.batch)],
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{result['path']:<26} {result['pages']:>6} {result['pages_per_sec']:>8.1f} {result['chunks']:>7} "
+              f"{result['tokens_mean']:>7.0f} {result['tokens_max']:>5} {result['sentence_ends']:>13.0%} "
+              f"{result['peak_mb']:>8.0f} {result['parser_peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Offline evaluation of lexical, vector and hybrid retrieval on a fixture corpus.
+
+Indexes the chunks of benchmarks/fixtures/retrieval_corpus.json and reports, for
+each retrieval mode, recall@k and MRR over the labelled queries, the latency per
+query (including the query embedding) and the number of embedding calls made.
+
+The default "hashing" embeddings are a local character trigram model, so the
+harness runs without network access. It stands in for a real embedding model
+only roughly. Pass --embeddings openai with OPENAI_API_KEY set to evaluate
+against the embeddings used in production.
+
+    python benchmarks/retrieval_eval.py --k 4
+    python benchmarks/retrieval_eval.py --embeddings openai --alpha 0.6
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hybrid_retrieval import BM25Index, HYBRID_ALPHA, HYBRID_FETCH_K, search_lexically, fuse
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "retrieval_corpus.json")
+
+
+class HashingEmbeddings:
+    """Character trigram counts hashed into a fixed number of dimensions, unit length."""
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                word = f"#{word.strip('.,?!:;()')}#"
+                for i in range(len(word) - 2):
+                    vectors[row, zlib.crc32(word[i:i + 3].encode()) % self.dimensions] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+
+class OpenAIEmbeddingsAdapter:
+    def __init__(self):
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        self.embeddings = OpenAIEmbeddings(openai_api_key=os.environ["OPENAI_API_KEY"])
+
+    def embed(self, texts):
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def evaluate(name, retrieve, queries, k):
+    """Run every query through retrieve, return the mode's metrics."""
+    recalls, reciprocal_ranks, latencies = [], [], []
+    embedding_calls = 0
+    for query in queries:
+        start = time.perf_counter()
+        ids, embedded = retrieve(query["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        embedding_calls += embedded
+
+        relevant = set(query["relevant"])
+        recalls.append(len(relevant & set(ids[:k])) / len(relevant))
+        rank = next((i + 1 for i, chunk_id in enumerate(ids) if chunk_id in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    latencies.sort()
+    return {
+        "mode": name,
+        "recall": statistics.mean(recalls),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "embedding_calls": embedding_calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--alpha", type=float, default=HYBRID_ALPHA, help="weight of the vector score")
+    parser.add_argument("--fetch-k", type=int, default=HYBRID_FETCH_K)
+    parser.add_argument("--embeddings", choices=("hashing", "openai"), default="hashing")
+    args = parser.parse_args()
+
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    ids = [chunk["id"] for chunk in corpus["chunks"]]
+    texts = [chunk["text"] for chunk in corpus["chunks"]]
+    queries = corpus["queries"]
+
+    embeddings = HashingEmbeddings() if args.embeddings == "hashing" else OpenAIEmbeddingsAdapter()
+    matrix = embeddings.embed(texts)
+    index = BM25Index()
+    index.add(ids, texts)
+
+    def similar(query, count):
+        scores = matrix @ embeddings.embed([query])[0]
+        top = np.argsort(-scores)[:count]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def lexical(query):
+        return [chunk_id for chunk_id, _ in index.search(query, args.k)], 0
+
+    def vector(query):
+        return [chunk_id for chunk_id, _ in similar(query, args.k)], 1
+
+    def hybrid(query):
+        # Same routing as VectorDB.retrieve
+        results, sufficient = search_lexically(index, query, args.fetch_k)
+        if sufficient:
+            return [chunk_id for chunk_id, _ in results[:args.k]], 0
+        fused = fuse(results, similar(query, args.fetch_k), k=args.k, alpha=args.alpha)
+        return [chunk_id for chunk_id, _ in fused], 1
+
+    print(f"{len(ids)} chunks, {len(queries)} queries, {args.embeddings} embeddings, k={args.k}, alpha={args.alpha}")
+    for mode, retrieve in (("lexical", lexical), ("vector", vector), ("hybrid", hybrid)):
+        result = evaluate(mode, retrieve, queries, args.k)
+        print(f"{result['mode']:<8} recall@{args.k}={result['recall']:.3f} mrr={result['mrr']:.3f} "
+              f"p50={result['p50']:.3f} ms p95={result['p95']:.3f} ms embedding calls={result['embedding_calls']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Recall, latency and memory of the vector backends on synthetic corpora.
+
+Generates seeded, clustered unit vectors for each corpus size with exact top-k
+neighbours of held-out queries, builds every backend over them, then queries
+each one from a fresh process and reports recall@k, p50/p99 latency per query
+and the resident memory of that process (VmRSS after the queries, VmHWM peak).
+
+The IVF index is measured for each storage type and nprobe. Chroma is measured
+too when chromadb is installed, unless --no-chroma is given. Corpora, ground
+truth and indexes are kept in --workdir between runs, delete it to start over.
+
+    python benchmarks/vector_backends.py
+    python benchmarks/vector_backends.py --sizes 10000,100000,1000000 --nprobe 4,16,64
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+import importlib.util
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from vector_backends import IVFBackend, normalize
+
+_BLOCK = 50000
+
+
+def memory():
+    """Return the current and peak resident memory of this process in MB."""
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+
+
+def prepare(directory, size, dim, queries, k, seed=0):
+    """Write the corpus, the queries and their exact top-k neighbours, unless they already exist."""
+    truth_path = os.path.join(directory, "truth.npy")
+    if os.path.exists(truth_path):
+        return
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.normal(size=(max(64, size // 500), dim)))
+
+    def sample(count):
+        points = centers[rng.integers(0, len(centers), count)] + rng.normal(scale=0.06, size=(count, dim))
+        return normalize(points)
+
+    base = np.lib.format.open_memmap(os.path.join(directory, "base.npy"), mode="w+",
+                                     dtype=np.float32, shape=(size, dim))
+    for start in range(0, size, _BLOCK):
+        base[start:start + _BLOCK] = sample(min(_BLOCK, size - start))
+    query_vectors = sample(queries)
+
+    # Exact neighbours, merging the top k of each block
+    best_scores = np.full((queries, k), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((queries, k), dtype=np.int64)
+    for start in range(0, size, _BLOCK):
+        scores = query_vectors @ base[start:start + _BLOCK].T
+        scores = np.concatenate((best_scores, scores), axis=1)
+        rows = np.concatenate((best_rows, np.broadcast_to(np.arange(start, start + scores.shape[1] - k),
+                                                          (queries, scores.shape[1] - k))), axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_rows = np.take_along_axis(rows, top, axis=1)
+    base.flush()
+    np.save(os.path.join(directory, "queries.npy"), query_vectors)
+    np.save(truth_path, best_rows)
+
+
+def chroma_client(directory):
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=directory,
+                                    anonymized_telemetry=False))
+
+
+def chroma_collection(client, create=False):
+    # Vectors are always passed in, the dummy function keeps Chroma from loading its default model
+    def embedding_function(texts):
+        raise RuntimeError("the benchmark passes its own embeddings")
+    method = client.get_or_create_collection if create else client.get_collection
+    return method("benchmark", embedding_function=embedding_function)
+
+
+def build(args):
+    """Index the corpus into a backend, in this process."""
+    base = np.load(os.path.join(args.data, "base.npy"), mmap_mode="r")
+    started = time.perf_counter()
+    if args.backend == "ivf":
+        backend = IVFBackend(args.index, dtype=args.dtype)
+        add = backend.add
+    else:
+        client = chroma_client(args.index)
+        collection = chroma_collection(client, create=True)
+
+        def add(ids, vectors, documents, metadatas):
+            collection.add(ids=ids, embeddings=vectors.tolist(), documents=documents)
+
+    # Chroma's add is limited in size, keep the batches moderate for both
+    for start in range(0, len(base), 5000):
+        vectors = np.asarray(base[start:start + 5000])
+        add([str(row) for row in range(start, start + len(vectors))], vectors, [""] * len(vectors),
+            [{}] * len(vectors))
+    if args.backend == "chroma":
+        client.persist()
+    return {"build_s": time.perf_counter() - started}
+
+
+def query(args):
+    """Open a built backend in this process and time the queries against it."""
+    queries = np.load(os.path.join(args.data, "queries.npy"))
+    truth = np.load(os.path.join(args.data, "truth.npy"))
+    if args.backend == "ivf":
+        backend = IVFBackend(args.index, nprobe=args.nprobe)
+
+        def search(vector):
+            return [chunk_id for chunk_id, _ in backend.query(vector, args.k)]
+    else:
+        collection = chroma_collection(chroma_client(args.index))
+
+        def search(vector):
+            result = collection.query(query_embeddings=[vector.tolist()], n_results=args.k, include=["distances"])
+            return result["ids"][0]
+
+    # Warm up, the first queries page in the index
+    for vector in queries[:10]:
+        search(vector)
+
+    latencies, recalls = [], []
+    for vector, exact in zip(queries, truth):
+        started = time.perf_counter()
+        ids = search(vector)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({str(row) for row in exact} & set(ids)) / args.k)
+
+    latencies.sort()
+    rss, peak = memory()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        "rss_mb": rss,
+        "peak_mb": peak,
+    }
+
+
+def run_worker(*worker_args):
+    """Run a build or query step in a fresh interpreter, so its memory is measured alone."""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", *worker_args],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtypes", default="float16,int8")
+    parser.add_argument("--nprobe", default="4,8,16,32", help="comma separated nprobe values of the IVF index")
+    parser.add_argument("--no-chroma", action="store_true")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "vector_backends_benchmark"))
+    # Internal, one step run by a worker process
+    parser.add_argument("--worker", choices=("build", "query"), help=argparse.SUPPRESS)
+    parser.add_argument("--backend", choices=("ivf", "chroma"), help=argparse.SUPPRESS)
+    parser.add_argument("--dtype", default="float16", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        if args.worker == "query":
+            args.nprobe = int(args.nprobe)
+        print(json.dumps(build(args) if args.worker == "build" else query(args)))
+        return
+
+    configs = [("ivf", dtype) for dtype in args.dtypes.split(",")]
+    if not args.no_chroma:
+        if importlib.util.find_spec("chromadb") is not None:
+            configs.append(("chroma", "float32"))
+        else:
+            print("chromadb is not installed, skipping the Chroma backend")
+
+    print(f"{'size':>8} {'backend':<8} {'dtype':<8} {'nprobe':>6} {'build s':>8} {'recall@' + str(args.k):>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'rss MB':>8} {'peak MB':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        data = os.path.join(args.workdir, f"{size}x{args.dim}")
+        prepare(data, size, args.dim, args.queries, args.k)
+        common = ["--data", data, "--k", str(args.k)]
+
+        for backend, dtype in configs:
+            index = os.path.join(data, f"{backend}-{dtype}")
+            built = {"build_s": float("nan")}
+            if not os.path.exists(index):
+                built = run_worker("build", "--backend", backend, "--dtype", dtype, "--index", index, *common)
+                if built is None:
+                    continue
+
+            for nprobe in args.nprobe.split(",") if backend == "ivf" else ["-"]:
+                result = run_worker("query", "--backend", backend, "--index", index,
+                                    "--nprobe", nprobe if nprobe != "-" else "0", *common)
+                if result is None:
+                    continue
+                print(f"{size:>8} {backend:<8} {dtype:<8} {nprobe:>6} {built['build_s']:>8.1f} "
+                      f"{result['recall']:>9.3f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+                      f"{result['rss_mb']:>8.0f} {result['peak_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
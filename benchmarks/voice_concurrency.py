@@ -0,0 +1,78 @@
+"""
+Concurrency check of the voice message ingest path.
+
+Runs many simultaneous voice notes through audio.transcribe with a fake
+transcriber that returns a digest of the bytes it received, and fails if any
+note got another note's audio. With --transcode WAV is treated as a format
+Whisper does not accept, so the notes go through the process pool (needs ffmpeg).
+
+    python benchmarks/voice_concurrency.py --notes 50
+"""
+import io
+import os
+import sys
+import time
+import wave
+import asyncio
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio
+
+
+class FakePrompter:
+    """Stands in for Prompter.transcribe_voice without calling the API."""
+
+    async def transcribe_voice(self, file):
+        data = file.read()
+        # Yield so the notes interleave like real network calls
+        await asyncio.sleep(0.01)
+        return hashlib.sha256(data).hexdigest()
+
+
+def make_note(index):
+    """Return a short, unique WAV note."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as note:
+        note.setnchannels(1)
+        note.setsampwidth(2)
+        note.setframerate(8000)
+        note.writeframes(index.to_bytes(2, "little") * 800)
+    return buffer.getvalue()
+
+
+async def run(notes, transcode):
+    prompter = FakePrompter()
+    data = [make_note(i) for i in range(notes)]
+    file_name = "voice.wav"
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(audio.transcribe(prompter, note, file_name) for note in data))
+    elapsed = time.perf_counter() - started
+
+    if transcode:
+        # Transcoded bytes differ from the input, they only have to be distinct per note
+        mismatches = notes - len(set(results))
+    else:
+        mismatches = sum(result != hashlib.sha256(note).hexdigest() for note, result in zip(data, results))
+
+    print(f"{notes} notes in {elapsed * 1000:.0f} ms, {mismatches} mismatched")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=50, help="number of simultaneous voice notes")
+    parser.add_argument("--transcode", action="store_true", help="force the notes through the transcode pool")
+    args = parser.parse_args()
+
+    if args.transcode:
+        audio.WHISPER_FORMATS.discard("wav")
+
+    sys.exit(1 if asyncio.run(run(args.notes, args.transcode)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of the WhatsApp webhook parsers on large, multi-entry payloads.
+
+Builds a batched payload out of the recorded message payloads and compares
+WhatsAppWrapper.process_webhook_data with whatsapp_messages.parse_webhook,
+reporting parse time and the peak memory allocated for the parsed messages.
+
+    python benchmarks/whatsapp_parser.py --entries 1000 --rounds 20
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "bot_template"))
+
+from whatsapp_wrapper import WhatsAppWrapper
+from whatsapp_messages import parse_webhook
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "whatsapp_webhooks.json")
+
+
+def build_payload(entries):
+    """Return one payload with the given number of entries made of the recorded messages."""
+    with open(FIXTURES) as f:
+        recorded = [entry for payload in json.load(f) for entry in payload["entry"]
+                    if all("messages" in change["value"] for change in entry["changes"])]
+
+    payload = {"object": "whatsapp_business_account", "entry": []}
+    for i in range(entries):
+        entry = copy.deepcopy(recorded[i % len(recorded)])
+        for change in entry["changes"]:
+            for message in change["value"]["messages"]:
+                message["id"] = f"{message['id']}.{i}"
+        payload["entry"].append(entry)
+    return payload
+
+
+def measure(func, payload, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def peak_memory(func, payload):
+    """Return the peak bytes allocated while parsing and holding the result."""
+    tracemalloc.start()
+    result = func(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = build_payload(args.entries)
+    wrapper = WhatsAppWrapper.__new__(WhatsAppWrapper)
+
+    for name, func in (("dicts", wrapper.process_webhook_data), ("typed", lambda p: list(parse_webhook(p)))):
+        timings = measure(func, payload, args.rounds)
+        print(f"{name:<6} {args.entries} entries: median={statistics.median(timings):8.3f} ms "
+              f"min={min(timings):8.3f} ms peak={peak_memory(func, payload) / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Load generator that replays recorded WhatsApp webhook payloads against a running server.
+
+Each replay rewrites the message ids so the dispatcher does not drop them as
+duplicates, unless --keep-ids is given. Reports requests/sec and the
+acknowledgement latency percentiles.
+
+    python app/whatsapp_bot.py &
+    python benchmarks/whatsapp_webhook_load.py --url http://127.0.0.1:8000/webhook --requests 5000
+"""
+import os
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "whatsapp_webhooks.json")
+
+
+def load_payloads(path):
+    """Load a JSON list of payloads, or one payload per line."""
+    with open(path) as f:
+        text = f.read()
+    try:
+        payloads = json.loads(text)
+        return payloads if isinstance(payloads, list) else [payloads]
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def with_unique_ids(payload, replay):
+    """Return a copy of the payload whose message ids are unique to this replay."""
+    payload = copy.deepcopy(payload)
+    for entry in payload.get("entry", ()):
+        for change in entry.get("changes", ()):
+            for message in change.get("value", {}).get("messages", ()):
+                message["id"] = f"{message['id']}.{replay}"
+    return payload
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(url, payloads, requests, concurrency, keep_ids):
+    bodies = [
+        json.dumps(payload if keep_ids else with_unique_ids(payload, i)).encode()
+        for i, payload in ((i, payloads[i % len(payloads)]) for i in range(requests))
+    ]
+    latencies = []
+    errors = 0
+    next_body = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, headers={"Content-Type": "application/json"}) as client:
+
+        async def worker():
+            nonlocal next_body, errors
+            while next_body < len(bodies):
+                body = bodies[next_body]
+                next_body += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, content=body)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{requests} requests in {elapsed:.2f}s, {requests / elapsed:.0f} req/s, {errors} errors")
+    print(f"latency p50={statistics.median(latencies):.2f} ms "
+          f"p99={percentile(latencies, 0.99):.2f} ms max={max(latencies):.2f} ms")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/webhook")
+    parser.add_argument("--payloads", default=FIXTURES, help="recorded payloads, JSON list or JSON lines")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--keep-ids", action="store_true", help="replay the original message ids")
+    args = parser.parse_args()
+
+    errors = asyncio.run(run(args.url, load_payloads(args.payloads), args.requests, args.concurrency, args.keep_ids))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
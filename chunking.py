@@ -0,0 +1,167 @@
+"""
+Streaming document parsing on a process pool, and token-based chunking along headings and paragraphs.
+"""
+
+import os
+import re
+import logging
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from context_window import count_tokens
+
+# Chunking defaults, in tokens of the embedding model's tokenizer
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 400))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 50))
+# Parsing defaults, PDF pages are parsed in batches of PARSE_PAGE_BATCH on PARSER_PROCESSES processes
+PARSER_PROCESSES = int(os.environ.get("PARSER_PROCESSES", min(4, os.cpu_count() or 1)))
+PARSE_PAGE_BATCH = int(os.environ.get("PARSE_PAGE_BATCH", 8))
+
+# Headings and paragraphs first, then lines, sentences and words
+SEPARATORS = ["\n\n\n", "\n\n", "\n", ". ", " ", ""]
+
+# Markdown headings and numbered section titles such as "2.3 Results"
+_HEADING = re.compile(r"\n+(?=#{1,6} |\d+(?:\.\d+)* [A-Z][^\n]{0,80}\n)")
+
+logger = logging.getLogger(__name__)
+
+def _pdf_reader():
+    """Return the PdfReader class, or None when pypdf is not installed."""
+    try:
+        from pypdf import PdfReader
+        return PdfReader
+    except ImportError:
+        return None
+
+
+def _count_pages(path):
+    return len(_pdf_reader()(path).pages)
+
+
+def _extract_pages(path, start, end):
+    """Return the text of pages start to end of a PDF, run on a pool process."""
+    pages = _pdf_reader()(path).pages
+    return [(pages[number].extract_text() or "", {"source": path, "page": number + 1})
+            for number in range(start, end)]
+
+
+def _partition(path):
+    """Return the text of a whole file parsed by unstructured, run on a pool process."""
+    from langchain.document_loaders import UnstructuredFileLoader
+    return [(doc.page_content, doc.metadata) for doc in UnstructuredFileLoader(path).load()]
+
+
+_pool = None
+
+def get_parser_pool():
+    """Return the process pool parsing documents, creating it on first use."""
+    global _pool
+    if _pool is None:
+        # Spawned, forking the threads of the bot process is not safe
+        _pool = ProcessPoolExecutor(max_workers=PARSER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def iter_pages(path, batch=PARSE_PAGE_BATCH, processes=PARSER_PROCESSES):
+    """
+    Yield the pages of a document as (text, metadata) in order, parsing them on the process pool.
+
+    PDFs are parsed a batch of pages per task with a bounded number of batches in flight, so
+    only those pages are held at once. Other files, and PDFs without pypdf, are parsed whole.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_parser_pool()
+
+    if not path.lower().endswith(".pdf") or _pdf_reader() is None:
+        for page in await loop.run_in_executor(pool, _partition, path):
+            yield page
+        return
+
+    count = await loop.run_in_executor(pool, _count_pages, path)
+    ranges = iter([(start, min(start + batch, count)) for start in range(0, count, batch)])
+    pending = deque()
+    for start, end in ranges:
+        pending.append(loop.run_in_executor(pool, _extract_pages, path, start, end))
+        if len(pending) >= 2 * processes:
+            break
+
+    try:
+        while pending:
+            pages = await pending.popleft()
+            following = next(ranges, None)
+            if following is not None:
+                pending.append(loop.run_in_executor(pool, _extract_pages, path, *following))
+            for page in pages:
+                yield page
+    finally:
+        # The consumer stopped early, do not leave the remaining batches running
+        for future in pending:
+            future.cancel()
+
+
+def mark_headings(text):
+    """Put a blank line pair before each heading, so the splitter cuts there before paragraphs."""
+    return _HEADING.sub("\n\n\n", text)
+
+
+class TokenChunker():
+    """
+    Splits page texts into chunks of at most chunk_tokens tokens, overlapping by overlap_tokens,
+    cutting at headings, then paragraphs, lines, sentences and words.
+
+    The short last piece of a page is carried over to the next one, so a paragraph running across
+    a page break stays in one chunk.
+    """
+
+    def __init__(self, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.chunk_tokens = chunk_tokens
+        self.splitter = RecursiveCharacterTextSplitter(
+            separators=SEPARATORS, chunk_size=chunk_tokens, chunk_overlap=overlap_tokens,
+            length_function=count_tokens)
+
+    def split_text(self, text):
+        return self.splitter.split_text(mark_headings(text))
+
+    def split_documents(self, documents):
+        """Split whole documents, e.g. fetched web pages. Blocking, run it on an executor from async code."""
+        from langchain.schema import Document
+        return [Document(page_content=chunk, metadata=dict(doc.metadata))
+                for doc in documents for chunk in self.split_text(doc.page_content)]
+
+    def _split_page(self, text):
+        """Split a page and return its pieces and whether the last one is short enough to carry over."""
+        pieces = self.split_text(text)
+        return pieces, bool(pieces) and count_tokens(pieces[-1]) < self.chunk_tokens // 2
+
+    async def split_pages(self, pages):
+        """
+        Return the chunks of a stream of (text, metadata) pages as Documents.
+
+        Counting tokens and splitting run on the default executor, so a large document does not
+        hold up the event loop serving the other chats.
+        """
+        from langchain.schema import Document
+        loop = asyncio.get_running_loop()
+        chunks = []
+        carry, carry_metadata = "", None
+        async for text, metadata in pages:
+            # The first chunk starts on the page the carried text came from
+            first_metadata = carry_metadata if carry else metadata
+            if carry:
+                text = f"{carry}\n{text}"
+            pieces, short_tail = await loop.run_in_executor(None, self._split_page, text)
+            carry, carry_metadata = "", None
+            if short_tail:
+                carry, carry_metadata = pieces.pop(), first_metadata if len(pieces) == 0 else metadata
+            chunks.extend(Document(page_content=piece, metadata=dict(first_metadata if i == 0 else metadata))
+                          for i, piece in enumerate(pieces))
+        if carry:
+            chunks.append(Document(page_content=carry, metadata=dict(carry_metadata)))
+        return chunks
+
+    async def load(self, path):
+        """Parse a document on the process pool and return its chunks."""
+        return await self.split_pages(iter_pages(path))
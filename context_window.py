@@ -0,0 +1,117 @@
+"""
+Token-budgeted chat history window with a rolling summary of the turns that fell out of it.
+"""
+
+import os
+import hashlib
+import logging
+
+from cachetools import LRUCache
+
+# Window defaults
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1000))
+CONTEXT_MAX_CHATS = int(os.environ.get("CONTEXT_MAX_CHATS", 10000))
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "cl100k_base")
+
+SUMMARY_PROMPT = """Progressively summarize the conversation, adding onto the previous summary and returning a new summary.
+Keep names, facts, numbers and open questions, drop small talk.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{turns}
+
+New summary:"""
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+def count_tokens(text):
+    """Count the tokens of a text with the local tokenizer, roughly when tiktoken is not installed."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except ImportError:
+            _encoding = False
+            logger.warning("tiktoken is not installed, token counts are estimated")
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def format_turns(turns):
+    """Format turns the way the agent expects its chat history."""
+    return "\n".join([f"{k}: {v}" for entry in turns for k, v in entry.items()])
+
+
+def _fingerprint(turn):
+    return hashlib.sha256(format_turns([turn]).encode("utf-8")).hexdigest()
+
+
+class ContextWindow():
+    """Keeps the latest turns verbatim within a token budget and folds older turns into a summary."""
+
+    def __init__(self, llm, token_budget=CONTEXT_TOKEN_BUDGET, max_chats=CONTEXT_MAX_CHATS):
+        # Imported here so the conversation stores can count tokens without loading LangChain
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+
+        self.token_budget = token_budget
+        self.chain = LLMChain(llm=llm, prompt=PromptTemplate(template=SUMMARY_PROMPT,
+                                                             input_variables=["summary", "turns"]))
+
+        # chat id -> (fingerprint of the last folded turn, summary)
+        self._summaries = LRUCache(maxsize=max_chats)
+
+    def split(self, turns):
+        """Split the turns into the older ones and the most recent ones that fit in the budget."""
+        used = 0
+        start = len(turns)
+        while start > 0:
+            tokens = count_tokens(format_turns([turns[start - 1]]))
+            if used + tokens > self.token_budget:
+                break
+            used += tokens
+            start -= 1
+        return turns[:start], turns[start:]
+
+    async def _summarize(self, chat_id, older):
+        """Return the running summary of the older turns, only folding turns it has not seen yet."""
+        if not older:
+            return ""
+
+        fingerprints = [_fingerprint(turn) for turn in older]
+        last_folded, summary = self._summaries.get(chat_id, (None, ""))
+
+        # Turns after the last folded one are new, all of them are when it was trimmed from the history
+        if last_folded in fingerprints:
+            new_turns = older[fingerprints.index(last_folded) + 1:]
+        else:
+            new_turns = older
+
+        if new_turns:
+            try:
+                summary = await self.chain.arun(summary=summary or "(none)", turns=format_turns(new_turns))
+            except Exception as e:
+                # Keep the previous summary, the turns are folded on the next message
+                logger.error(f"Error summarizing chat history: {e}")
+                return summary
+            self._summaries[chat_id] = (fingerprints[-1], summary)
+            logger.info(f"Folded {len(new_turns)} turns into the summary of chat {chat_id}")
+
+        return summary
+
+    async def build(self, chat_id, turns):
+        """Return the chat history to put in the prompt and its token count."""
+        older, recent = self.split(list(turns))
+        summary = await self._summarize(chat_id, older)
+
+        history = format_turns(recent)
+        if summary:
+            history = f"Summary of the earlier conversation:\n{summary}\n\n{history}"
+
+        return history, count_tokens(history)
@@ -0,0 +1,211 @@
+"""
+Conversation history stores: an in-memory LRU and SQLite or Redis backends shared across processes.
+"""
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+from context_window import count_tokens
+
+# Store defaults
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "memory")
+CONVERSATION_MAX_CHATS = int(os.environ.get("CONVERSATION_MAX_CHATS", 10000))
+CONVERSATION_MAX_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", 20))
+CONVERSATION_MAX_TOKENS = int(os.environ.get("CONVERSATION_MAX_TOKENS", 2000))
+CONVERSATION_TTL = int(os.environ.get("CONVERSATION_TTL", 7 * 24 * 3600))
+CONVERSATION_SQLITE_PATH = os.environ.get("CONVERSATION_SQLITE_PATH", os.path.join("db", "conversations.sqlite"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+logger = logging.getLogger(__name__)
+
+def make_turn(human, ai):
+    """Return a turn in the format expected by Prompter.generate_response."""
+    return {"Human": human, "AI": ai}
+
+
+def turn_tokens(turn):
+    return count_tokens(turn["Human"]) + count_tokens(turn["AI"])
+
+
+class ConversationStore(ABC):
+    """Keeps a bounded ring buffer of turns for every chat."""
+
+    def __init__(self, max_turns=CONVERSATION_MAX_TURNS, max_tokens=CONVERSATION_MAX_TOKENS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+
+    def _trim(self, turns):
+        """Drop the oldest turns past the turn limit or the token budget, keeping the latest one."""
+        while len(turns) > self.max_turns:
+            turns.popleft()
+        total = sum(turn_tokens(turn) for turn in turns)
+        while len(turns) > 1 and total > self.max_tokens:
+            total -= turn_tokens(turns.popleft())
+        return turns
+
+    @abstractmethod
+    async def get(self, chat_id):
+        """
+        Return the turns of a chat, oldest first.
+
+        :param chat_id: The unique identifier of the chat.
+        """
+        pass
+
+    @abstractmethod
+    async def append(self, chat_id, human, ai):
+        """
+        Add a turn to a chat and trim its history.
+
+        :param chat_id: The unique identifier of the chat.
+        :param human: The user message.
+        :param ai: The assistant response.
+        """
+        pass
+
+    @abstractmethod
+    async def clear(self, chat_id):
+        """
+        Forget the history of a chat.
+
+        :param chat_id: The unique identifier of the chat.
+        """
+        pass
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Process-local store, the least recently active chats are dropped past max_chats."""
+
+    def __init__(self, max_chats=CONVERSATION_MAX_CHATS, **kwargs):
+        super().__init__(**kwargs)
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+
+    async def get(self, chat_id):
+        turns = self._chats.get(chat_id)
+        if turns is None:
+            return []
+        self._chats.move_to_end(chat_id)
+        return list(turns)
+
+    async def append(self, chat_id, human, ai):
+        turns = self._chats.setdefault(chat_id, deque())
+        self._chats.move_to_end(chat_id)
+        turns.append(make_turn(human, ai))
+        self._trim(turns)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    async def clear(self, chat_id):
+        self._chats.pop(chat_id, None)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Local SQLite store that survives restarts and is shared by the workers on one host."""
+
+    def __init__(self, path=CONVERSATION_SQLITE_PATH, ttl=CONVERSATION_TTL, **kwargs):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, "
+                "human TEXT NOT NULL, ai TEXT NOT NULL, created REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS turns_chat_id ON turns (chat_id, id)")
+
+    def _load(self, chat_id):
+        rows = self._conn.execute(
+            "SELECT id, human, ai FROM turns WHERE chat_id = ? AND created > ? ORDER BY id",
+            (str(chat_id), time.time() - self.ttl))
+        return deque((row_id, make_turn(human, ai)) for row_id, human, ai in rows)
+
+    def _get(self, chat_id):
+        with self._lock:
+            return [turn for _, turn in self._load(chat_id)]
+
+    def _append(self, chat_id, human, ai):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO turns (chat_id, human, ai, created) VALUES (?, ?, ?, ?)",
+                               (str(chat_id), human, ai, time.time()))
+
+            # Trim the ring buffer, expired turns go with it
+            rows = self._load(chat_id)
+            turns = self._trim(deque(turn for _, turn in rows))
+            keep_from = rows[len(rows) - len(turns)][0]
+            self._conn.execute("DELETE FROM turns WHERE chat_id = ? AND id < ?", (str(chat_id), keep_from))
+
+    def _clear(self, chat_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM turns WHERE chat_id = ?", (str(chat_id),))
+
+    async def get(self, chat_id):
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, chat_id)
+
+    async def append(self, chat_id, human, ai):
+        await asyncio.get_running_loop().run_in_executor(None, self._append, chat_id, human, ai)
+
+    async def clear(self, chat_id):
+        await asyncio.get_running_loop().run_in_executor(None, self._clear, chat_id)
+
+
+class RedisConversationStore(ConversationStore):
+    """Redis store shared by bot workers on any host, idle chats expire after ttl seconds."""
+
+    def __init__(self, url=REDIS_URL, ttl=CONVERSATION_TTL, **kwargs):
+        super().__init__(**kwargs)
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self.redis = redis.from_url(url)
+
+    @staticmethod
+    def _key(chat_id):
+        return f"conversation:{chat_id}"
+
+    async def get(self, chat_id):
+        items = await self.redis.lrange(self._key(chat_id), 0, -1)
+        return [json.loads(item) for item in items]
+
+    async def append(self, chat_id, human, ai):
+        key = self._key(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, json.dumps(make_turn(human, ai)))
+            pipe.ltrim(key, -self.max_turns, -1)
+            pipe.expire(key, self.ttl)
+            pipe.lrange(key, 0, -1)
+            *_, items = await pipe.execute()
+
+        # Drop the oldest turns past the token budget
+        turns = [json.loads(item) for item in items]
+        excess = len(turns) - len(self._trim(deque(turns)))
+        if excess:
+            await self.redis.ltrim(key, excess, -1)
+
+    async def clear(self, chat_id):
+        await self.redis.delete(self._key(chat_id))
+
+
+def create_conversation_store(backend=CONVERSATION_STORE):
+    """Create the conversation store selected by the CONVERSATION_STORE setting."""
+    if backend == "memory":
+        return InMemoryConversationStore()
+    if backend == "sqlite":
+        return SQLiteConversationStore()
+    if backend == "redis":
+        return RedisConversationStore()
+    raise ValueError(f"Unknown conversation store: {backend}")
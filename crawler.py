@@ -0,0 +1,334 @@
+"""
+Concurrent web page ingestion: several URLs, sitemaps or a depth-limited crawl of a site, fetched
+over a pooled HTTP client with conditional requests and near-duplicate filtering.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import asyncio
+import threading
+from collections import Counter
+from urllib.parse import urljoin, urldefrag, urlparse
+
+# Crawl defaults
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", 8))
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", 50))
+# Links followed from the given pages by /crawl, 0 only fetches the pages themselves
+CRAWL_MAX_DEPTH = int(os.environ.get("CRAWL_MAX_DEPTH", 1))
+CRAWL_TIMEOUT = float(os.environ.get("CRAWL_TIMEOUT", 15))
+CRAWL_MAX_BYTES = int(os.environ.get("CRAWL_MAX_BYTES", 5 * 1024 * 1024))
+CRAWL_USER_AGENT = os.environ.get("CRAWL_USER_AGENT", "Mozilla/5.0 (compatible; DocumentBot/1.0)")
+# Validators and fingerprints of the fetched pages, per collection
+CRAWL_STATE_PATH = os.environ.get("CRAWL_STATE_PATH", os.path.join("db", "crawl_state.sqlite"))
+# Pages whose 64-bit simhashes differ in at most this many bits are near duplicates
+SIMHASH_MAX_DISTANCE = int(os.environ.get("SIMHASH_MAX_DISTANCE", 3))
+
+# URLs anywhere in a message, without the punctuation that usually follows them
+URL_PATTERN = re.compile(r"https?://[^\s<>\"'`]+")
+_TRAILING = ".,;:!?)]}'\""
+_WORD = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+def find_urls(text):
+    """Return the distinct URLs of a text, in order."""
+    urls = [url.rstrip(_TRAILING) for url in URL_PATTERN.findall(text)]
+    return list(dict.fromkeys(url for url in urls if urlparse(url).netloc))
+
+
+def remove_urls(text):
+    """Return the text without its URLs and the punctuation left around them."""
+    return " ".join(word for word in URL_PATTERN.sub(" ", text).split() if _WORD.search(word))
+
+
+def simhash(text):
+    """Return the 64-bit simhash of the word 3-shingles of a text."""
+    words = _WORD.findall(text.lower())
+    shingles = Counter(" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2)))
+    weights = [0] * 64
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def parse_html(html, url):
+    """Return the title, the visible text and the absolute links of an HTML page."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        link = urldefrag(urljoin(url, anchor["href"]))[0]
+        if link.startswith(("http://", "https://")):
+            links.append(link)
+    for element in soup(["script", "style", "noscript", "template"]):
+        element.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    # Keep the block structure, the splitter cuts at blank lines
+    lines = [line.strip() for line in soup.get_text("\n").splitlines()]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return title, text, links
+
+
+def parse_sitemap(body):
+    """Return the page URLs of a sitemap and the sitemap URLs of a sitemap index."""
+    import xml.etree.ElementTree as ElementTree
+    root = ElementTree.fromstring(body)
+    locations = [element.text.strip() for element in root.iter() if element.tag.endswith("loc") and element.text]
+    if root.tag.endswith("sitemapindex"):
+        return [], locations
+    return locations, []
+
+
+def _is_sitemap(body):
+    head = body[:2048]
+    return b"<urlset" in head or b"<sitemapindex" in head
+
+
+class CrawlState():
+    """SQLite store of the validators, simhash and links of the pages ingested into each collection."""
+
+    def __init__(self, path=CRAWL_STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by the executor threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (collection TEXT NOT NULL, url TEXT NOT NULL, etag TEXT, "
+                "last_modified TEXT, simhash INTEGER NOT NULL, links TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (collection, url))")
+
+    def pages(self, collection):
+        """Return {url: (etag, last modified, simhash, links)} of a collection."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, etag, last_modified, simhash, links FROM pages WHERE collection = ?", (collection,))
+            # Stored signed, SQLite integers are 64-bit signed
+            return {url: (etag, last_modified, fingerprint % (1 << 64), links.split())
+                    for url, etag, last_modified, fingerprint, links in rows}
+
+    def record(self, collection, pages):
+        """
+        Remember the validators of ingested pages, so unchanged pages are skipped next time.
+
+        :param collection: The collection the pages were ingested into.
+        :param pages: {url: (etag, last modified, simhash, links)} of the pages.
+        """
+        now = time.time()
+        rows = [(collection, url, etag, last_modified,
+                 fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint, "\n".join(links), now)
+                for url, (etag, last_modified, fingerprint, links) in pages.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (collection, url, etag, last_modified, simhash, links, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def forget(self, collection, url=None):
+        """Drop the pages of a collection, e.g. after it is cleared, or a single page of it."""
+        with self._lock, self._conn:
+            if url is None:
+                self._conn.execute("DELETE FROM pages WHERE collection = ?", (collection,))
+            else:
+                self._conn.execute("DELETE FROM pages WHERE collection = ? AND url = ?", (collection, url))
+
+
+_state = None
+
+def get_crawl_state():
+    """Return the process-wide crawl state, opening it on first use."""
+    global _state
+    if _state is None:
+        _state = CrawlState()
+    return _state
+
+
+_client = None
+
+def get_http_client():
+    """Return the process-wide HTTP client, its connections are reused across crawls."""
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=CRAWL_TIMEOUT,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            limits=httpx.Limits(max_connections=4 * CRAWL_CONCURRENCY, max_keepalive_connections=CRAWL_CONCURRENCY))
+    return _client
+
+async def close_http_client():
+    """Close the pooled connections, if the client was created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class Crawler():
+    """
+    Fetches pages for one collection, breadth first from the given URLs.
+
+    Links are only followed on the host of the page they were found on, sitemaps are expanded
+    without counting as a level. Pages unchanged since they were ingested answer 304 and are
+    skipped, their links are taken from the crawl state, and pages nearly identical to another
+    page of the collection are dropped.
+    """
+
+    def __init__(self, collection, state=None, client=None, concurrency=CRAWL_CONCURRENCY,
+                 max_pages=CRAWL_MAX_PAGES, max_distance=SIMHASH_MAX_DISTANCE):
+        self.logger = logging.getLogger(__name__)
+        self.collection = collection
+        self.state = state or get_crawl_state()
+        self.client = client or get_http_client()
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.max_distance = max_distance
+        self.stats = Counter()
+        # url -> (etag, last modified, simhash, links) of the pages returned by crawl, see commit
+        self.pages = {}
+
+    async def crawl(self, urls, max_depth=0):
+        """Return the new and changed pages reachable from the URLs as Documents."""
+        from langchain.schema import Document
+
+        loop = asyncio.get_running_loop()
+        known = await loop.run_in_executor(None, self.state.pages, self.collection)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        seen = set()
+        documents = []
+        # Fingerprints of the pages kept so far, and of the stored pages this crawl does not replace
+        fingerprints = {url: entry[2] for url, entry in known.items()}
+
+        async def visit(url):
+            async with semaphore:
+                return await self._fetch(url, known.get(url))
+
+        frontier = list(dict.fromkeys(urls))
+        depth = 0
+        while frontier and len(seen) < self.max_pages:
+            frontier = [url for url in frontier if url not in seen][:self.max_pages - len(seen)]
+            seen.update(frontier)
+            results = await asyncio.gather(*(visit(url) for url in frontier))
+
+            following = []
+            listed = []
+            for url, result in zip(frontier, results):
+                if result is None:
+                    continue
+                kind, payload = result
+                if kind == "sitemap":
+                    # The pages of a sitemap are on the same level as the sitemap
+                    pages, sitemaps = payload
+                    listed.extend(pages + sitemaps)
+                    continue
+                links = payload if kind == "unchanged" else payload[2]
+                if depth < max_depth:
+                    host = urlparse(url).netloc
+                    following.extend(link for link in links if urlparse(link).netloc == host)
+                if kind == "unchanged":
+                    continue
+
+                title, text, links, etag, last_modified = payload
+                fingerprint = await loop.run_in_executor(None, simhash, text)
+                duplicate = next((other for other, value in fingerprints.items()
+                                  if other != url and hamming_distance(value, fingerprint) <= self.max_distance), None)
+                if duplicate is not None:
+                    self.stats["duplicate"] += 1
+                    self.logger.info(f"Skipped {url}, a near duplicate of {duplicate}")
+                    continue
+                fingerprints[url] = fingerprint
+                self.pages[url] = (etag, last_modified, fingerprint, links)
+                documents.append(Document(page_content=text, metadata={"source": url, "title": title}))
+
+            # The pages listed by sitemaps are fetched before moving a level down
+            listed = [url for url in dict.fromkeys(listed) if url not in seen]
+            if listed:
+                frontier = listed
+                continue
+            frontier = list(dict.fromkeys(following))
+            depth += 1
+
+        self.logger.info(f"Crawled {len(seen)} URLs for {self.collection}: {dict(self.stats)}")
+        return documents
+
+    async def commit(self):
+        """Record the crawled pages once they are stored, a failed ingestion fetches them again."""
+        await asyncio.get_running_loop().run_in_executor(None, self.state.record, self.collection, self.pages)
+
+    async def _fetch(self, url, known):
+        """
+        Return ("page", (title, text, links, etag, last modified)), ("sitemap", (pages, sitemaps)),
+        ("unchanged", links) or None when the URL gave nothing to ingest.
+        """
+        headers = {}
+        if known is not None:
+            etag, last_modified, _, _ = known
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and known is not None:
+                    self.stats["unchanged"] += 1
+                    return "unchanged", known[3]
+                if response.status_code != 200:
+                    self.stats["failed"] += 1
+                    self.logger.warning(f"Fetching {url} returned {response.status_code}")
+                    return None
+
+                body = bytearray()
+                async for data in response.aiter_bytes():
+                    body += data
+                    if len(body) > CRAWL_MAX_BYTES:
+                        self.stats["too_large"] += 1
+                        self.logger.warning(f"Skipped {url}, larger than {CRAWL_MAX_BYTES} bytes")
+                        return None
+                content_type = response.headers.get("content-type", "")
+                etag = response.headers.get("etag")
+                last_modified = response.headers.get("last-modified")
+                encoding = response.encoding or "utf-8"
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.logger.error(f"Error fetching {url}: {e}")
+            return None
+
+        loop = asyncio.get_running_loop()
+        body = bytes(body)
+        try:
+            if _is_sitemap(body):
+                self.stats["sitemap"] += 1
+                return "sitemap", await loop.run_in_executor(None, parse_sitemap, body)
+            if "html" in content_type:
+                title, text, links = await loop.run_in_executor(
+                    None, parse_html, body.decode(encoding, errors="replace"), url)
+            elif content_type.startswith("text/"):
+                title, text, links = "", body.decode(encoding, errors="replace"), []
+            else:
+                self.stats["unsupported"] += 1
+                return None
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.logger.error(f"Error parsing {url}: {e}")
+            return None
+
+        if not text.strip():
+            self.stats["empty"] += 1
+            return None
+        self.stats["fetched"] += 1
+        return "page", (title, text, links, etag, last_modified)
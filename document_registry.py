@@ -0,0 +1,225 @@
+"""
+Registry of the documents ingested into each collection: their content hash, version and chunks.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+# Registry defaults
+DOCUMENT_REGISTRY_PATH = os.environ.get("DOCUMENT_REGISTRY_PATH", os.path.join("db", "document_registry.sqlite"))
+
+logger = logging.getLogger(__name__)
+
+def text_hash(text):
+    """Return the content hash of a text, e.g. a chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """Return the content hash of a file, read a block at a time."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentRegistry():
+    """
+    SQLite-backed registry of the documents of each collection, keyed by their source.
+
+    A document is a file name or a URL. Its chunks are recorded with their ids in the vector
+    backend and the hash of their text, so a new version of the document only has to add the
+    chunks that changed and delete the ones that are gone.
+
+    Changes can be deferred for vector stores that only reach the disk at checkpoints. They are
+    kept in memory, visible to the reads, and written by flush() once the checkpoint that persists
+    them is done, so after a crash the registry never describes chunks the store lost.
+    """
+
+    def __init__(self, path=DOCUMENT_REGISTRY_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by the executor threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents (collection TEXT NOT NULL, source TEXT NOT NULL, "
+                "content_hash TEXT NOT NULL, version INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (collection, source))")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (collection TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                "source TEXT NOT NULL, chunk_hash TEXT NOT NULL, PRIMARY KEY (collection, chunk_id))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (collection, source)")
+
+        # Deferred changes in order as (sequence, write method, arguments)
+        self._pending = []
+        self._sequence = 0
+        # (collection, source) -> (sequence, None when removed or (content hash, version, updated at, chunks))
+        self._staged = {}
+        # collection -> sequence of its deferred forget
+        self._forgotten = {}
+
+    def _stored(self, collection, source):
+        """Return (content hash, version, updated at, [(chunk id, chunk hash)]) of a document in SQLite."""
+        row = self._conn.execute("SELECT content_hash, version, updated_at FROM documents "
+                                 "WHERE collection = ? AND source = ?", (collection, source)).fetchone()
+        if row is None:
+            return None
+        chunks = self._conn.execute("SELECT chunk_id, chunk_hash FROM chunks WHERE collection = ? AND source = ?",
+                                    (collection, source)).fetchall()
+        return row + (chunks,)
+
+    def _current(self, collection, source):
+        """Return the document as the reads see it, with its deferred changes applied."""
+        staged = self._staged.get((collection, source))
+        if staged is not None:
+            return staged[1]
+        if collection in self._forgotten:
+            return None
+        return self._stored(collection, source)
+
+    def _stage(self, write, *args):
+        self._sequence += 1
+        self._pending.append((self._sequence, write, args))
+        return self._sequence
+
+    def _write_save(self, collection, source, content_hash, version, updated_at, chunks):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, source, content_hash, version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)", (collection, source, content_hash, version, updated_at))
+        self._conn.execute("DELETE FROM chunks WHERE collection = ? AND source = ?", (collection, source))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunks (collection, chunk_id, source, chunk_hash) VALUES (?, ?, ?, ?)",
+            [(collection, chunk_id, source, chunk_hash) for chunk_id, chunk_hash in chunks])
+
+    def _write_remove(self, collection, source):
+        self._conn.execute("DELETE FROM documents WHERE collection = ? AND source = ?", (collection, source))
+        self._conn.execute("DELETE FROM chunks WHERE collection = ? AND source = ?", (collection, source))
+
+    def _write_forget(self, collection):
+        self._conn.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+        self._conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+
+    def document(self, collection, source):
+        """
+        Return the content hash of a document and {chunk hash: [chunk ids]} of its chunks, or None.
+
+        :param collection: The collection of the document.
+        :param source: The file name or URL of the document.
+        """
+        with self._lock:
+            current = self._current(collection, source)
+        if current is None:
+            return None
+        chunks = {}
+        for chunk_id, chunk_hash in current[3]:
+            chunks.setdefault(chunk_hash, []).append(chunk_id)
+        return current[0], chunks
+
+    def save(self, collection, source, content_hash, chunks, deferred=False):
+        """
+        Record a new version of a document and return its version number.
+
+        :param collection: The collection of the document.
+        :param source: The file name or URL of the document.
+        :param content_hash: The content hash of the document.
+        :param chunks: (chunk id, chunk hash) of every chunk of the document.
+        :param deferred: Keep the change in memory until flush().
+        """
+        chunks = list(chunks)
+        with self._lock:
+            current = self._current(collection, source)
+            version = current[1] + 1 if current else 1
+            args = (collection, source, content_hash, version, time.time(), chunks)
+            if deferred:
+                sequence = self._stage(self._write_save, *args)
+                self._staged[(collection, source)] = (sequence, args[2:])
+            else:
+                with self._conn:
+                    self._write_save(*args)
+        return version
+
+    def remove(self, collection, source, deferred=False):
+        """Forget a document and return the ids of its chunks, None when it is not registered."""
+        with self._lock:
+            current = self._current(collection, source)
+            if current is None:
+                return None
+            if deferred:
+                sequence = self._stage(self._write_remove, collection, source)
+                self._staged[(collection, source)] = (sequence, None)
+            else:
+                with self._conn:
+                    self._write_remove(collection, source)
+        return [chunk_id for chunk_id, _ in current[3]]
+
+    def documents(self, collection):
+        """Return the documents of a collection as dicts, oldest first."""
+        with self._lock:
+            rows = []
+            if collection not in self._forgotten:
+                rows = self._conn.execute(
+                    "SELECT d.source, d.version, d.updated_at, COUNT(c.chunk_id) FROM documents d "
+                    "LEFT JOIN chunks c ON c.collection = d.collection AND c.source = d.source "
+                    "WHERE d.collection = ? GROUP BY d.source", (collection,)).fetchall()
+            documents = {source: {"source": source, "version": version, "updated_at": updated_at, "chunks": chunks}
+                         for source, version, updated_at, chunks in rows}
+            for (staged_collection, source), (_, staged) in self._staged.items():
+                if staged_collection != collection:
+                    continue
+                if staged is None:
+                    documents.pop(source, None)
+                else:
+                    _, version, updated_at, chunks = staged
+                    documents[source] = {"source": source, "version": version, "updated_at": updated_at,
+                                         "chunks": len(chunks)}
+        return sorted(documents.values(), key=lambda document: document["updated_at"])
+
+    def forget(self, collection, deferred=False):
+        """Drop the documents of a collection, e.g. after it is cleared."""
+        with self._lock:
+            if deferred:
+                self._forgotten[collection] = self._stage(self._write_forget, collection)
+                for key in [key for key in self._staged if key[0] == collection]:
+                    del self._staged[key]
+            else:
+                with self._conn:
+                    self._write_forget(collection)
+
+    def mark(self):
+        """Return the position of the latest deferred change, for flush()."""
+        with self._lock:
+            return self._sequence
+
+    def flush(self, upto=None):
+        """Write the deferred changes up to a mark(), or all of them, to SQLite."""
+        with self._lock:
+            upto = self._sequence if upto is None else upto
+            pending = [change for change in self._pending if change[0] <= upto]
+            if not pending:
+                return
+            with self._conn:
+                for _, write, args in pending:
+                    write(*args)
+            self._pending = self._pending[len(pending):]
+            self._staged = {key: value for key, value in self._staged.items() if value[0] > upto}
+            self._forgotten = {key: value for key, value in self._forgotten.items() if value > upto}
+
+
+_registry = None
+
+def get_document_registry():
+    """Return the process-wide document registry, opening it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = DocumentRegistry()
+    return _registry
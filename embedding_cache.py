@@ -0,0 +1,144 @@
+"""
+Persistent, content-addressed cache of chunk embeddings.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+
+# Cache defaults
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join("db", "embedding_cache.sqlite"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# SQLite limits the number of parameters in a single statement
+_SQL_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache():
+    """SQLite-backed embedding cache keyed by a hash of the model name and chunk text."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by the executor threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, text):
+        """Return the cache key of a chunk for an embedding model."""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Return the cached vector of each text, None where it is missing."""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            # Touch the hits so the eviction keeps recently used vectors
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model, texts, vectors):
+        """Store the vectors of the texts and evict old entries past the size limit."""
+        now = time.time()
+        # Keyed, a text repeated in the batch is stored once
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            key = self.key(model, text)
+            rows[key] = (key, blob, len(blob), now)
+
+        with self._lock:
+            with self._conn:
+                # Replaced vectors only change the size by the difference
+                keys = list(rows)
+                replaced = 0
+                for start in range(0, len(keys), _SQL_BATCH):
+                    batch = keys[start:start + _SQL_BATCH]
+                    replaced += self._conn.execute(
+                        f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                    rows.values())
+            self._size += sum(row[2] for row in rows.values()) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete the least recently used vectors until the cache is back under 90% of its limit."""
+        with self._conn:
+            # Other processes may share the file, start from the real size
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            target = int(self.max_bytes * 0.9)
+            evicted = 0
+            while self._size > target:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM embeddings ORDER BY last_used LIMIT ?", (_SQL_BATCH,)).fetchall()
+                if not rows:
+                    break
+                self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+                self._size -= sum(size for _, size in rows)
+                evicted += len(rows)
+        logger.info(f"Evicted {evicted} vectors from the embedding cache")
+
+    def hit_ratio(self):
+        """Return the share of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the cache counters."""
+        return {
+            "size_bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+        }
+
+
+_cache = None
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
@@ -0,0 +1,132 @@
+"""
+Hybrid lexical and vector retrieval: a BM25 inverted index kept beside each collection and score fusion.
+"""
+
+import os
+import re
+import math
+import heapq
+from operator import itemgetter
+from collections import Counter, defaultdict
+
+# Retrieval defaults
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", 4))
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", 20))
+# Weight of the vector similarity in the fused score, the BM25 score gets the rest
+HYBRID_ALPHA = float(os.environ.get("HYBRID_ALPHA", 0.5))
+# Queries with at most this many terms are answered lexically when a chunk matches all of them
+HYBRID_KEYWORD_MAX_TERMS = int(os.environ.get("HYBRID_KEYWORD_MAX_TERMS", 3))
+BM25_K1 = float(os.environ.get("BM25_K1", 1.5))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+
+STOPWORDS = frozenset("""
+a about an and are as at be by can could did do does for from has have how i in is it its me my of on or
+should so that the their them there these they this to was we what when where which who why will with
+would you your
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+# Error codes, identifiers, versions, file names and quoted phrases, which embeddings match poorly
+_KEYWORD = re.compile(r'"[^"]+"|\b\w*\d\w*\b|\b\w+_\w+\b|\b[a-z]+[A-Z]\w*\b|\b\w+\.\w+\b')
+
+def tokenize(text):
+    """Return the lowercase terms of a text without stopwords."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def is_keyword_query(query, max_terms=HYBRID_KEYWORD_MAX_TERMS):
+    """Tell whether a query is a few keywords or names an exact identifier, rather than a question."""
+    terms = tokenize(query)
+    return bool(terms) and (len(terms) <= max_terms or _KEYWORD.search(query) is not None)
+
+
+class BM25Index():
+    """In-memory BM25 inverted index of a collection's chunks, keyed by the chunk ids of the collection."""
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        # term -> {chunk id: term frequency}
+        self.postings = defaultdict(dict)
+        # chunk id -> (length in terms, distinct terms), the terms are needed to remove the chunk
+        self.chunks = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add(self, ids, texts):
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in self.chunks:
+                self.remove([chunk_id])
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            for term, frequency in counts.items():
+                self.postings[term][chunk_id] = frequency
+            self.chunks[chunk_id] = (length, tuple(counts))
+            self.total_length += length
+
+    def remove(self, ids):
+        for chunk_id in ids:
+            entry = self.chunks.pop(chunk_id, None)
+            if entry is None:
+                continue
+            length, terms = entry
+            for term in terms:
+                postings = self.postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= length
+
+    def search(self, query, k=HYBRID_FETCH_K):
+        """Return up to k (chunk id, BM25 score) pairs, best first."""
+        if not self.chunks:
+            return []
+        count = len(self.chunks)
+        average_length = self.total_length / count or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length = self.chunks[chunk_id][0]
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+    def covers(self, chunk_id, query):
+        """Tell whether the chunk contains every term of the query."""
+        return all(chunk_id in self.postings.get(term, ()) for term in tokenize(query))
+
+
+def search_lexically(index, query, fetch_k=HYBRID_FETCH_K):
+    """Return the BM25 results of a query, and whether they answer it without a vector search."""
+    lexical = index.search(query, fetch_k)
+    sufficient = is_keyword_query(query) and bool(lexical) and index.covers(lexical[0][0], query)
+    return lexical, sufficient
+
+
+def _normalized(results):
+    """Min-max scale the scores of a result list to [0, 1], embedding similarities are bunched together."""
+    if not results:
+        return {}
+    low = min(score for _, score in results)
+    spread = max(score for _, score in results) - low
+    return {chunk_id: (score - low) / spread if spread > 0 else 1.0 for chunk_id, score in results}
+
+
+def fuse(lexical, similar, k=RETRIEVAL_K, alpha=HYBRID_ALPHA):
+    """
+    Merge BM25 results and vector similarity results into the top k (chunk id, score) pairs.
+
+    Both lists are min-max scaled first, a chunk missing from one list scores 0 there.
+    """
+    lexical = _normalized(lexical)
+    similar = _normalized(similar)
+    scores = {chunk_id: alpha * similar.get(chunk_id, 0.0) + (1 - alpha) * lexical.get(chunk_id, 0.0)
+              for chunk_id in lexical.keys() | similar.keys()}
+    return heapq.nlargest(k, scores.items(), key=itemgetter(1))
@@ -0,0 +1,119 @@
+"""
+Batched, concurrent embedding pipeline for ingesting chunks into the vector store.
+"""
+
+import os
+import time
+import uuid
+import logging
+import asyncio
+
+from embedding_cache import get_embedding_cache
+from rate_limiter import get_rate_limiter
+
+# Pipeline defaults
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_BATCH_MAX_CHARS = int(os.environ.get("EMBEDDING_BATCH_MAX_CHARS", 100000))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+
+logger = logging.getLogger(__name__)
+
+def log_progress(done, total, chunks_per_sec):
+    """Default progress callback, logs the ingestion rate."""
+    logger.info(f"Embedded {done}/{total} chunks ({chunks_per_sec:.1f} chunks/sec)")
+
+
+def make_batches(texts, batch_size=EMBEDDING_BATCH_SIZE, max_chars=EMBEDDING_BATCH_MAX_CHARS):
+    """Group text indexes into batches bounded by chunk count and total characters."""
+    batches = []
+    batch = []
+    batch_chars = 0
+    for index, text in enumerate(texts):
+        if batch and (len(batch) >= batch_size or batch_chars + len(text) > max_chars):
+            batches.append(batch)
+            batch = []
+            batch_chars = 0
+        batch.append(index)
+        batch_chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingPipeline():
+    """Embeds chunks in bounded batches, several at a time, and stores them off the event loop."""
+
+    def __init__(self, embeddings, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_batch_chars=EMBEDDING_BATCH_MAX_CHARS, max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                 cache=None):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_concurrency = max_concurrency
+
+    async def embed(self, texts):
+        """Return the embeddings of a batch of texts, only embedding the chunks missing from the cache."""
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(None, lambda: self.cache.get_many(self.model, texts))
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            # Roughly four characters per token, counting exactly would cost more than the estimate saves
+            async with get_rate_limiter().slot(self.model, sum(len(text) for text in missing_texts) // 4 + 1):
+                embedded = await self.embeddings.aembed_documents(missing_texts)
+            await loop.run_in_executor(None, lambda: self.cache.put_many(self.model, missing_texts, embedded))
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+
+        return vectors
+
+    async def add_documents(self, backend, documents, progress=log_progress, ids=None):
+        """
+        Embed the documents and add them to the vector backend, return their ids.
+
+        When a batch fails the error is raised once every other batch is done, so the caller can
+        delete the ids it passed in without racing the remaining inserts.
+        """
+        if not documents:
+            return []
+
+        loop = asyncio.get_running_loop()
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in documents]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        insert_lock = asyncio.Lock()
+        started = time.monotonic()
+        done = 0
+
+        async def process(batch):
+            nonlocal done
+            batch_texts = [texts[i] for i in batch]
+
+            # Bound the number of embedding requests in flight
+            async with semaphore:
+                vectors = await self.embed(batch_texts)
+
+            # The store is not safe for concurrent writes, insert one batch at a time off the loop
+            async with insert_lock:
+                await loop.run_in_executor(None, lambda: backend.add(
+                    [ids[i] for i in batch], vectors, batch_texts, [metadatas[i] for i in batch]))
+
+            done += len(batch)
+            if progress is not None:
+                elapsed = max(time.monotonic() - started, 1e-6)
+                progress(done, len(texts), done / elapsed)
+
+        batches = make_batches(texts, batch_size=self.batch_size, max_chars=self.max_batch_chars)
+        results = await asyncio.gather(*(process(batch) for batch in batches), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        logger.info(f"Embedding cache hit ratio: {self.cache.hit_ratio():.2%}")
+
+        return ids
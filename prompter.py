@@ -1,19 +1,22 @@
+import os
+import sys
+import random
 import logging
-import openai
-import elevenlabs
 import asyncio
+import threading
+from contextvars import ContextVar
 
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import LLMChain, ConversationChain
-from langchain.prompts import PromptTemplate
-from langchain.agents import load_tools, initialize_agent, Tool, AgentType
-from langchain.memory import ConversationBufferMemory
-from langchain.tools import DuckDuckGoSearchRun
-from langchain.utilities import WikipediaAPIWrapper, GoogleSearchAPIWrapper
-from langchain.utilities.wolfram_alpha import WolframAlphaAPIWrapper
-from langchain.callbacks.streaming_stdout_final_only import FinalStreamingStdOutCallbackHandler
+# openai, elevenlabs, LangChain and the vector database are imported on first use,
+# so the bot starts serving updates without loading them
+from task_queue import get_task_queue
+from context_window import ContextWindow, count_tokens
+from response_cache import RESPONSE_CACHE_ENABLED, DOCUMENT_TOOL, get_response_cache
+from tool_cache import get_tool_cache
+from rate_limiter import current_chat, get_rate_limiter
 
-from vectordb import VectorDB
+# Jittered exponential backoff of the retries after a rate limit error, in seconds
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", 1.0))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", 30.0))
 
 # Enable logging for debugging
 logging.basicConfig(
@@ -25,49 +28,165 @@ class RateLimitError(Exception):
         super().__init__(message)
         self.retry_after = retry_after
 
-async def handle_rate_limiting(func, *args, is_async=True, **kwargs):
+def _is_openai_rate_limit(e):
+    # A client that was never imported cannot have raised
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(e, openai.error.RateLimitError)
+
+def _is_elevenlabs_rate_limit(e):
+    elevenlabs = sys.modules.get("elevenlabs")
+    return elevenlabs is not None and isinstance(e, elevenlabs.RateLimitError)
+
+def _retry_after(e):
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+async def _call(func, args, kwargs, is_async):
+    if is_async:
+        return await func(*args, **kwargs)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+# When quota_model is given every attempt first waits for the model's quota in the shared limiter
+# and holds one of its in-flight slots until the call returns
+async def handle_rate_limiting(func, *args, is_async=True, quota_model=None, **kwargs):
     retries = 5
-    backoff_factor = 2
+    limiter = get_rate_limiter()
 
     for attempt in range(retries):
         try:
-            if is_async:
-                result = await func(*args, **kwargs)
-            else:
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, lambda: func(*args, **kwargs))
-            return result
-        except openai.error.RateLimitError as e:
-            if attempt < retries - 1:  # Check if it's the last attempt
-                retry_after = int(e.headers.get("Retry-After", 0))
-                wait_time = retry_after or (backoff_factor ** attempt)
-                logger.warning(f"Rate limit exceeded. Retrying in {wait_time} seconds...")
-                await asyncio.sleep(wait_time)
-            else:
-                raise RateLimitError("Too many rate-limited attempts.", retry_after=retry_after) from e
-        except elevenlabs.RateLimitError as e:
-            if attempt < retries - 1:
-                retry_after = int(e.headers.get("Retry-After", 0))
-                wait_time = retry_after or (backoff_factor ** attempt)
-                logger.warning(f"Rate limit exceeded. Retrying in {wait_time} seconds...")
-                await asyncio.sleep(wait_time)
+            if quota_model is None:
+                return await _call(func, args, kwargs, is_async)
+            async with limiter.slot(quota_model):
+                return await _call(func, args, kwargs, is_async)
         except Exception as e:
-            raise e
+            if not (_is_openai_rate_limit(e) or _is_elevenlabs_rate_limit(e)):
+                raise e
+
+            retry_after = _retry_after(e)
+            if attempt == retries - 1:  # Check if it's the last attempt
+                raise RateLimitError("Too many rate-limited attempts.", retry_after=retry_after) from e
+
+            # Full jitter, so the chats limited at the same time do not all retry at the same time
+            wait_time = max(retry_after, random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt)))
+            if quota_model is not None and retry_after:
+                # Hold the other calls of the model too instead of letting them hit the limit
+                limiter.pause(quota_model, retry_after)
+            logger.warning(f"Rate limit exceeded. Retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+
+async def close_vector_store():
+    """Persist the vector store changes still waiting for a checkpoint and close the crawler's connections."""
+    vectordb = sys.modules.get("vectordb")
+    if vectordb is not None:
+        await vectordb.close_vectordb_pool()
+    crawler = sys.modules.get("crawler")
+    if crawler is not None:
+        await crawler.close_http_client()
+
+# Prompter of the chat currently being served, read by the shared agent tools
+current_prompter = ContextVar("current_prompter")
+
+def _chat_tool(method_name):
+    """Return a tool coroutine that dispatches to the current chat's Prompter."""
+    async def run(query):
+        prompter = current_prompter.get()
+        return await getattr(prompter, method_name)(query)
+    return run
+
+class AgentFactory:
+    """Builds the LLM client, the tool registry and the agent once per process."""
+
+    def __init__(self, openai_api_key):
+        from langchain.chat_models import ChatOpenAI
+        from langchain.agents import load_tools, initialize_agent, Tool, AgentType
+        from agent_callbacks import RateLimitCallbackHandler
+
+        # Per-chat callbacks are passed per call, so the shared client carries no per-chat state.
+        # Its own callback only waits for quota, for the agent steps and the history summaries alike.
+        self.llm = ChatOpenAI(temperature=0,
+                              streaming=True,
+                              max_retries=3,
+                              openai_api_key=openai_api_key)
+        self.llm.callbacks = [RateLimitCallbackHandler(self.llm.model_name)]
+
+        # Provide access to a list of tools that the agents will use
+        # add 'open-meteo-api' to the list of tools later
+        self.tools = load_tools(['llm-math'],
+                                llm=self.llm)
+
+        self.tools.extend([
+            Tool(name="Image Model", func=_chat_tool("generate_image"), coroutine=_chat_tool("generate_image"), description="Generate images from text", return_direct=True),
+            Tool(name="Wikipedia", func=_chat_tool("search_wikipedia"), coroutine=_chat_tool("search_wikipedia"), description="Search Wikipedia for general information"),
+            Tool(name="Google Search", func=_chat_tool("search_google"), coroutine=_chat_tool("search_google"), description="Search the web. Useful about current events, everyday life, news, technical topics, errors or fixes."),
+            Tool(name="Wolfram Alpha", func=_chat_tool("search_wolframalpha"), coroutine=_chat_tool("search_wolframalpha"), description="Search Wolfram Alpha. Useful about science, weather, climate, engineering, technology, culture and society"),
+            Tool(name="Search User Documents", func=_chat_tool("search_database"), coroutine=_chat_tool("search_database"), description="Search user documents database"),
+            Tool(name="Generate Test", func=_chat_tool("generate_test"), coroutine=_chat_tool("generate_test"), description="Generate a test based on the chat topic. Return the question, list of options and the id of the right answer. Use this tool at random times, rarely."),
+        ])
+
+        # initialise the agents & make all the tools and llm available to it
+        self.agent = initialize_agent(tools=self.tools,
+                                      llm=self.llm,
+                                      agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+                                      verbose=True,
+                                      handle_parsing_errors="Check your output and make sure it conforms!")
+
+        # Token-budgeted chat history with a rolling summary of older turns
+        self.context_window = ContextWindow(self.llm)
+
+_agent_factory = None
+
+def get_agent_factory(openai_api_key):
+    """Return the process-wide agent factory, building it on first use."""
+    global _agent_factory
+    if _agent_factory is None:
+        _agent_factory = AgentFactory(openai_api_key=openai_api_key)
+    return _agent_factory
+
+# Search API wrappers of each tool pool thread, the Google client cannot be shared between threads
+_search_wrappers = threading.local()
+
+def _search_wrapper(name):
+    """Return this thread's wrapper of a search API, building it on first use."""
+    wrapper = getattr(_search_wrappers, name, None)
+    if wrapper is None:
+        if name == "wikipedia":
+            from langchain.utilities import WikipediaAPIWrapper
+            wrapper = WikipediaAPIWrapper()
+        elif name == "google":
+            from langchain.utilities import GoogleSearchAPIWrapper
+            wrapper = GoogleSearchAPIWrapper(google_api_key=GOOGLE_API_KEY, google_cse_id=GOOGLE_CSE_ID, k=5)
+        else:
+            from langchain.utilities.wolfram_alpha import WolframAlphaAPIWrapper
+            wrapper = WolframAlphaAPIWrapper(wolfram_alpha_appid=WOLFRAM_ALPHA_APPID)
+        setattr(_search_wrappers, name, wrapper)
+    return wrapper
+
+def _search(name):
+    """Return the blocking search call of a tool, run on the tool thread pool."""
+    return lambda query: _search_wrapper(name).run(query)
 
 class Prompter:
-    def __init__(self, chat_id, openai_api_key, google_api_key, google_cse_id, wolfram_alpha_appid, eleven_api_key):
+    def __init__(self, chat_id, openai_api_key, google_api_key, google_cse_id, wolfram_alpha_appid, eleven_api_key, conversation_id=None):
         # check if the chat_id is string
         if not isinstance(chat_id, str):
             self.chat_user_id = str(chat_id)
         else:
             self.chat_user_id = chat_id
+
+        # The chat's history with one bot, when several bots serve the same chat. Documents stay per chat.
+        self.conversation_id = conversation_id or self.chat_user_id
         
         # set the api keys
         global GOOGLE_API_KEY
         global GOOGLE_CSE_ID
         global WOLFRAM_ALPHA_APPID
         global ELEVEN_API_KEY
-        openai.api_key = openai_api_key
+        global OPENAI_API_KEY
+        OPENAI_API_KEY = openai_api_key
         GOOGLE_API_KEY = google_api_key
         GOOGLE_CSE_ID = google_cse_id
         WOLFRAM_ALPHA_APPID = wolfram_alpha_appid
@@ -75,30 +194,39 @@ class Prompter:
 
 
     async def generate_image(self, prompt):
+        import openai
         try:
-            response = await handle_rate_limiting(openai.Image.acreate, prompt=prompt, n=1, size="256x256")
+            response = await handle_rate_limiting(openai.Image.acreate, prompt=prompt, n=1, size="256x256", api_key=OPENAI_API_KEY, quota_model="dall-e")
             return response['data'][0]['url']
         except Exception as e:
             logger.error(f"Error generating image: {e}")
             return None
 
     async def transcribe_voice(self, file):
+        import openai
+        current_chat.set(self.chat_user_id)
         try:
-            transcript = await handle_rate_limiting(openai.Audio.atranscribe, model="whisper-1", file=file)
+            transcript = await handle_rate_limiting(openai.Audio.atranscribe, model="whisper-1", file=file, api_key=OPENAI_API_KEY, quota_model="whisper-1")
             return transcript["text"]
         except Exception as e:
             logger.error(f"Error transcribing voice: {e}")
             return None
     
     async def generate_audio(self, text):
+        import elevenlabs
+        current_chat.set(self.chat_user_id)
         try:
-            audio = await handle_rate_limiting(elevenlabs.generate, api_key=ELEVEN_API_KEY, text=text, voice="Bella", model="eleven_monolingual_v1", is_async=False)
+            audio = await handle_rate_limiting(elevenlabs.generate, api_key=ELEVEN_API_KEY, text=text, voice="Bella", model="eleven_monolingual_v1", is_async=False, quota_model="elevenlabs")
             return audio
         except Exception as e:
             logger.error(f"Error generating audio: {e}")
             return None
     
     async def generate_test(self, message):
+        from langchain.chat_models import ChatOpenAI
+        from langchain.chains import ConversationChain
+        from langchain.callbacks.streaming_stdout_final_only import FinalStreamingStdOutCallbackHandler
+        from agent_callbacks import RateLimitCallbackHandler
 
         # Create a prompt template
         template = f"""
@@ -114,7 +242,8 @@ class Prompter:
                         streaming=True, 
                         callbacks=[FinalStreamingStdOutCallbackHandler()], 
                         max_retries=3,
-                        openai_api_key=openai.api_key)
+                        openai_api_key=OPENAI_API_KEY)
+        llm.callbacks.append(RateLimitCallbackHandler(llm.model_name))
         
         try:
             # Prompt the LLM to generate a response
@@ -126,119 +255,183 @@ class Prompter:
             return None
 
     async def search_wikipedia(self, query):
-        wikipedia = WikipediaAPIWrapper()
         try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, lambda: wikipedia.run(query))
-            #response = await wikipedia.run(query)
+            response = await get_tool_cache().run("wikipedia", query, _search("wikipedia"))
             return response
         except Exception as e:
             logger.error(f"Error searching wikipedia: {e}")
             return None
     
     async def search_google(self, query):
-        search = GoogleSearchAPIWrapper(google_api_key=GOOGLE_API_KEY, google_cse_id=GOOGLE_CSE_ID, k=5)
         try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, lambda: search.run(query))
-            #response = await search.run(query)
+            response = await get_tool_cache().run("google", query, _search("google"))
             return response
         except Exception as e:
-            logger.error(f"Error searching wikipedia: {e}")
+            logger.error(f"Error searching google: {e}")
             return None
     
     async def search_wolframalpha(self, query):
-        wolframalpha = WolframAlphaAPIWrapper(wolfram_alpha_appid=WOLFRAM_ALPHA_APPID)
         try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, lambda: wolframalpha.run(query))
-            #response = await wolframalpha.run(query)
+            response = await get_tool_cache().run("wolframalpha", query, _search("wolframalpha"))
             return response
         except Exception as e:
-            logger.error(f"Error searching wikipedia: {e}")
+            logger.error(f"Error searching wolfram alpha: {e}")
             return None
 
-    # Prompt the LLM to generate a response
-    async def generate_response(self, message, chat_context):
+    async def _cached_response(self, message, history):
+        """Return the question vector and the cached answer of a message, (None, None) when the lookup fails."""
+        try:
+            cache = get_response_cache(OPENAI_API_KEY)
+            vector = await cache.embed(message)
+            return vector, cache.lookup(self.chat_user_id, message, vector, history)
+        except Exception as e:
+            logger.error(f"Error looking up the response cache: {e}")
+            return None, None
 
-        # Format the chat history as a string
-        formatted_chat_history = "\n".join([f"{k}: {v}" for entry in chat_context for k, v in entry.items()])
+    def _invalidate_document_answers(self):
+        """Forget the cached answers that were based on this chat's documents."""
+        if RESPONSE_CACHE_ENABLED:
+            get_response_cache(OPENAI_API_KEY).invalidate(self.chat_user_id, DOCUMENT_TOOL)
 
-        # Create a prompt template
-        template = f"""
-        Chat History:
-        {formatted_chat_history}
+    # Prompt the LLM to generate a response
+    # When stream_queue is given the final answer tokens are pushed into it, followed by None
+    async def generate_response(self, message, chat_context, stream_queue=None):
 
-        Human: {message}
-        AI:"""
+        from langchain.callbacks.streaming_stdout_final_only import FinalStreamingStdOutCallbackHandler
+        from agent_callbacks import FinalAnswerQueueCallbackHandler, ToolUsageCallbackHandler
 
-        # Create a prompt template
-        #prompt_template = PromptTemplate(template=template, validate_template=False)
+        # Calls made for this update queue for quota as this chat's. An update runs in its own task
+        # and serves a single chat, so the variable is left set for the rest of it.
+        current_chat.set(self.chat_user_id)
 
-        # A conversation buffer (memory) & import llm of choice
-        #memory = ConversationBufferMemory(memory_key="chat_history", input_key="input")
+        # Everything that can fail runs inside the try, so the stream always gets its end marker
+        try:
+            factory = get_agent_factory(OPENAI_API_KEY)
 
-        # Create a model, chain and tool for the language model
-        llm = ChatOpenAI(temperature=0, 
-                        streaming=True, 
-                        callbacks=[FinalStreamingStdOutCallbackHandler()], 
-                        max_retries=3,
-                        openai_api_key=openai.api_key)
+            # Keep the recent turns within the token budget, older ones are folded into a summary
+            formatted_chat_history, history_tokens = await factory.context_window.build(self.conversation_id, chat_context)
 
-        #llm_chain = ConversationChain(llm=llm, prompt=prompt_template)
+            # Near-identical questions are answered from the cache, without the agent, follow-ups only with the same history
+            question_vector = None
+            if RESPONSE_CACHE_ENABLED:
+                question_vector, cached = await self._cached_response(message, formatted_chat_history)
+                if cached is not None:
+                    if stream_queue is not None:
+                        await stream_queue.put(cached)
+                    return cached
 
-        # Provide access to a list of tools that the agents will use
-        # add 'open-meteo-api' to the list of tools later
-        tools = load_tools(['llm-math'],
-                            llm=llm)
-        
-        tools.extend([
-            Tool(name="Image Model", func=self.generate_image, coroutine=self.generate_image, description="Generate images from text", return_direct=True),
-            Tool(name="Wikipedia", func=self.search_wikipedia, coroutine=self.search_wikipedia, description="Search Wikipedia for general information"),
-            Tool(name="Google Search", func=self.search_google, coroutine=self.search_google, description="Search the web. Useful about current events, everyday life, news, technical topics, errors or fixes."),
-            Tool(name="Wolfram Alpha", func=self.search_wolframalpha, coroutine=self.search_wolframalpha, description="Search Wolfram Alpha. Useful about science, weather, climate, engineering, technology, culture and society"),
-            Tool(name="Search User Documents", func=self.search_database, coroutine=self.search_database, description="Search user documents database"),
-            Tool(name="Generate Test", func=self.generate_test, coroutine=self.generate_test, description="Generate a test based on the chat topic. Return the question, list of options and the id of the right answer. Use this tool at random times, rarely."),
-        ])
-        
+            logger.info(f"Prompt tokens for chat {self.chat_user_id}: {history_tokens} history "
+                        f"({len(chat_context)} turns) + {count_tokens(message)} message")
 
-        # initialise the agents & make all the tools and llm available to it
-        agent = initialize_agent(tools=tools,
-                                llm=llm, 
-                                agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION, 
-                                verbose=True,
-                                handle_parsing_errors="Check your output and make sure it conforms!")
+            # The agent is shared by all chats, the tools find this chat through the context variable
+            token = current_prompter.set(self)
+            try:
+                if stream_queue is not None:
+                    callbacks = [FinalAnswerQueueCallbackHandler(stream_queue)]
+                else:
+                    callbacks = [FinalStreamingStdOutCallbackHandler()]
+                tool_usage = ToolUsageCallbackHandler()
+                callbacks.append(tool_usage)
+                # The history goes in through chat_history only, not a second time in the input
+                answer = await factory.agent.arun(input=message,
+                                                  chat_history=formatted_chat_history,
+                                                  callbacks=callbacks,
+                                                  return_only_outputs=True)
+            finally:
+                current_prompter.reset(token)
 
-        try:
-            #loop = asyncio.get_event_loop()
-            #answer = await loop.run_in_executor(None, lambda: agent.run(input=template, chat_history=formatted_chat_history, return_only_outputs=True))
-            answer = await agent.arun(input=template, chat_history=formatted_chat_history, return_only_outputs=True)
+            # The tools the agent used decide whether and for how long the answer is cached
+            if question_vector is not None:
+                get_response_cache(OPENAI_API_KEY).store(self.chat_user_id, message, question_vector,
+                                                         answer, tool_usage.tools, formatted_chat_history)
             return answer
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return "An error occurred while generating the response."
+        finally:
+            # Tell the consumer the stream has ended
+            if stream_queue is not None:
+                await stream_queue.put(None)
     
-    async def save_document(self, document):
+    # When on_summary is given, return the number of indexed chunks as soon as the document
+    # is searchable and deliver the summary to on_summary from the background task queue.
+    # A document unchanged since it was saved indexes 0 chunks and gets no summary.
+    async def save_document(self, document, on_summary=None):
+        from vectordb import get_vectordb_pool
+        current_chat.set(self.chat_user_id)
         try:
-            db = VectorDB(chat_user_id=self.chat_user_id, openai_api_key=openai.api_key)
-            summary = await db.add_document(document=document)
-            return summary
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
+            if on_summary is None:
+                summary = await db.add_document(document=document)
+                if summary:
+                    self._invalidate_document_answers()
+                return summary
+
+            texts = await db.index_document(document=document)
+            if texts is None:
+                return None
+            if not texts:
+                return 0
+            self._invalidate_document_answers()
+
+            async def summarize():
+                # Runs on a task queue worker, which serves a different chat for every task
+                current_chat.set(self.chat_user_id)
+                await on_summary(await db.summarize(texts))
+
+            get_task_queue().submit(self.chat_user_id, summarize, name="document summary")
+            return len(texts)
         except Exception as e:
             logger.error(f"Error saving document: {e}")
             return "Error saving document"
 
     async def save_url(self, url):
+        return await self.save_urls([url])
+
+    # Sitemaps are expanded, and links are followed max_depth levels deep on the same site.
+    # Return the summary of the new and changed pages, "" when there are none, None on failure.
+    async def save_urls(self, urls, max_depth=0):
+        from vectordb import get_vectordb_pool
+        current_chat.set(self.chat_user_id)
         try:
-            db = VectorDB(chat_user_id=self.chat_user_id, openai_api_key=openai.api_key)
-            summary = await db.add_url(url=url)
-            return summary
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
+            texts = await db.index_urls(urls, max_depth=max_depth)
+            if texts is None:
+                return None
+            if not texts:
+                return ""
+            self._invalidate_document_answers()
+            return await db.summarize(texts)
         except Exception as e:
             logger.error(f"Error saving URL: {e}")
-            return "Error saving URL"
+            return None
         
+    async def list_documents(self):
+        from vectordb import get_vectordb_pool
+        try:
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
+            return await db.documents()
+        except Exception as e:
+            logger.error(f"Error listing user documents: {e}")
+            return None
+
+    # Return the number of deleted chunks, None when the document is not in the database
+    async def delete_document(self, source):
+        from vectordb import get_vectordb_pool
+        try:
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
+            deleted = await db.delete_document(source)
+            if deleted is not None:
+                self._invalidate_document_answers()
+            return deleted
+        except Exception as e:
+            logger.error(f"Error deleting user document: {e}")
+            return None
+
     async def search_database(self, query):
+        from vectordb import get_vectordb_pool
         try:
-            db = VectorDB(chat_user_id=self.chat_user_id, openai_api_key=openai.api_key)
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
             results = await db.query(query=query)
             return results
         except Exception as e:
@@ -246,9 +439,14 @@ class Prompter:
             return "Error searching user documents"
     
     async def clear_database(self):
+        from vectordb import get_vectordb_pool
         try:
-            db = VectorDB(chat_user_id=self.chat_user_id, openai_api_key=openai.api_key)
+            db = await get_vectordb_pool(OPENAI_API_KEY).get(self.chat_user_id)
             await db.clear_database()
+
+            # The collection is gone, so the pooled instance is stale
+            await get_vectordb_pool(OPENAI_API_KEY).discard(self.chat_user_id)
+            self._invalidate_document_answers()
             return True
         except Exception as e:
             logger.error(f"Error clearing user documents: {e}")
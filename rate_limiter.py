@@ -0,0 +1,280 @@
+"""
+Process-wide proactive limiter of OpenAI and ElevenLabs calls, with per-model request and token
+buckets, a cap on the calls in flight and round-robin fairness across the chats waiting for them.
+"""
+
+import os
+import time
+import logging
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from collections import OrderedDict, deque
+
+# Limits of the models, as "model=rpm:tpm[:in flight]" entries, a tpm of 0 only limits the requests.
+# Model names are matched by prefix, so gpt-3.5-turbo covers its dated snapshots.
+RATE_LIMITS = os.environ.get(
+    "RATE_LIMITS",
+    "gpt-3.5-turbo=3500:90000,text-davinci-003=3500:90000,text-embedding-ada-002=3000:1000000,"
+    "whisper-1=50:0,dall-e=50:0,elevenlabs=100:0:2")
+# Limits of models missing from RATE_LIMITS
+RATE_LIMIT_DEFAULT_RPM = int(os.environ.get("RATE_LIMIT_DEFAULT_RPM", 3500))
+RATE_LIMIT_DEFAULT_TPM = int(os.environ.get("RATE_LIMIT_DEFAULT_TPM", 90000))
+# Calls of a model running at the same time, unless RATE_LIMITS sets it for the model
+RATE_LIMIT_MAX_IN_FLIGHT = int(os.environ.get("RATE_LIMIT_MAX_IN_FLIGHT", 32))
+# Seconds after which a call that was never released stops counting as in flight
+RATE_LIMIT_LEASE_TIMEOUT = float(os.environ.get("RATE_LIMIT_LEASE_TIMEOUT", 300))
+# Completion tokens counted for a call on top of its prompt, the real count is only known afterwards
+RATE_LIMIT_COMPLETION_TOKENS = int(os.environ.get("RATE_LIMIT_COMPLETION_TOKENS", 256))
+# Recent wait times kept per model for the percentiles
+RATE_LIMIT_WAIT_SAMPLES = int(os.environ.get("RATE_LIMIT_WAIT_SAMPLES", 1000))
+
+# Chat on whose behalf the current task calls the API, the fairness queue is keyed by it
+current_chat = ContextVar("current_chat", default="background")
+
+logger = logging.getLogger(__name__)
+
+def parse_limits(spec):
+    """Parse "model=rpm:tpm[:in flight]" entries into {model: (rpm, tpm, in flight or None)}."""
+    limits = {}
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+        model, _, values = pair.partition("=")
+        rpm, _, rest = values.partition(":")
+        tpm, _, in_flight = rest.partition(":")
+        limits[model.strip()] = (int(rpm), int(tpm or 0), int(in_flight) if in_flight else None)
+    return limits
+
+
+class _Bucket():
+    """Token bucket refilled continuously up to its per-minute limit."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def delay(self, amount, now):
+        """Return the seconds until amount is available, amounts above the capacity wait for a full bucket."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class ModelLimiter():
+    """
+    Grants the calls of one model in round-robin order across chats, within its rpm and tpm and
+    with at most max_in_flight of them running at once.
+
+    Each granted call holds a lease until it is released, or until the lease times out for calls
+    whose end is never reported.
+    """
+
+    def __init__(self, model, rpm, tpm, max_in_flight=RATE_LIMIT_MAX_IN_FLIGHT,
+                 lease_timeout=RATE_LIMIT_LEASE_TIMEOUT, samples=RATE_LIMIT_WAIT_SAMPLES):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self.lease_timeout = lease_timeout
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.paused_until = 0.0
+
+        # chat id -> waiting calls of the chat as (tokens, lease, future, enqueue time), in turn order
+        self._waiting = OrderedDict()
+        self._dispatcher = None
+        # lease -> expiry time of the calls in flight
+        self._leases = {}
+        self._released = None
+
+        self.granted = 0
+        self.granted_tokens = 0
+        self.expired_leases = 0
+        self.waits = deque(maxlen=samples)
+
+    def _in_flight(self, now):
+        """Return the number of calls in flight, dropping the leases that timed out."""
+        expired = [lease for lease, expires_at in self._leases.items() if expires_at <= now]
+        for lease in expired:
+            del self._leases[lease]
+        if expired:
+            self.expired_leases += len(expired)
+            logger.warning(f"{len(expired)} calls of {self.model} were never released, their leases expired")
+        return len(self._leases)
+
+    def _delay(self, tokens):
+        now = time.monotonic()
+        delay = max(self.paused_until - now, self.requests.delay(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        if self.max_in_flight and self._in_flight(now) >= self.max_in_flight:
+            # Released calls wake the dispatcher earlier
+            delay = max(delay, min(self._leases.values()) - now)
+        return delay
+
+    def _grant(self, tokens, lease, wait):
+        self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        if lease is not None:
+            self._leases[lease] = time.monotonic() + self.lease_timeout
+        self.granted += 1
+        self.granted_tokens += tokens
+        self.waits.append(wait)
+
+    async def acquire(self, chat_id, tokens=0, lease=None):
+        """
+        Wait for a call of tokens tokens, return the seconds waited.
+
+        A call given a lease counts as in flight until release(lease), a call without one is only
+        limited by the buckets.
+        """
+        # Nobody is queued and there is quota left, go right away
+        if not self._waiting and self._delay(tokens) <= 0:
+            self._grant(tokens, lease, 0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(chat_id, deque()).append((tokens, lease, future, time.monotonic()))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        return await future
+
+    def release(self, lease):
+        """End a call granted with the lease, letting the next waiting call in."""
+        if self._leases.pop(lease, None) is not None and self._released is not None:
+            self._released.set()
+
+    async def _sleep(self, delay):
+        """Sleep for delay seconds, or until a call is released."""
+        if self._released is None:
+            self._released = asyncio.Event()
+        self._released.clear()
+        try:
+            await asyncio.wait_for(self._released.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        """Grant the head call of each chat in turn, as the buckets refill."""
+        while self._waiting:
+            chat_id, calls = next(iter(self._waiting.items()))
+            tokens, lease, future, enqueued = calls[0]
+
+            # The caller went away, e.g. its update was cancelled
+            if future.done():
+                calls.popleft()
+                if not calls:
+                    del self._waiting[chat_id]
+                continue
+
+            delay = self._delay(tokens)
+            if delay > 0:
+                await self._sleep(delay)
+                continue
+
+            calls.popleft()
+            if calls:
+                # The chat goes to the back of the line for its next call
+                self._waiting.move_to_end(chat_id)
+            else:
+                del self._waiting[chat_id]
+
+            wait = time.monotonic() - enqueued
+            self._grant(tokens, lease, wait)
+            future.set_result(wait)
+
+    def pause(self, seconds):
+        """Hold every call of the model for a while, e.g. after the API answered with a rate limit error."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        """Return the grant counters and the wait time distribution of the recent calls."""
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight(time.monotonic()),
+            "expired_leases": self.expired_leases,
+            "granted": self.granted,
+            "granted_tokens": self.granted_tokens,
+            "queued": sum(len(calls) for calls in self._waiting.values()),
+            "queued_chats": len(self._waiting),
+            "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+
+class RateLimiter():
+    """Shares the OpenAI and ElevenLabs quotas of the process between models and chats."""
+
+    def __init__(self, limits=None, default_rpm=RATE_LIMIT_DEFAULT_RPM, default_tpm=RATE_LIMIT_DEFAULT_TPM,
+                 default_in_flight=RATE_LIMIT_MAX_IN_FLIGHT):
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else limits
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.default_in_flight = default_in_flight
+        self._models = {}
+
+    def model(self, name):
+        """Return the limiter of a model, created with its configured limits on first use."""
+        limiter = self._models.get(name)
+        if limiter is None:
+            prefix = max((prefix for prefix in self.limits if name.startswith(prefix)), key=len, default=None)
+            rpm, tpm, in_flight = self.limits[prefix] if prefix else (self.default_rpm, self.default_tpm, None)
+            limiter = self._models[name] = ModelLimiter(
+                name, rpm, tpm, max_in_flight=in_flight if in_flight is not None else self.default_in_flight)
+        return limiter
+
+    async def acquire(self, model, tokens=0, chat_id=None, lease=None):
+        """Wait for quota for a call of the model, return the seconds waited. Leased calls must be released."""
+        chat_id = chat_id if chat_id is not None else current_chat.get()
+        wait = await self.model(model).acquire(chat_id, tokens, lease)
+        if wait >= 1:
+            logger.info(f"Waited {wait:.1f}s for {model} quota (chat {chat_id}, {tokens} tokens)")
+        return wait
+
+    def release(self, model, lease):
+        self.model(model).release(lease)
+
+    @asynccontextmanager
+    async def slot(self, model, tokens=0, chat_id=None):
+        """Hold quota and an in-flight slot of the model for the duration of the block."""
+        lease = object()
+        try:
+            await self.acquire(model, tokens, chat_id, lease)
+            yield
+        finally:
+            # Also when the wait was cancelled just after the call was granted
+            self.release(model, lease)
+
+    def pause(self, model, seconds):
+        self.model(model).pause(seconds)
+
+    def stats(self):
+        """Return the stats of every model used so far."""
+        return {name: limiter.stats() for name, limiter in self._models.items()}
+
+
+_limiter = None
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter, creating it on first use."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,240 @@
+"""
+Opt-in semantic cache of agent answers, looked up by the embedding of the normalized question.
+
+numpy and the embeddings are only imported once the cache is enabled and used.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+
+from cachetools import LRUCache
+
+from ingestion import EmbeddingPipeline
+
+# Cache defaults, the cache is off unless RESPONSE_CACHE_ENABLED is set
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", 0.95))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_CHATS = int(os.environ.get("RESPONSE_CACHE_MAX_CHATS", 10000))
+RESPONSE_CACHE_MAX_PER_CHAT = int(os.environ.get("RESPONSE_CACHE_MAX_PER_CHAT", 256))
+
+# Answers that used one of these tools are never cached: live searches, images and random quizzes
+UNCACHEABLE_TOOLS = frozenset(("Google Search", "Wolfram Alpha", "Image Model", "Generate Test"))
+
+# Seconds an answer that used the tool stays valid, the shortest ttl of the tools used wins
+TOOL_TTLS = {
+    "Calculator": 30 * 24 * 3600,
+    "Wikipedia": 24 * 3600,
+}
+
+# Answers from the user's documents, dropped whenever the documents change
+DOCUMENT_TOOL = "Search User Documents"
+# Answers that used no tools or only these are the same for every user, they are shared across chats
+SHARED_TOOLS = frozenset(("Calculator", "Wikipedia"))
+RESPONSE_CACHE_MAX_SHARED = int(os.environ.get("RESPONSE_CACHE_MAX_SHARED", 10000))
+
+# Questions that refer to the conversation, e.g. "and the second one?" or "why?"
+_FOLLOW_UP = re.compile(
+    r"^(and|but|so|or|what about|how about)\b|\b(it|its|that|this|these|those|they|them|their|he|him|his|she|her|"
+    r"above|previous|earlier|last|again|else|more|why|first|second|third|other|same|also|too|then|just)\b")
+# Questions about the user, answered from what they told the bot
+_PERSONAL = re.compile(r"\b(i|i'm|me|my|mine|we|us|our)\b")
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(text):
+    """Lowercase the question and drop the spacing and trailing punctuation that do not change its meaning."""
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!.;: ")
+
+
+def is_follow_up(question):
+    """Tell whether a question only makes sense with the conversation before it."""
+    normalized = normalize_question(question)
+    return len(normalized.split()) < 3 or bool(_FOLLOW_UP.search(normalized))
+
+
+def context_key(history):
+    """Return the key of the conversation state a question is asked in, the recent turns and the summary."""
+    return hashlib.sha256(history.encode("utf-8")).hexdigest()
+
+
+class _ChatIndex():
+    """Cached answers of one chat with their unit-length question vectors, oldest first."""
+
+    def __init__(self):
+        self.entries = []
+        self.vectors = None
+
+    def add(self, entry, vector, max_entries):
+        import numpy as np
+        self.entries.append(entry)
+        self.vectors = vector[None, :] if self.vectors is None else np.vstack((self.vectors, vector))
+        if len(self.entries) > max_entries:
+            self.keep(range(len(self.entries) - max_entries, len(self.entries)))
+
+    def keep(self, indexes):
+        """Keep only the entries at the given positions, return how many were dropped."""
+        indexes = list(indexes)
+        dropped = len(self.entries) - len(indexes)
+        if dropped:
+            self.entries = [self.entries[i] for i in indexes]
+            self.vectors = self.vectors[indexes] if indexes else None
+        return dropped
+
+
+class ResponseCache():
+    """
+    Returns an earlier answer when a new question is close enough to the one it answered.
+
+    Standalone questions answered without tools, or only with the tools in SHARED_TOOLS, get the same
+    answer for every user and are shared across chats. Answers from the user's documents or about the
+    user stay in their chat, and follow-ups such as "and the second one?" only match in the same chat
+    with the same history. Each entry remembers the tools the agent used, which decide whether it is
+    cached at all, how long it lives and which changes invalidate it.
+    """
+
+    def __init__(self, embeddings, threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL,
+                 max_chats=RESPONSE_CACHE_MAX_CHATS, max_per_chat=RESPONSE_CACHE_MAX_PER_CHAT,
+                 max_shared=RESPONSE_CACHE_MAX_SHARED):
+        # Question vectors go through the embedding cache as well
+        self.pipeline = EmbeddingPipeline(embeddings)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_chat = max_per_chat
+        self.max_shared = max_shared
+
+        # chat id -> _ChatIndex
+        self._chats = LRUCache(maxsize=max_chats)
+        self._shared = _ChatIndex()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    async def embed(self, question):
+        """Return the unit-length vector of a normalized question."""
+        import numpy as np
+        vector = np.asarray((await self.pipeline.embed([normalize_question(question)]))[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, chat_id, question, vector, history):
+        """
+        Return the cached answer closest to the question vector, None below the threshold.
+
+        :param chat_id: The chat the question is asked in.
+        :param question: The question as the user asked it.
+        :param vector: The unit-length vector of the question.
+        :param history: The formatted chat history the question is asked with.
+        """
+        if is_follow_up(question):
+            scopes = [(self._chats.get(chat_id), context_key(history))]
+        else:
+            scopes = [(self._chats.get(chat_id), ""), (self._shared, "")]
+
+        for index, context in scopes:
+            entry, similarity = self._closest(index, vector, context)
+            if entry is not None:
+                self.hits += 1
+                logger.info(f"Response cache hit for chat {chat_id} (similarity {similarity:.3f}, "
+                            f"hit ratio {self.hit_ratio():.2%}): {entry['question']!r}")
+                return entry["answer"]
+        self.misses += 1
+        return None
+
+    def _closest(self, index, vector, context):
+        """Return the unexpired entry of the index asked in the context closest to the vector and its similarity."""
+        if index is None:
+            return None, 0.0
+        now = time.time()
+        self.expired += index.keep(i for i, entry in enumerate(index.entries) if entry["expires_at"] > now)
+
+        candidates = [i for i, entry in enumerate(index.entries) if entry["context"] == context]
+        if not candidates:
+            return None, 0.0
+        similarities = index.vectors[candidates] @ vector
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None, 0.0
+        return index.entries[candidates[best]], float(similarities[best])
+
+    def store(self, chat_id, question, vector, answer, tools, history):
+        """Cache an answer unless one of the tools it used makes it uncacheable, return True if stored."""
+        tools = frozenset(tools)
+        if tools & UNCACHEABLE_TOOLS:
+            self.skipped += 1
+            return False
+
+        # Follow-ups depend on the whole conversation, answers from the user's documents or about
+        # the user only on the chat, the others on nothing but the question
+        context = ""
+        shared = False
+        if is_follow_up(question):
+            context = context_key(history)
+        elif tools <= SHARED_TOOLS and not _PERSONAL.search(normalize_question(question)):
+            shared = True
+
+        ttl = min([self.ttl] + [TOOL_TTLS[tool] for tool in tools if tool in TOOL_TTLS])
+        entry = {"question": question, "answer": answer, "tools": tools, "context": context,
+                 "expires_at": time.time() + ttl}
+
+        if shared:
+            self._shared.add(entry, vector, self.max_shared)
+        else:
+            index = self._chats.get(chat_id)
+            if index is None:
+                index = self._chats[chat_id] = _ChatIndex()
+            index.add(entry, vector, self.max_per_chat)
+        self.stores += 1
+        return True
+
+    def invalidate(self, chat_id, tool=None):
+        """Drop the chat's answers that used the tool, or all of them without a tool."""
+        index = self._chats.get(chat_id)
+        if index is None:
+            return
+        if tool is None:
+            dropped = len(index.entries)
+            del self._chats[chat_id]
+        else:
+            dropped = index.keep(i for i, entry in enumerate(index.entries) if tool not in entry["tools"])
+        self.invalidated += dropped
+        if dropped:
+            logger.info(f"Invalidated {dropped} cached answers of chat {chat_id}")
+
+    def hit_ratio(self):
+        """Return the share of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the cache counters."""
+        return {
+            "chats": len(self._chats),
+            "entries": sum(len(index.entries) for index in self._chats.values()),
+            "shared_entries": len(self._shared.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+            "stores": self.stores,
+            "skipped": self.skipped,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+        }
+
+
+_cache = None
+
+def get_response_cache(openai_api_key):
+    """Return the process-wide response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        _cache = ResponseCache(OpenAIEmbeddings(openai_api_key=openai_api_key))
+    return _cache
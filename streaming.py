@@ -0,0 +1,96 @@
+"""
+Streaming of the agent's final answer to a chat through progressive message edits.
+"""
+
+import os
+import logging
+import asyncio
+
+# Minimum seconds between two edits of the same message, Telegram allows roughly one per second
+EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", 1.0))
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+logger = logging.getLogger(__name__)
+
+def _drain(queue, parts):
+    """Move every token already queued into parts, return True when the stream ended."""
+    while not queue.empty():
+        token = queue.get_nowait()
+        if token is None:
+            return True
+        parts.append(token)
+    return False
+
+
+async def stream_reply(queue, send, edit, started=None, on_first_token=None,
+                       min_interval=EDIT_INTERVAL, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Show the tokens from the queue to the user until a None sentinel arrives.
+
+    The first tokens are sent with send(text), which must return the sent message,
+    later tokens are coalesced into edit(message, text) calls at most once per
+    min_interval seconds. started is the loop time the request was received at and
+    is used to log the time to the first visible token. Returns the streamed text,
+    empty if nothing was streamed.
+    """
+    loop = asyncio.get_running_loop()
+    started = started or loop.time()
+
+    streamed = []
+    text = ""
+    shown = ""
+    message = None
+    last_edit = 0.0
+    first_visible = True
+    done = False
+
+    while not done:
+        # Wait for the next token, then take everything else already queued
+        token = await queue.get()
+        parts = []
+        if token is None:
+            done = True
+        else:
+            parts.append(token)
+            done = _drain(queue, parts)
+
+        # Coalesce tokens until the next edit is allowed
+        if message is not None and not done:
+            delay = last_edit + min_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                done = _drain(queue, parts)
+
+        chunk = "".join(parts)
+        streamed.append(chunk)
+        text += chunk
+
+        # Start a new message when the current one is full
+        while len(text) > max_length:
+            if message is None:
+                await send(text[:max_length])
+            elif shown != text[:max_length]:
+                await edit(message, text[:max_length])
+            text = text[max_length:]
+            message = None
+            shown = ""
+
+        if not text.strip() or text == shown:
+            continue
+
+        if first_visible:
+            first_visible = False
+            logger.info(f"Time to first visible token: {(loop.time() - started) * 1000:.0f} ms")
+            if on_first_token is not None:
+                on_first_token()
+
+        if message is None:
+            message = await send(text)
+        else:
+            await edit(message, text)
+        shown = text
+        last_edit = loop.time()
+
+    return "".join(streamed)
@@ -0,0 +1,169 @@
+"""
+Incremental map-reduce summarization that reuses the map result of every chunk it has seen.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import asyncio
+import threading
+
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+
+# Summarizer defaults
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", os.path.join("db", "summary_cache.sqlite"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 200000))
+SUMMARY_MAX_CONCURRENCY = int(os.environ.get("SUMMARY_MAX_CONCURRENCY", 4))
+SUMMARY_TOKEN_MAX = int(os.environ.get("SUMMARY_TOKEN_MAX", 3000))
+
+SUMMARY_PROMPT = """Write a concise summary of the following text, use simple language and bullet points:
+                        {text}
+
+                        SUMMARY:"""
+
+_SQL_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+class SummaryCache():
+    """SQLite-backed cache of map-step summaries keyed by a hash of the model name, prompt and chunk text."""
+
+    def __init__(self, path=SUMMARY_CACHE_PATH, max_entries=SUMMARY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, prompt, text):
+        """Return the cache key of a chunk summarized by a model with a prompt."""
+        return hashlib.sha256(f"{model}\0{prompt}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, prompt, texts):
+        """Return the cached summary of each text, None where it is missing."""
+        keys = [self.key(model, prompt, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(batch))})", batch)
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE summaries SET last_used = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model, prompt, texts, summaries):
+        """Store the summaries of the texts and drop the oldest entries past the limit."""
+        now = time.time()
+        rows = [(self.key(model, prompt, text), summary, now) for text, summary in zip(texts, summaries)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)", rows)
+            self._conn.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                "SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+
+_cache = None
+
+def get_summary_cache():
+    """Return the process-wide summary cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = SummaryCache()
+    return _cache
+
+
+class IncrementalSummarizer():
+    """Map-reduce summarizer that only runs the map step for chunks it has not summarized before."""
+
+    def __init__(self, llm, cache=None, max_concurrency=SUMMARY_MAX_CONCURRENCY, token_max=SUMMARY_TOKEN_MAX):
+        self.llm = llm
+        # Summaries written by another model are not reused
+        self.model = getattr(llm, "model_name", type(llm).__name__)
+        self.cache = cache if cache is not None else get_summary_cache()
+        self.max_concurrency = max_concurrency
+        self.token_max = token_max
+
+        # The same prompt is used for the map and the reduce steps
+        self.prompt = PromptTemplate(template=SUMMARY_PROMPT, input_variables=["text"])
+        self.chain = LLMChain(llm=llm, prompt=self.prompt)
+
+    async def _map(self, texts):
+        """Summarize each text, reusing cached results and bounding the calls in flight."""
+        loop = asyncio.get_running_loop()
+        summaries = await loop.run_in_executor(None, lambda: self.cache.get_many(self.model, SUMMARY_PROMPT, texts))
+
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        if missing:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run(text):
+                async with semaphore:
+                    return await self.chain.arun(text=text)
+
+            missing_texts = [texts[i] for i in missing]
+            results = await asyncio.gather(*(run(text) for text in missing_texts))
+            await loop.run_in_executor(None, lambda: self.cache.put_many(self.model, SUMMARY_PROMPT, missing_texts, results))
+            for i, summary in zip(missing, results):
+                summaries[i] = summary
+
+        logger.info(f"Summarized {len(missing)} of {len(texts)} chunks, {len(texts) - len(missing)} reused")
+
+        return summaries
+
+    def _group(self, summaries):
+        """Split the summaries into groups that fit in a single call."""
+        groups = []
+        group = []
+        group_tokens = 0
+        for summary in summaries:
+            tokens = self.llm.get_num_tokens(summary)
+            if group and group_tokens + tokens > self.token_max:
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append(summary)
+            group_tokens += tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    async def summarize(self, docs):
+        """Return the summary of the documents."""
+        summaries = await self._map([doc.page_content for doc in docs])
+
+        # Collapse the map results until they fit in the reduce step, collapsed groups are cached too
+        while len(summaries) > 1 and self.llm.get_num_tokens("\n\n".join(summaries)) > self.token_max:
+            groups = self._group(summaries)
+            if len(groups) == len(summaries):
+                break
+            summaries = await self._map(["\n\n".join(group) for group in groups])
+
+        # The reduce step is cheap, it always runs on the current map results
+        return await self.chain.arun(text="\n\n".join(summaries))
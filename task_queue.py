@@ -0,0 +1,98 @@
+"""
+Background task queue with a shared worker pool and per-chat concurrency limits.
+"""
+
+import os
+import time
+import logging
+import asyncio
+from collections import defaultdict, deque
+
+# Queue defaults
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", 4))
+BACKGROUND_PER_CHAT_LIMIT = int(os.environ.get("BACKGROUND_PER_CHAT_LIMIT", 1))
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTaskQueue():
+    """Runs coroutines in the background, at most per_chat_limit at a time for each chat."""
+
+    def __init__(self, workers=BACKGROUND_WORKERS, per_chat_limit=BACKGROUND_PER_CHAT_LIMIT):
+        self.workers = workers
+        self.per_chat_limit = per_chat_limit
+
+        # Jobs waiting for their chat to have a free slot, and jobs ready for a worker
+        self._pending = defaultdict(deque)
+        self._running = defaultdict(int)
+        self._ready = asyncio.Queue()
+        self._tasks = []
+
+        self.completed = 0
+        self.failed = 0
+
+    def depth(self):
+        """Return the number of jobs that have not started yet."""
+        return sum(len(jobs) for jobs in self._pending.values()) + self._ready.qsize()
+
+    def submit(self, chat_id, coro_factory, name="task"):
+        """Queue coro_factory() to run in the background for a chat."""
+        self._ensure_workers()
+        self._pending[chat_id].append((coro_factory, name, time.monotonic()))
+        self._schedule(chat_id)
+        logger.info(f"Queued {name} for chat {chat_id}, queue depth {self.depth()}")
+
+    def _schedule(self, chat_id):
+        """Hand the chat's pending jobs to the workers while it is under its limit."""
+        pending = self._pending[chat_id]
+        while pending and self._running[chat_id] < self.per_chat_limit:
+            self._running[chat_id] += 1
+            self._ready.put_nowait((chat_id,) + pending.popleft())
+
+        # Forget idle chats
+        if not pending:
+            del self._pending[chat_id]
+        if not self._running[chat_id]:
+            del self._running[chat_id]
+
+    def _ensure_workers(self):
+        """Start the workers on the running event loop."""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            chat_id, coro_factory, name, queued_at = await self._ready.get()
+            started = time.monotonic()
+            try:
+                await coro_factory()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error running {name} for chat {chat_id}: {e}")
+            finally:
+                finished = time.monotonic()
+                logger.info(f"Finished {name} for chat {chat_id}: waited {started - queued_at:.2f}s, "
+                            f"ran {finished - started:.2f}s, queue depth {self.depth()}")
+                self._running[chat_id] -= 1
+                self._schedule(chat_id)
+                self._ready.task_done()
+
+    def stats(self):
+        """Return the queue counters."""
+        return {
+            "depth": self.depth(),
+            "running": sum(self._running.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+_queue = None
+
+def get_task_queue():
+    """Return the process-wide background task queue."""
+    global _queue
+    if _queue is None:
+        _queue = BackgroundTaskQueue()
+    return _queue
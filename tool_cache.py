@@ -0,0 +1,110 @@
+"""
+Shared cache of search tool results with per-tool TTLs, single-flight lookups and a bounded thread pool.
+"""
+
+import os
+import time
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import LRUCache
+
+# Cache defaults
+TOOL_CACHE_MAX_ENTRIES = int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", 5000))
+TOOL_EXECUTOR_WORKERS = int(os.environ.get("TOOL_EXECUTOR_WORKERS", 8))
+
+# Seconds a result stays valid, encyclopedic results live long, web and Wolfram results are time-sensitive
+TOOL_CACHE_TTLS = {
+    "wikipedia": int(os.environ.get("TOOL_CACHE_TTL_WIKIPEDIA", 24 * 3600)),
+    "google": int(os.environ.get("TOOL_CACHE_TTL_GOOGLE", 600)),
+    "wolframalpha": int(os.environ.get("TOOL_CACHE_TTL_WOLFRAMALPHA", 300)),
+}
+TOOL_CACHE_DEFAULT_TTL = int(os.environ.get("TOOL_CACHE_DEFAULT_TTL", 600))
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query):
+    """Lowercase the query and collapse its whitespace, so trivially different queries share a result."""
+    return " ".join(query.lower().split())
+
+
+class ToolResultCache():
+    """
+    LRU cache of blocking tool calls keyed by tool and normalized query.
+
+    Concurrent calls with the same key share a single in-flight request, and the calls
+    run on a dedicated bounded thread pool instead of the loop's default executor.
+    """
+
+    def __init__(self, max_entries=TOOL_CACHE_MAX_ENTRIES, workers=TOOL_EXECUTOR_WORKERS,
+                 ttls=TOOL_CACHE_TTLS, default_ttl=TOOL_CACHE_DEFAULT_TTL):
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+
+        # (tool, normalized query) -> (expiry time, result)
+        self._results = LRUCache(maxsize=max_entries)
+        # (tool, normalized query) -> future of the request in flight
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    async def run(self, tool, query, func):
+        """Return func(query) for the tool, from the cache, a request in flight or a new call on the pool."""
+        key = (tool, normalize_query(query))
+
+        entry = self._results.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            del self._results[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            # Shielded so a cancelled caller does not cancel the request for the others
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, query)
+        self._inflight[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            del self._inflight[key]
+
+        # Empty results are not worth keeping, the next call may succeed
+        if result:
+            self._results[key] = (time.monotonic() + self.ttls.get(tool, self.default_ttl), result)
+        return result
+
+    def hit_ratio(self):
+        """Return the share of calls that did not need a new request."""
+        calls = self.hits + self.shared + self.misses
+        return (self.hits + self.shared) / calls if calls else 0.0
+
+    def stats(self):
+        """Return the cache counters."""
+        return {
+            "size": len(self._results),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+        }
+
+
+_cache = None
+
+def get_tool_cache():
+    """Return the process-wide tool result cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ToolResultCache()
+    return _cache
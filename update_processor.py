@@ -0,0 +1,54 @@
+"""
+Telegram update processor with a global concurrency cap and per-chat serialization.
+"""
+
+import os
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Updates processed at the same time across all chats
+TELEGRAM_MAX_CONCURRENT_UPDATES = int(os.environ.get("TELEGRAM_MAX_CONCURRENT_UPDATES", 64))
+
+# Cap given to the base class, whose slot every update takes before its chat's turn, so it must never be the limit
+_UNBOUNDED = 2 ** 31 - 1
+
+logger = logging.getLogger(__name__)
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    """Processes up to max_concurrent_updates updates at once, one at a time for each chat."""
+
+    def __init__(self, max_concurrent_updates=TELEGRAM_MAX_CONCURRENT_UPDATES):
+        super().__init__(_UNBOUNDED)
+
+        # Taken after the chat's lock, so only updates that can run hold a global slot and the
+        # updates queued behind a busy chat do not block the other chats
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,397 @@
+"""
+Vector index backends of a collection: the Chroma collection, and a local IVF index over memory-mapped vectors.
+"""
+
+import os
+import json
+import math
+import shutil
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# Local index defaults
+ANN_DIRECTORY = os.environ.get("ANN_DIRECTORY", os.path.join("db", "ann"))
+# Storage of the vectors, float16 halves and int8 quarters the float32 size
+ANN_DTYPE = os.environ.get("ANN_DTYPE", "float16")
+# Inverted lists, 0 picks 4 * sqrt(vectors) when the index is trained
+ANN_NLIST = int(os.environ.get("ANN_NLIST", 0))
+# Lists scanned per query, more is slower and closer to exact search
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 8))
+# Below this many vectors every query scans them all, the lists are trained once it is reached
+ANN_TRAIN_MIN = int(os.environ.get("ANN_TRAIN_MIN", 2048))
+ANN_TRAIN_SAMPLE = int(os.environ.get("ANN_TRAIN_SAMPLE", 65536))
+ANN_KMEANS_ITERATIONS = int(os.environ.get("ANN_KMEANS_ITERATIONS", 10))
+
+# Rows decoded at once when scanning or assigning many vectors
+_BLOCK = 65536
+_SQL_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+def normalize(vectors):
+    """Return the vectors as float32 rows of unit length, so inner products are cosine similarities."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class VectorBackend(ABC):
+    """Stores the chunks of one collection with their embeddings and finds the nearest ones."""
+
+    # Whether writes only reach the disk when the client is persisted, see vectordb.Checkpointer
+    checkpointed = False
+
+    @abstractmethod
+    def add(self, ids, embeddings, documents, metadatas):
+        """
+        Add chunks, replacing the chunks with the same ids.
+
+        :param ids: The chunk ids.
+        :param embeddings: The embedding of each chunk.
+        :param documents: The text of each chunk.
+        :param metadatas: The metadata of each chunk.
+        """
+        pass
+
+    @abstractmethod
+    def query(self, embedding, k):
+        """
+        Return up to k (chunk id, cosine similarity) pairs nearest to the embedding, best first.
+
+        :param embedding: The query embedding.
+        :param k: The number of chunks to return.
+        """
+        pass
+
+    @abstractmethod
+    def get(self, ids):
+        """
+        Return (chunk id, text, metadata) for the chunks that exist among the ids.
+
+        :param ids: The chunk ids.
+        """
+        pass
+
+    @abstractmethod
+    def documents(self):
+        """Return the ids and texts of every chunk."""
+        pass
+
+    @abstractmethod
+    def delete(self, ids):
+        """
+        Remove chunks.
+
+        :param ids: The chunk ids.
+        """
+        pass
+
+    @abstractmethod
+    def count(self):
+        """Return the number of chunks."""
+        pass
+
+    @abstractmethod
+    def drop(self):
+        """Delete the collection."""
+        pass
+
+    def persist(self):
+        """Write pending changes to disk."""
+        pass
+
+
+class ChromaBackend(VectorBackend):
+    """A Chroma collection, opened through the LangChain wrapper so it keeps its embedding function."""
+
+    checkpointed = True
+
+    def __init__(self, collection_name, embeddings, client=None, client_settings=None, persist_directory=None):
+        from langchain.vectorstores import Chroma
+        self.store = Chroma(client=client, embedding_function=embeddings, client_settings=client_settings,
+                            persist_directory=persist_directory, collection_name=collection_name)
+        self.persist_directory = persist_directory
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.store._collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def query(self, embedding, k):
+        # Chroma refuses k above the collection size, callers bound it by the count they know
+        result = self.store._collection.query(query_embeddings=[list(embedding)], n_results=k,
+                                              include=["distances"])
+        # Squared L2 distance of unit vectors, 2 - 2 * cosine similarity
+        return [(chunk_id, 1 - distance / 2) for chunk_id, distance in zip(result["ids"][0], result["distances"][0])]
+
+    def get(self, ids):
+        data = self.store._collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return list(zip(data["ids"], data["documents"], data["metadatas"]))
+
+    def documents(self):
+        data = self.store._collection.get(include=["documents"])
+        return data["ids"], data["documents"]
+
+    def delete(self, ids):
+        self.store._collection.delete(ids=list(ids))
+
+    def count(self):
+        return self.store._collection.count()
+
+    def drop(self):
+        self.store.delete_collection()
+
+    def persist(self):
+        if self.persist_directory:
+            self.store.persist()
+
+
+class IVFBackend(VectorBackend):
+    """
+    Local inverted-file index: the vectors are clustered into nlist lists and a query scans the nprobe
+    lists whose centroids are nearest to it.
+
+    Vectors are appended to a memory-mapped file as float16, or as int8 with a scale per vector, so
+    only the scanned rows are paged in. Chunk ids, texts and metadata are kept in SQLite next to it.
+    Deleted rows are only flagged, their space is not reclaimed.
+    """
+
+    def __init__(self, directory, dtype=ANN_DTYPE, nlist=ANN_NLIST, nprobe=ANN_NPROBE,
+                 train_min=ANN_TRAIN_MIN, train_sample=ANN_TRAIN_SAMPLE, iterations=ANN_KMEANS_ITERATIONS):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unknown ANN dtype {dtype!r}, expected float16 or int8")
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.train_sample = train_sample
+        self.iterations = iterations
+
+        self.requested_dtype = dtype
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        """Load the index from its directory, creating it when missing."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(self._path("chunks.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+                "document TEXT, metadata TEXT, deleted INTEGER NOT NULL DEFAULT 0)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+
+        # An existing index keeps the storage type it was created with
+        self.dtype = meta.get("dtype", self.requested_dtype)
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.trained_rows = int(meta.get("trained_rows", 0))
+
+        self.rows = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+        self.deleted = np.zeros(self.rows, dtype=bool)
+        deleted_rows = [row for (row,) in self._conn.execute("SELECT row FROM chunks WHERE deleted = 1")]
+        self.deleted[deleted_rows] = True
+
+        centroids_path = self._path("centroids.npy")
+        self.centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        self.assignments = np.fromfile(self._path("lists.dat"), dtype=np.int32)[:self.rows] \
+            if os.path.exists(self._path("lists.dat")) else np.zeros(0, dtype=np.int32)
+        self._vectors = None
+        self._scales = None
+        # Rows written just before a crash may miss their list
+        if self.centroids is not None and len(self.assignments) < self.rows:
+            self._append_assignments(self._assign(self._decode(np.arange(len(self.assignments), self.rows))))
+        self._build_lists()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_at(self, name, data, offset):
+        """Write data at an offset of a file and cut what follows, e.g. rows left over by a crash."""
+        path = self._path(name)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def _set_meta(self, **values):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   [(key, str(value)) for key, value in values.items()])
+
+    def _build_lists(self):
+        """Group the rows by the list they are assigned to."""
+        self.lists = {}
+        if self.centroids is None or not len(self.assignments):
+            return
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = {i: order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))}
+
+    def _storage(self):
+        """Return the memory-mapped vectors and the int8 scales, mapped again after appends."""
+        if self._vectors is None and self.rows:
+            storage = np.int8 if self.dtype == "int8" else np.float16
+            self._vectors = np.memmap(self._path("vectors.dat"), dtype=storage, mode="r", shape=(self.rows, self.dim))
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._path("scales.dat"), dtype=np.float32, mode="r", shape=(self.rows,))
+        return self._vectors, self._scales
+
+    def _encode(self, vectors):
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1)
+        scales = np.where(scales > 0, scales, 1).astype(np.float32)
+        return np.round(vectors / scales[:, None] * 127).astype(np.int8), scales
+
+    def _decode(self, rows):
+        vectors, scales = self._storage()
+        if self.dtype == "float16":
+            return vectors[rows].astype(np.float32)
+        return vectors[rows].astype(np.float32) * (scales[rows] / 127)[:, None]
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_meta(dim=self.dim, dtype=self.dtype)
+
+            # Same ids replace the old chunks
+            self.delete(ids)
+
+            # The files are written before the rows are committed, their length is only trusted up to the rows
+            encoded, scales = self._encode(vectors)
+            self._write_at("vectors.dat", encoded.tobytes(), self.rows * self.dim * encoded.itemsize)
+            if scales is not None:
+                self._write_at("scales.dat", scales.tobytes(), self.rows * scales.itemsize)
+
+            first = self.rows
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(first + i, chunk_id, document, json.dumps(metadata or {}))
+                     for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))])
+            self.rows += len(vectors)
+            self.deleted = np.concatenate((self.deleted, np.zeros(len(vectors), dtype=bool)))
+            self._vectors = None
+
+            if self.centroids is not None:
+                assignments = self._assign(vectors)
+                self._append_assignments(assignments)
+                for list_id in np.unique(assignments):
+                    new_rows = first + np.flatnonzero(assignments == list_id)
+                    self.lists[int(list_id)] = np.concatenate((self.lists.get(int(list_id), new_rows[:0]), new_rows))
+
+            # Train the lists once there are enough vectors, and again after the index grew fourfold
+            live = self.count()
+            if (self.centroids is None and live >= self.train_min) or \
+                    (self.centroids is not None and live > 4 * self.trained_rows):
+                self.train()
+
+    def _append_assignments(self, assignments):
+        self._write_at("lists.dat", assignments.tobytes(), len(self.assignments) * assignments.itemsize)
+        self.assignments = np.concatenate((self.assignments, assignments))
+
+    def train(self):
+        """Cluster a sample of the vectors with spherical k-means and assign every row to a list."""
+        with self._lock:
+            live_rows = np.flatnonzero(~self.deleted)
+            if not len(live_rows):
+                return
+            nlist = self.nlist or max(1, int(4 * math.sqrt(len(live_rows))))
+            nlist = min(nlist, len(live_rows))
+
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(live_rows, size=min(self.train_sample, len(live_rows)), replace=False))
+            data = self._decode(sample)
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+            for _ in range(self.iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                counts = np.bincount(labels, minlength=nlist)
+                # Empty clusters keep their previous centroid
+                centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+            self.centroids = centroids
+
+            assignments = np.empty(self.rows, dtype=np.int32)
+            for start in range(0, self.rows, _BLOCK):
+                assignments[start:start + _BLOCK] = self._assign(self._decode(np.arange(start, min(start + _BLOCK, self.rows))))
+            self.assignments = assignments
+            assignments.tofile(self._path("lists.dat"))
+            np.save(self._path("centroids.npy"), centroids)
+            self.trained_rows = len(live_rows)
+            self._set_meta(trained_rows=self.trained_rows)
+            self._build_lists()
+            logger.info(f"Trained {nlist} lists over {len(live_rows)} vectors in {self.directory}")
+
+    def query(self, embedding, k):
+        query = normalize(embedding)[0]
+        with self._lock:
+            if self.centroids is None:
+                rows = np.flatnonzero(~self.deleted)
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                rows = np.concatenate([self.lists.get(int(list_id), np.zeros(0, dtype=np.int64)) for list_id in probed])
+                rows = np.sort(rows[~self.deleted[rows]])
+            if not len(rows):
+                return []
+
+            scores = np.concatenate([self._decode(rows[start:start + _BLOCK]) @ query
+                                     for start in range(0, len(rows), _BLOCK)])
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            best_rows = [int(rows[i]) for i in top]
+            ids = dict(self._conn.execute(
+                f"SELECT row, id FROM chunks WHERE row IN ({','.join('?' * len(best_rows))})", best_rows))
+        return [(ids[row], float(scores[i])) for row, i in zip(best_rows, top)]
+
+    def get(self, ids):
+        ids = list(ids)
+        found = []
+        with self._lock:
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                found.extend(self._conn.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})",
+                    batch))
+        return [(chunk_id, document, json.loads(metadata)) for chunk_id, document, metadata in found]
+
+    def documents(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, document FROM chunks WHERE deleted = 0").fetchall()
+        return [chunk_id for chunk_id, _ in rows], [document for _, document in rows]
+
+    def delete(self, ids):
+        ids = list(ids)
+        with self._lock:
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = [row for (row,) in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", batch)]
+                if rows:
+                    with self._conn:
+                        self._conn.execute(f"UPDATE chunks SET deleted = 1 WHERE id IN ({placeholders})", batch)
+                    self.deleted[rows] = True
+
+    def count(self):
+        return int(self.rows - self.deleted.sum())
+
+    def drop(self):
+        with self._lock:
+            self._conn.close()
+            self._vectors = None
+            self._scales = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+            # Start over empty, the collection can be filled again
+            self._open()
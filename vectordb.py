@@ -3,27 +3,158 @@ Vector database for storing vectors and their metadata.
 """
 
 import os
+import time
+import uuid
 import logging
 import asyncio
+import functools
+from collections import OrderedDict
+
+import chromadb
 
-from langchain.document_loaders import UnstructuredFileLoader, WebBaseLoader
 from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores import Chroma
 from langchain import OpenAI
-from langchain.chains import RetrievalQAWithSourcesChain
-from langchain.prompts import PromptTemplate
-from langchain.chains.summarize import load_summarize_chain
 from chromadb.config import Settings
 
+from ingestion import EmbeddingPipeline, log_progress
+from chunking import TokenChunker
+from crawler import Crawler, get_crawl_state
+from document_registry import get_document_registry, file_hash, text_hash
+from summarizer import IncrementalSummarizer
+from hybrid_retrieval import BM25Index, RETRIEVAL_K, HYBRID_FETCH_K, search_lexically, fuse
+from vector_backends import ChromaBackend, IVFBackend, ANN_DIRECTORY
+
+# Index of the chunk vectors: "chroma" keeps them in Chroma, "ivf" in a local memory-mapped
+# IVF index per collection under ANN_DIRECTORY, tuned with the ANN_* settings
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+
+# Chroma backend: "embedded" keeps duckdb+parquet files in this process, "server" talks to a
+# Chroma server over REST so several bot processes share one index (python vectordb.py serve)
+CHROMA_MODE = os.environ.get("CHROMA_MODE", "embedded")
+CHROMA_PERSIST_DIRECTORY = os.environ.get("CHROMA_PERSIST_DIRECTORY", "db")
+CHROMA_SERVER_HOST = os.environ.get("CHROMA_SERVER_HOST", "localhost")
+# Not 8000, where the FastAPI apps of the bots listen
+CHROMA_SERVER_PORT = int(os.environ.get("CHROMA_SERVER_PORT", 8001))
+# Seconds between checkpoints of the embedded store, 0 only persists on shutdown
+CHROMA_PERSIST_INTERVAL = int(os.environ.get("CHROMA_PERSIST_INTERVAL", 300))
+
+def chroma_settings(mode=CHROMA_MODE):
+    """Return the Chroma client settings of a backend mode."""
+    if mode == "server":
+        return Settings(
+            chroma_api_impl="rest",
+            chroma_server_host=CHROMA_SERVER_HOST,
+            chroma_server_http_port=CHROMA_SERVER_PORT,
+            anonymized_telemetry=False)
+    if mode == "embedded":
+        return Settings(
+            chroma_db_impl="duckdb+parquet",
+            persist_directory=CHROMA_PERSIST_DIRECTORY,
+            anonymized_telemetry=False)
+    raise ValueError(f"Unknown CHROMA_MODE {mode!r}, expected embedded or server")
+
 # Set Chroma settings
-CHROMA_SETTINGS = Settings(
-    chroma_db_impl="duckdb+parquet",
-    persist_directory="db",
-    anonymized_telemetry=False)
+CHROMA_SETTINGS = chroma_settings()
+
+def create_vector_backend(collection_name, embeddings, client=None, backend=VECTOR_BACKEND):
+    """
+    Factory function to open the vector index of a collection.
+
+    :param collection_name: The name of the collection, the chat user id.
+    :param embeddings: The embeddings of the collection, used by Chroma.
+    :param client: The shared Chroma client, if any.
+    :param backend: The type of index to use. Can be "chroma" or "ivf".
+    :return: A VectorBackend instance.
+    """
+    if backend == "chroma":
+        return ChromaBackend(collection_name, embeddings, client=client, client_settings=CHROMA_SETTINGS,
+                             persist_directory=CHROMA_PERSIST_DIRECTORY if CHROMA_MODE == "embedded" else None)
+    elif backend == "ivf":
+        return IVFBackend(os.path.join(ANN_DIRECTORY, collection_name))
+    else:
+        raise ValueError(f"Unsupported backend: {backend}")
+
+# Pool defaults
+POOL_MAXSIZE = int(os.environ.get("VECTORDB_POOL_MAXSIZE", 128))
+POOL_IDLE_TTL = int(os.environ.get("VECTORDB_POOL_IDLE_TTL", 1800))
+
+def rate_limited(llm):
+    """Make every call of the llm wait for its quota in the shared rate limiter."""
+    from agent_callbacks import RateLimitCallbackHandler
+    llm.callbacks = [RateLimitCallbackHandler(llm.model_name)]
+    return llm
+
+
+class Checkpointer():
+    """
+    Persists an embedded Chroma client every interval seconds when it changed, and on close.
+
+    Writing the parquet files rewrites every collection, so it is batched here instead of done
+    after each ingestion. In server mode the server owns persistence and this does nothing.
+    The registry's deferred changes are written after the checkpoint that persisted their chunks.
+    """
+
+    def __init__(self, client, interval=CHROMA_PERSIST_INTERVAL, mode=CHROMA_MODE, registry=None):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.interval = interval
+        self.registry = registry
+        self.enabled = mode == "embedded" and client is not None
+        self.dirty = False
+        self.checkpoints = 0
+        self._task = None
+        self._lock = None
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def start(self):
+        """Start the periodic checkpoints, once, from the event loop."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self.enabled and self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                self.logger.error(f"Error persisting the vector store: {e}")
+
+    async def checkpoint(self):
+        """Write the store to disk if it changed since the last checkpoint."""
+        if not self.enabled or not self.dirty:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Changes made while writing are picked up by the next checkpoint
+            self.dirty = False
+            mark = self.registry.mark() if self.registry is not None else None
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.client.persist)
+            except Exception:
+                self.dirty = True
+                raise
+            if self.registry is not None:
+                await loop.run_in_executor(None, self.registry.flush, mark)
+            self.checkpoints += 1
+            self.logger.info(f"Persisted the vector store in {time.monotonic() - started:.2f}s")
+
+    async def close(self):
+        """Stop the periodic checkpoints and write the pending changes."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.checkpoint()
+
 
 class VectorDB():
-    def __init__(self, chat_user_id, openai_api_key):
+    def __init__(self, chat_user_id, openai_api_key, client=None, embeddings=None, llm=None, checkpointer=None):
         if not isinstance(chat_user_id, str) or not isinstance(openai_api_key, str):
             raise ValueError("chat_user_id and openai_api_key must be strings.")
             
@@ -31,72 +162,313 @@ class VectorDB():
         logging.basicConfig(
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
-        self.text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-        self.vector_store = Chroma(embedding_function=self.embeddings, client_settings=CHROMA_SETTINGS, persist_directory="db", collection_name=chat_user_id)
-        self.llm = OpenAI(openai_api_key=openai_api_key, temperature=0)
+        self.chunker = TokenChunker()
+        self.chat_user_id = chat_user_id
+        # Reuse the shared client, embeddings and llm when they are provided by the pool
+        self.embeddings = embeddings or OpenAIEmbeddings(openai_api_key=openai_api_key)
+        self.backend = create_vector_backend(chat_user_id, self.embeddings, client=client)
+        # Without the pool's checkpointer every change is persisted right away
+        self.checkpointer = checkpointer
+        self.llm = llm or rate_limited(OpenAI(openai_api_key=openai_api_key, temperature=0))
+        self.pipeline = EmbeddingPipeline(self.embeddings)
+        self.registry = get_document_registry()
+        self.summarizer = IncrementalSummarizer(self.llm)
 
-    async def add_document(self, document):
-        """Ingest a document into the vector store."""
-        try:
-            # Load the document
-            loader = UnstructuredFileLoader(document)
-            doc = loader.load()
+        # BM25 index of the collection's chunks, built from the collection on the first query
+        self.lexical = None
+        self._lexical_lock = None
 
-            # Split the document into sentences
-            texts = self.text_splitter.split_documents(doc)
-            
-            # Store the embeddings
-            self.vector_store.add_documents(documents=texts)
-            
-            # Persist the vector store to disk
-            self.vector_store.persist()
+    async def index_document(self, document, progress=log_progress):
+        """Ingest a document into the vector store and return its chunks, none when it is unchanged."""
+        try:
+            loop = asyncio.get_running_loop()
 
-            # return the summary of the document
-            summary = await self.summarize(texts)
+            # The file name is the source, uploading the same file again replaces the previous version
+            source = os.path.basename(document)
+            content_hash = await loop.run_in_executor(None, file_hash, document)
+            if await self._is_unchanged(source, content_hash):
+                return []
 
-            return summary
+            # Parse the pages on the process pool and split them as they arrive
+            texts = await self.chunker.load(document)
+            
+            # Store the embeddings of the new chunks
+            return await self._store([(source, content_hash, texts)], progress=progress)
         except Exception as e:
             self.logger.error(f"Error adding document: {e}")
             return None
+
+    async def add_document(self, document, progress=log_progress):
+        """Ingest a document into the vector store and return its summary, empty when it is unchanged."""
+        texts = await self.index_document(document, progress=progress)
+        if texts is None:
+            return None
+        if not texts:
+            return ""
+
+        # return the summary of the document
+        return await self.summarize(texts)
     
     
-    async def add_url(self, url):
-        """Ingest a web page into the vector store."""
+    async def index_urls(self, urls, max_depth=0, progress=log_progress):
+        """
+        Ingest web pages into the vector store and return the chunks of the new and changed ones.
+
+        Sitemaps are expanded, and links are followed max_depth levels deep on the same site.
+        """
         try:
-            loader = WebBaseLoader(url)
+            # Fetch the pages concurrently, unchanged pages and near duplicates are skipped
+            crawler = Crawler(self.chat_user_id)
+            docs = await crawler.crawl(urls, max_depth=max_depth)
 
-            docs = loader.load()
+            # Split each page into token-sized chunks off the event loop, the URL is the source of its chunks
+            entries = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: [(doc.metadata["source"], text_hash(doc.page_content), self.chunker.split_documents([doc]))
+                               for doc in docs])
 
-            # Split the document into sentences
-            texts = self.text_splitter.split_documents(docs)
+            # Store the embeddings of the new chunks
+            texts = await self._store(entries, progress=progress)
+            await crawler.commit()
 
-            # Store the embeddings
-            self.vector_store.add_documents(documents=texts)
-            
-            # Persist the vector store to disk
-            self.vector_store.persist()
+            return texts
+        except Exception as e:
+            self.logger.error(f"Error adding urls: {e}")
+            return None
 
-            # Gather the summary
-            summary = await self.summarize(texts)
+    async def index_url(self, url, progress=log_progress):
+        """Ingest a web page into the vector store and return its chunks."""
+        return await self.index_urls([url], progress=progress)
 
-            return summary
-        except Exception as e:
-            self.logger.error(f"Error adding url: {e}")
+    async def add_url(self, url, progress=log_progress):
+        """Ingest a web page into the vector store and return its summary, empty when it is unchanged."""
+        texts = await self.index_url(url, progress=progress)
+        if texts is None:
             return None
+        if not texts:
+            return ""
+
+        # Gather the summary
+        return await self.summarize(texts)
     
 
+    async def _registered(self, source):
+        """
+        Return the content hash of the registered version of a document, {chunk hash: [chunk ids]} of
+        its chunks still in the vector backend and whether none are missing, or None.
+
+        Chunks can be missing after a crash lost the changes the store had not persisted yet.
+        """
+        loop = asyncio.get_running_loop()
+        registered = await loop.run_in_executor(None, self.registry.document, self.chat_user_id, source)
+        if registered is None:
+            return None
+        content_hash, chunks = registered
+        ids = [chunk_id for chunk_ids in chunks.values() for chunk_id in chunk_ids]
+        found = {chunk_id for chunk_id, _, _ in await loop.run_in_executor(None, self.backend.get, ids)}
+        if len(found) < len(ids):
+            self.logger.warning(f"{len(ids) - len(found)} chunks of {source} are missing from the vector store "
+                                f"of {self.chat_user_id}, storing it again")
+        chunks = {chunk_hash: [chunk_id for chunk_id in chunk_ids if chunk_id in found]
+                  for chunk_hash, chunk_ids in chunks.items()}
+        return content_hash, chunks, len(found) == len(ids)
+
+    async def _is_unchanged(self, source, content_hash):
+        """Tell whether the registered version of a document has the same content and all its chunks."""
+        registered = await self._registered(source)
+        return registered is not None and registered[0] == content_hash and registered[2]
+
+    def _deferred(self):
+        """Tell whether the registry has to wait for the checkpoints persisting the vector store."""
+        return self.backend.checkpointed and self.checkpointer is not None and self.checkpointer.enabled
+
+    async def _commit(self, writes):
+        """
+        Record a change of the vector store and apply the registry writes describing it.
+
+        The registry must not get ahead of the store on disk. With a checkpointer the writes are
+        deferred until the checkpoint that persists the change, otherwise they follow the persist.
+
+        :param writes: Registry methods taking the deferred flag, their results are returned.
+        """
+        loop = asyncio.get_running_loop()
+        deferred = self._deferred()
+        if not deferred:
+            await self._changed()
+        results = [await loop.run_in_executor(None, functools.partial(write, deferred=deferred))
+                   for write in writes]
+        if deferred:
+            # Staged before the store is marked changed, so the next checkpoint writes them
+            await self._changed()
+        return results
+
+    async def _store(self, entries, progress=log_progress):
+        """
+        Store new versions of documents and return the chunks of the documents that changed.
+
+        Chunks whose text is already stored for the document keep their ids, only the other
+        chunks are embedded, and the chunks missing from the new version are deleted.
+
+        :param entries: (source, content hash, chunks) of each document.
+        :param progress: The progress callback of the embedding pipeline.
+        """
+        loop = asyncio.get_running_loop()
+        new_chunks = []
+        stale_ids = []
+        # (source, content hash, kept (chunk id, chunk hash), new (index in new_chunks, chunk hash))
+        versions = []
+        changed = []
+        for source, content_hash, chunks in entries:
+            registered = await self._registered(source)
+            if registered is not None and registered[0] == content_hash and registered[2]:
+                continue
+            reusable = registered[1] if registered is not None else {}
+
+            kept, added = [], []
+            for chunk in chunks:
+                chunk_hash = text_hash(chunk.page_content)
+                ids = reusable.get(chunk_hash)
+                if ids:
+                    kept.append((ids.pop(), chunk_hash))
+                else:
+                    added.append((len(new_chunks), chunk_hash))
+                    new_chunks.append(chunk)
+            stale_ids.extend(chunk_id for ids in reusable.values() for chunk_id in ids)
+            versions.append((source, content_hash, kept, added))
+            changed.extend(chunks)
+
+        if not versions:
+            return []
+
+        ids = [str(uuid.uuid4()) for _ in new_chunks]
+        try:
+            await self.pipeline.add_documents(self.backend, new_chunks, progress=progress, ids=ids)
+        except Exception:
+            # The batches inserted before the failure are not registered, do not leave them behind
+            try:
+                await loop.run_in_executor(None, self.backend.delete, ids)
+            except Exception as e:
+                self.logger.error(f"Error removing the chunks of a failed ingestion: {e}")
+            raise
+        self._index_lexically(ids, new_chunks)
+        if stale_ids:
+            await self._delete_chunks(stale_ids)
+
+        writes = [functools.partial(self.registry.save, self.chat_user_id, source, content_hash,
+                                    kept + [(ids[i], chunk_hash) for i, chunk_hash in added])
+                  for source, content_hash, kept, added in versions]
+        for version, (source, _, kept, added) in zip(await self._commit(writes), versions):
+            self.logger.info(f"Stored version {version} of {source} for {self.chat_user_id}: "
+                             f"{len(kept)} chunks kept, {len(added)} added")
+        if stale_ids:
+            self.logger.info(f"Deleted {len(stale_ids)} outdated chunks for {self.chat_user_id}")
+
+        return changed
+
+    async def _delete_chunks(self, ids):
+        """Delete chunks from the vector backend and the BM25 index."""
+        await asyncio.get_running_loop().run_in_executor(None, self.backend.delete, ids)
+        if self.lexical is not None:
+            self.lexical.remove(ids)
+
+    async def documents(self):
+        """Return the registered documents of the collection, oldest first."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.registry.documents, self.chat_user_id)
+
+    async def delete_document(self, source):
+        """Delete a document from the vector store and return the number of its chunks, None when it is unknown."""
+        try:
+            loop = asyncio.get_running_loop()
+            registered = await loop.run_in_executor(None, self.registry.document, self.chat_user_id, source)
+            if registered is None:
+                return None
+            ids = [chunk_id for chunk_ids in registered[1].values() for chunk_id in chunk_ids]
+            if ids:
+                await self._delete_chunks(ids)
+            await self._commit([functools.partial(self.registry.remove, self.chat_user_id, source)])
+            # A page added again is fetched in full
+            await loop.run_in_executor(None, get_crawl_state().forget, self.chat_user_id, source)
+
+            return len(ids)
+        except Exception as e:
+            self.logger.error(f"Error deleting document: {e}")
+            return None
+
+    async def _changed(self):
+        """Record a change of the collection, persisting it now when there is no checkpointer."""
+        if not self.backend.checkpointed:
+            # Written through on every change
+            return
+        if self.checkpointer is not None:
+            self.checkpointer.mark_dirty()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.backend.persist)
+
+    def _index_lexically(self, ids, texts):
+        """Add new chunks to the BM25 index, unless it is still to be built from the collection."""
+        if self.lexical is not None:
+            self.lexical.add(ids, [text.page_content for text in texts])
+
+    def _build_lexical_index(self):
+        index = BM25Index()
+        index.add(*self.backend.documents())
+        return index
+
+    async def _lexical_index(self, count):
+        """
+        Return the BM25 index of the collection, building it off the event loop.
+
+        The index only sees the chunks this process added, so it is rebuilt whenever its size no
+        longer matches the count of the collection, which other workers may have written to.
+        """
+        if self.lexical is None or len(self.lexical) != count:
+            # Created here, the instance is built off the event loop
+            if self._lexical_lock is None:
+                self._lexical_lock = asyncio.Lock()
+            async with self._lexical_lock:
+                if self.lexical is None or len(self.lexical) != count:
+                    loop = asyncio.get_running_loop()
+                    self.lexical = await loop.run_in_executor(None, self._build_lexical_index)
+        return self.lexical
+
+    async def retrieve(self, query, k=RETRIEVAL_K):
+        """Return the k chunks most relevant to a query, merging BM25 and vector similarity scores."""
+        from langchain.schema import Document
+
+        loop = asyncio.get_running_loop()
+        # The collection, not the process-local BM25 index, tells how many chunks there are
+        count = await loop.run_in_executor(None, self.backend.count)
+        if not count:
+            return []
+        index = await self._lexical_index(count)
+
+        lexical, sufficient = search_lexically(index, query)
+        if sufficient and len(index) == count:
+            # A chunk has every keyword, the embedding call would not change the answer
+            ranked = lexical[:k]
+            self.logger.info(f"Answered keyword query of {self.chat_user_id} lexically")
+        else:
+            vector = (await self.pipeline.embed([query]))[0]
+            similar = await loop.run_in_executor(
+                None, self.backend.query, vector, min(HYBRID_FETCH_K, count))
+            ranked = fuse(lexical, similar, k=k)
+
+        ids = [chunk_id for chunk_id, _ in ranked]
+        found = await loop.run_in_executor(None, self.backend.get, ids)
+        chunks = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                  for chunk_id, text, metadata in found}
+        return [chunks[chunk_id] for chunk_id in ids if chunk_id in chunks]
+
     async def query(self, query):
-        """Query the vector store for similar vectors."""
+        """Answer a query from the most relevant chunks, with their sources."""
+        from langchain.chains.qa_with_sources import load_qa_with_sources_chain
         try:
-            # Query the vector store
-            chain = RetrievalQAWithSourcesChain.from_chain_type(
-                llm=self.llm, chain_type="stuff", retriever=self.vector_store.as_retriever())
+            docs = await self.retrieve(query)
 
-            # Get the results
-            results = await chain.arun(question=query, return_only_outputs=True)
+            # Answer from the retrieved chunks
+            chain = load_qa_with_sources_chain(self.llm, chain_type="stuff")
+            results = await chain.acall({"input_documents": docs, "question": query}, return_only_outputs=True)
 
-            return results
+            return results["output_text"]
         except Exception as e:
             self.logger.error(f"Error querying vector store: {e}")
             return None
@@ -104,24 +476,9 @@ class VectorDB():
     
     async def summarize(self, docs):
         """Get the summary of a document."""
-        
-        # Prompt template only for the stuff chain type
-        prompt_tempate = """Write a concise summary of the following text, use simple language and bullet points:
-                        {text}
-
-                        SUMMARY:"""
-        
-        prompt = PromptTemplate(template=prompt_tempate, 
-                                input_variables=["text"])
-
-        # Create the chain
-        chain = load_summarize_chain(self.llm,
-                                     chain_type="map_reduce",
-                                     map_prompt=prompt,
-                                     combine_prompt=prompt)
-        
         try:
-            summary = await chain.arun(input_documents=docs, return_only_outputs=True)
+            # Only chunks that were never summarized before go through the map step
+            summary = await self.summarizer.summarize(docs)
 
             return summary
         except Exception as e:
@@ -132,9 +489,144 @@ class VectorDB():
         """Clear the vector store."""
         try:
             # Delete the collection from the vector store
-            self.vector_store.delete_collection()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.backend.drop)
+            self.lexical = None
+            # The documents are gone, ingest them in full when they are added again
+            await self._commit([functools.partial(self.registry.forget, self.chat_user_id)])
+            await loop.run_in_executor(None, get_crawl_state().forget, self.chat_user_id)
 
             return True
         except Exception as e:
             self.logger.error(f"Error clearing vector store: {e}")
             return False
+
+
+class VectorDBPool():
+    """Process-wide LRU pool of VectorDB instances keyed by chat user id."""
+
+    def __init__(self, openai_api_key, maxsize=POOL_MAXSIZE, idle_ttl=POOL_IDLE_TTL):
+        self.logger = logging.getLogger(__name__)
+        self.openai_api_key = openai_api_key
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+
+        # One Chroma client, embeddings object and llm shared by every collection
+        self.client = chromadb.Client(CHROMA_SETTINGS) if VECTOR_BACKEND == "chroma" else None
+        self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
+        self.llm = rate_limited(OpenAI(openai_api_key=openai_api_key, temperature=0))
+        self.checkpointer = Checkpointer(self.client, registry=get_document_registry())
+
+        # chat_user_id -> [VectorDB, last used time], least recently used first
+        self._dbs = OrderedDict()
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, chat_user_id):
+        """Return the pooled VectorDB for a chat, creating it on a miss."""
+        if not isinstance(chat_user_id, str):
+            chat_user_id = str(chat_user_id)
+
+        self.checkpointer.start()
+
+        async with self._lock:
+            self._evict_idle()
+
+            entry = self._dbs.get(chat_user_id)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = time.monotonic()
+                self._dbs.move_to_end(chat_user_id)
+                return entry[0]
+
+            self.misses += 1
+
+            # Opening the collection touches the database, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            db = await loop.run_in_executor(None, lambda: VectorDB(chat_user_id=chat_user_id,
+                                                                   openai_api_key=self.openai_api_key,
+                                                                   client=self.client,
+                                                                   embeddings=self.embeddings,
+                                                                   llm=self.llm,
+                                                                   checkpointer=self.checkpointer))
+            self._dbs[chat_user_id] = [db, time.monotonic()]
+
+            # Drop the least recently used collections when the pool is full
+            while len(self._dbs) > self.maxsize:
+                evicted_id, _ = self._dbs.popitem(last=False)
+                self.evictions += 1
+                self.logger.debug(f"Evicted vector store for {evicted_id} from the pool")
+
+            return db
+
+    async def discard(self, chat_user_id):
+        """Remove a chat's VectorDB from the pool, e.g. after its collection is deleted."""
+        async with self._lock:
+            self._dbs.pop(str(chat_user_id), None)
+
+    async def close(self):
+        """Persist the pending changes, e.g. when the process shuts down."""
+        await self.checkpointer.close()
+
+    def _evict_idle(self):
+        """Drop collections that have not been used for longer than the idle ttl."""
+        now = time.monotonic()
+        while self._dbs:
+            chat_user_id, (db, last_used) = next(iter(self._dbs.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._dbs.popitem(last=False)
+            self.evictions += 1
+            self.logger.debug(f"Evicted idle vector store for {chat_user_id} from the pool")
+
+    def stats(self):
+        """Return the pool hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._dbs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "checkpoints": self.checkpointer.checkpoints,
+            "unpersisted_changes": self.checkpointer.dirty,
+        }
+
+
+_pool = None
+
+def get_vectordb_pool(openai_api_key):
+    """Return the process-wide VectorDB pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = VectorDBPool(openai_api_key=openai_api_key)
+    return _pool
+
+async def close_vectordb_pool():
+    """Persist and drop the process-wide pool, if it was created."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def serve(host="0.0.0.0", port=CHROMA_SERVER_PORT):
+    """Run a Chroma server on the persist directory, for bot processes using CHROMA_MODE=server."""
+    import uvicorn
+
+    # The server reads its own settings from the environment
+    os.environ.setdefault("CHROMA_DB_IMPL", "duckdb+parquet")
+    os.environ.setdefault("PERSIST_DIRECTORY", CHROMA_PERSIST_DIRECTORY)
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    uvicorn.run("chromadb.app:app", host=host, port=port)
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:2] == ["serve"]:
+        serve()
+    else:
+        print("Usage: python vectordb.py serve")